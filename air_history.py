@@ -0,0 +1,331 @@
+"""
+History of the thermometer readings on disk. Every file is a numpy ring buffer (np.lib.format.open_memmap) of
+fixed size, so appending is writing one record into the page cache and the disk use never grows:
+
+- raw.npy: every reading with the raw values of the sensor, kept for raw_days
+- minute.npy, hour.npy, day.npy: count, min, sum and max of the readings per minute, hour and day (utc),
+  updated with every reading, kept for minute_days, hour_days and day_days
+
+So old readings are downsampled instead of thrown away, and a summary of months needs a few hundred day records
+instead of a million readings.
+"""
+import json
+import os
+import threading
+import numpy as np
+
+from thermometer import compensate
+
+QUANTITIES = ('temperature', 'humidity', 'pressure')
+LEVELS = (('day', 86400), ('hour', 3600), ('minute', 60))  # coarsest first
+RAW_DTYPE = np.dtype([('time', 'f8'), ('raw', 'i4', 3), ('values', 'f4', 3)])  # raw: temperature, pressure, humidity
+ROLLUP_DTYPE = np.dtype([('time', 'f8'), ('count', 'i4'), ('min', 'f4', 3), ('sum', 'f8', 3), ('max', 'f4', 3)])
+
+
+class Ring:
+    """
+    Records ordered by time in a memory mapped ring buffer, the oldest ones are overwritten. Unused records have
+    time 0, so the state is found again after a restart without any extra file.
+    """
+    def __init__(self, path, dtype, capacity):
+        """
+        :param path: .npy file, created if needed
+        :param dtype: numpy dtype of the records, with a field 'time'
+        :param capacity: number of records
+        """
+        if os.path.exists(path):
+            self.data = np.lib.format.open_memmap(path, mode='r+')
+            if self.data.dtype != dtype or len(self.data) != capacity:  # config changed, keep what fits
+                old = self.chronological(self.data)[-capacity:]
+                self.data = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(capacity, ))
+                for name in dtype.names:  # only the fields both dtypes have, new ones stay 0
+                    if name in old.dtype.names and old.dtype[name].shape == dtype[name].shape:
+                        self.data[name][:len(old)] = old[name]
+        else:
+            self.data = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(capacity, ))
+        used = self.data['time'] > 0
+        self.count = int(np.count_nonzero(used))
+        self.head = int(np.argmax(self.data['time'])) + 1 if self.count else 0  # where the next record goes
+        self.head %= capacity
+
+    @staticmethod
+    def chronological(data):
+        """:return: the used records of a ring, oldest first (a copy)"""
+        data = data[data['time'] > 0]
+        return data[np.argsort(data['time'], kind='stable')]
+
+    def segments(self):
+        """:return: views of the used records, oldest first, two if the ring has wrapped around"""
+        if self.count < len(self.data):
+            return [self.data[:self.count]]
+        return [self.data[self.head:], self.data[:self.head]]
+
+    def append(self, record):
+        self.data[self.head] = record
+        self.head = (self.head + 1) % len(self.data)
+        self.count = min(self.count + 1, len(self.data))
+
+    def last(self):
+        """:return: view of the newest record, None if empty"""
+        if not self.count:
+            return None
+        return self.data[self.head - 1:self.head] if self.head else self.data[-1:]
+
+    def oldest(self):
+        """:return: time of the oldest record, None if empty"""
+        return float(self.segments()[0]['time'][0]) if self.count else None
+
+    def range(self, start, end):
+        """:return: the records with start <= time < end (binary search, a copy)"""
+        parts = []
+        for segment in self.segments():
+            times = segment['time']
+            parts.append(segment[np.searchsorted(times, start):np.searchsorted(times, end)])
+        return np.concatenate(parts)
+
+
+class AirHistory:
+    """
+    Readings of the thermometer on disk with minute, hour and day rollups, see the module. Thread safe, the
+    thermometer appends, the gui queries.
+    """
+    def __init__(self, path, interval=10, raw_days=7, minute_days=90, hour_days=730, day_days=3650):
+        """
+        :param path: directory of the files, created if needed
+        :param interval: seconds between two readings, to size the raw file
+        :param raw_days: days the raw readings are kept
+        :param minute_days: days the minute rollups are kept
+        :param hour_days: days the hour rollups are kept
+        :param day_days: days the day rollups are kept
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.lock = threading.Lock()
+        self.raw = Ring(os.path.join(self.path, 'raw.npy'), RAW_DTYPE, int(raw_days * 86400 / interval))
+        days = {'day': day_days, 'hour': hour_days, 'minute': minute_days}
+        self.rollups = {name: Ring(os.path.join(self.path, name + '.npy'), ROLLUP_DTYPE,
+                                   int(days[name] * 86400 / width)) for name, width in LEVELS}
+        self.widths = dict(LEVELS)
+        self.calibration = None
+        if os.path.exists(os.path.join(self.path, 'calibration.json')):
+            with open(os.path.join(self.path, 'calibration.json')) as f:
+                self.calibration = json.load(f)
+
+    def set_calibration(self, calibration):
+        """
+        Stores the calibration of the sensor with the raw values, to process them again later
+        :param calibration: dict, see Thermometer.calibration
+        :return:
+        """
+        if calibration != self.calibration:
+            with open(os.path.join(self.path, 'calibration.json'), 'w') as f:
+                json.dump(calibration, f)
+            self.calibration = calibration
+
+    def append(self, timestamp, raw, values):
+        """
+        Stores a reading and updates the rollups
+        :param timestamp: time.time() of the reading
+        :param raw: raw temperature, pressure and humidity of the sensor
+        :param values: temperature, humidity and pressure
+        :return:
+        """
+        values = np.asarray(values, dtype=np.float64)
+        with self.lock:
+            last = self.raw.last()
+            if last is not None and timestamp <= last['time'][0]:  # the clock went back, keep the order
+                return
+            self.raw.append((timestamp, raw, values))
+            for name, width in LEVELS:
+                ring = self.rollups[name]
+                start = timestamp // width * width
+                last = ring.last()
+                if last is not None and last['time'][0] == start:
+                    last['count'] += 1
+                    last['min'] = np.minimum(last['min'], values)
+                    last['sum'] += values
+                    last['max'] = np.maximum(last['max'], values)
+                else:
+                    ring.append((start, 1, values, values, values))
+
+    def flush(self):
+        """writes everything to disk"""
+        with self.lock:
+            for ring in [self.raw] + list(self.rollups.values()):
+                ring.data.flush()
+
+    def summary(self, start, end):
+        """
+        Min, mean and max of the readings between start and end. The range is covered by as many day records as
+        possible, the rest by hour and minute records and only the edges by readings. Readings which are gone
+        already are represented by their rollups, at the edges they are missing.
+        :param start: time.time()
+        :param end: time.time()
+        :return: dict quantity -> {'min', 'mean', 'max'}, count: number of readings
+        """
+        with self.lock:
+            parts = []
+            gaps = [(start, end)]
+            for name, width in LEVELS:
+                rest = []
+                for a, b in gaps:
+                    a_full, b_full = -(-a // width) * width, b // width * width
+                    if a_full < b_full:
+                        parts.append(self.rollups[name].range(a_full, b_full))
+                        rest += [(a, a_full), (b_full, b)]
+                    else:
+                        rest.append((a, b))
+                gaps = [(a, b) for a, b in rest if a < b]
+            readings = [self.raw.range(a, b)['values'] for a, b in gaps]
+        readings = np.concatenate(readings).astype(np.float64) if readings else np.zeros((0, 3))
+        rollups = np.concatenate(parts) if parts else np.zeros(0, ROLLUP_DTYPE)
+        count = int(rollups['count'].sum()) + len(readings)
+        if not count:
+            return {'count': 0}
+        minimum = np.min(np.concatenate((rollups['min'], readings)), axis=0)
+        maximum = np.max(np.concatenate((rollups['max'], readings)), axis=0)
+        mean = (rollups['sum'].sum(axis=0) + readings.sum(axis=0)) / count
+        result = {'count': count}
+        for i, quantity in enumerate(QUANTITIES):
+            result[quantity] = {'min': float(minimum[i]), 'mean': float(mean[i]), 'max': float(maximum[i])}
+        return result
+
+    def level_for(self, start):
+        """
+        :param start: time.time()
+        :return: the finest level ('raw', 'minute', 'hour' or 'day') still reaching back to start, if none does
+            the finest one reaching back to the oldest reading
+        """
+        with self.lock:
+            return self._level_for(start)
+
+    def _level_for(self, start):
+        rings = [('raw', self.raw, 0)] + [(name, self.rollups[name], width) for name, width in LEVELS[::-1]]
+        rings = [(name, ring.oldest(), width) for name, ring, width in rings if ring.count]
+        if not rings:
+            return 'raw'
+        for name, oldest, _ in rings:
+            if oldest <= start:
+                return name
+        # a rollup starts at the beginning of its bucket, its first reading may be up to one width later, so on a
+        # young history the day rollup seems to reach back the furthest although the readings reach back as far
+        oldest_reading = min(oldest + width for _, oldest, width in rings)
+        for name, oldest, _ in rings:
+            if oldest <= oldest_reading:
+                return name
+
+    def series(self, start, end, level=None):
+        """
+        The history between start and end for plotting, the rollups starting in between
+        :param start: time.time()
+        :param end: time.time()
+        :param level: 'raw', 'minute', 'hour' or 'day', None: see level_for
+        :return: time, min, mean, max, count (numpy arrays, min, mean and max (n, 3) in the order of QUANTITIES,
+            count the number of readings behind every point)
+        """
+        with self.lock:
+            if level is None:
+                level = self._level_for(start)
+            if level == 'raw':
+                records = self.raw.range(start, end)
+                values = records['values'].astype(np.float64)
+                return records['time'], values, values, values, np.ones(len(records), np.int64)
+            records = self.rollups[level].range(start, end)
+        count = records['count'].astype(np.int64)
+        mean = records['sum'] / np.maximum(count, 1)[:, None]
+        return records['time'], records['min'].astype(np.float64), mean, records['max'].astype(np.float64), count
+
+    def reprocess(self, start, end, calibration=None):
+        """
+        Computes the values of the raw readings between start and end again, all at once
+        :param start: time.time()
+        :param end: time.time()
+        :param calibration: dict, see Thermometer.calibration, None: the stored one
+        :return: time, values (numpy arrays, values (n, 3) in the order of QUANTITIES)
+        """
+        with self.lock:
+            records = self.raw.range(start, end)
+        raw = records['raw'].astype(np.int64)
+        values = compensate(raw[:, 0], raw[:, 1], raw[:, 2], calibration or self.calibration)
+        return records['time'], np.stack(values, axis=1)
+
+    def stats(self):
+        """:return: dict with the number of records and the bytes on disk"""
+        rings = {'raw': self.raw, **self.rollups}
+        return {'records': {name: ring.count for name, ring in rings.items()},
+                'bytes': sum(ring.data.nbytes for ring in rings.values())}
+
+
+class Decimator:
+    """
+    Min, mean and max of a series in a fixed number of buckets of equal length, for plotting many readings on
+    a few hundred pixels. The buckets are aligned to multiples of their length, so new readings are added to the
+    newest bucket or append new ones, and the oldest buckets drop out, without going over the old readings again.
+    """
+    def __init__(self, span, buckets):
+        """
+        :param span: seconds shown
+        :param buckets: number of buckets, about the width of the plot in pixels
+        """
+        self.span = span
+        self.buckets = buckets
+        self.width = span / buckets
+        self.index = np.zeros(0, np.int64)  # start of the bucket / width
+        self.count = np.zeros(0, np.int64)
+        self.minimum = np.zeros((0, 3))
+        self.sum = np.zeros((0, 3))
+        self.maximum = np.zeros((0, 3))
+        self.end = None  # time of the newest reading added
+
+    @property
+    def times(self):
+        """:return: centers of the buckets"""
+        return (self.index + 0.5) * self.width
+
+    @property
+    def mean(self):
+        return self.sum / self.count[:, None]
+
+    def add(self, times, minimum, mean, maximum, count=None):
+        """
+        Adds readings or rollups newer than the ones added before, see AirHistory.series
+        :param times: numpy array, increasing
+        :param minimum: numpy array (n, 3)
+        :param mean: numpy array (n, 3)
+        :param maximum: numpy array (n, 3)
+        :param count: numpy array (n, ), readings behind every mean, which is weighted with it, None: 1 each
+        :return: True if anything changed
+        """
+        if not len(times):
+            return False
+        if count is None:
+            count = np.ones(len(times), np.int64)
+        index = (times // self.width).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])  # index is sorted
+        new_index = index[starts]
+        new_count = np.add.reduceat(count, starts)
+        new_min = np.minimum.reduceat(minimum, starts)
+        new_sum = np.add.reduceat(mean * count[:, None], starts)
+        new_max = np.maximum.reduceat(maximum, starts)
+        if len(self.index) and new_index[0] == self.index[-1]:  # continues the newest bucket
+            self.count[-1] += new_count[0]
+            self.minimum[-1] = np.minimum(self.minimum[-1], new_min[0])
+            self.sum[-1] += new_sum[0]
+            self.maximum[-1] = np.maximum(self.maximum[-1], new_max[0])
+            new_index, new_count, new_min, new_sum, new_max = (a[1:] for a in (new_index, new_count, new_min,
+                                                                                new_sum, new_max))
+        self.index = np.concatenate((self.index, new_index))
+        self.count = np.concatenate((self.count, new_count))
+        self.minimum = np.concatenate((self.minimum, new_min))
+        self.sum = np.concatenate((self.sum, new_sum))
+        self.maximum = np.concatenate((self.maximum, new_max))
+        self.end = times[-1]
+        self.trim(self.end)
+        return True
+
+    def trim(self, now):
+        """drops the buckets older than span before now"""
+        keep = self.index >= (now - self.span) // self.width
+        if not keep.all():
+            self.index, self.count, self.minimum, self.sum, self.maximum = (
+                a[keep] for a in (self.index, self.count, self.minimum, self.sum, self.maximum))
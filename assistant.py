@@ -1,25 +1,33 @@
 import time, os
-import numpy as np
-import scipy.signal as sg
+import contextlib
+import datetime
 from PyQt5.QtCore import *
 
-import deepspeech as ds
 import pvporcupine  
-import struct
-import pyaudio
 
-from hue_helper import HueHelper
+import hardware
+
+from hue_helper import HueHelper, client as hue_client, commands as hue_commands, effects as hue_effects
+import hue_queue
 from led_helper import LedHelper
 from cal_helper import CalHelper
 from joplin_helper import JoplinHelper
 from thermometer import Thermometer
+from air_history import AirHistory
+from voice import VoicePipeline
+from intents import create_intent_index
+from stt import load_profiles
+from stt_worker import SttWorker
+from notes import NoteSpool
+from joplin_sync import SyncCoordinator
+from startup import StartupGraph
 import config as cfg
 
 import threading
 import schedule
 
 
-class Assistant(QThread):
+class Assistant(QThread, VoicePipeline):
     """
     Main class, managing all the work, i.e., recognizing the voice commands and executing them.
     """
@@ -29,68 +37,104 @@ class Assistant(QThread):
     activity_signal = pyqtSignal(str)
     current_tab_signal = pyqtSignal(int)
     air_signal = pyqtSignal(str)
+    startup_signal = pyqtSignal(str)
     
     def __init__(self, parent=None):
         QThread.__init__(self, parent)
         self.exiting = False
+        self.hue = None
+        self.stt_worker = None
+        self.sync = SyncCoordinator(**cfg.joplin['sync'])
+        # the thermometer writes into it, the gui plots it
+        self.air_history = AirHistory(interval=cfg.thermometer['sensor']['interval'], **cfg.thermometer['history'])
+        self.intents = None
+        self.intents_source = None
+
+    @property
+    def hue_connected(self):
+        """True once the hue bridge is connected, it connects in the background"""
+        return self.hue is not None and self.hue.ready
     
     def _startup(self):
         """
-        This should normally be the init but because of the gui, we have to start it manually
+        This should normally be the init but because of the gui, we have to start it manually.
+        The startup is a graph of steps and the independent ones run at the same time. It returns as soon as
+        the hotword detection is live, speech to text, hue, calendar and joplin keep on starting in the background.
+        :return: True if the hotword detection is ready
         """
         self.startup_string = "Hello {}, just need a second to get ready for you!".format(cfg.assistant["name"])
         self.output.emit(self.startup_string)
-        self.listen_lock = threading.Lock()
         
         self.led = LedHelper()
-        with self.led.led_lock:
-            stop_threads = False
-            t_wheel_led = threading.Thread(target=self.led.run_color_wheel, args=(lambda: stop_threads,
-                                                                                  self.led.listening_led_values))
-            t_wheel_led.start()
-            
-            try:
-                self.hue = HueHelper()
-                self.hue_connected = True
-                self.startup_string += "\n Connected to your hue bridge"
-            except OSError:
-                self.startup_string += "\n Couldn't connect to your hue bridge"
-                self.hue_connected = False
-                
-            self.output.emit(self.startup_string)
-            
-            if self.hue_connected:  # So that lights will blink when a new event starts
-                self.cal = CalHelper()
-                self.cal.generate_scheduler_tasks(self.hue.set_alert)
+        self.notes = NoteSpool(cfg.assistant['note_spool'], self._transcribe_note, self._write_note)
+        self.led.start_color_wheel(self.led.listening_led_values)
+        self.hue = HueHelper(priority=hue_queue.VOICE)  # connects in the background, commands are queued until then
+        # the timeline is shown until everything is up, failures stay visible
+        self.startup = StartupGraph(
+            on_change=lambda graph: self.startup_signal.emit('' if graph.done() else graph.timeline()))
+        self.startup.add('hue', self._start_hue)
+        self.startup.add('calendar', self._start_calendar)
+        self.startup.add('porcupine', self._start_porcupine)
+        self.startup.add('audio', self._start_audio, depends=['porcupine'])
+        self.startup.add('stt', self._start_stt)
+        self.startup.add('joplin', self._start_joplin)
+        self.startup.add('notes', self.notes.start, depends=['stt'])  # finishes notes of the last run
+        self.startup.add('thermometer', self._start_thermometer)
+        self.startup.start()
+        audio_ready = self.startup.wait('audio')
+        self.led.clear('wheel')
 
-            self.porcupine = pvporcupine.create(keywords=['blueberry'], sensitivities=[0.8])
-            time.sleep(1)
-            self.pa = pyaudio.PyAudio()  # not sure if this should be here
-            device_index = self._find_device_index(name=cfg.assistant['soundcard_name'])
-            self.audio_stream = self.pa.open(rate=self.porcupine.sample_rate, channels=4,
-                                            format=pyaudio.paInt16, input=True,
-                                            frames_per_buffer=self.porcupine.frame_length,
-                                            input_device_index=device_index)
-            self.silence_level = self.measure_silence_level()
-            
-            self.startup_string += '\n now starting deepspeech'
-            self.output.emit(self.startup_string)
-            self.ds_model = ds.Model(cfg.assistant['deepspeech_model'])
-            self.ds_model.enableExternalScorer(cfg.assistant['deepspeech_scorer']+'')
-            self.startup_string += '\n finished initiating deepspeech, \n now syncing your notes'
-            self.output.emit(self.startup_string)
-            os.system('joplin sync')
-        
-            stop_threads = True
-            t_wheel_led.join()
-        
-        self.thermo = Thermometer()
-        self.update_thermo()
-                    
-        schedule.every(60).seconds.do(self.update_values)
         schedule.every().day.at("20:30").do(self.led.set_night_lights)  # ToDO
+        if cfg.assistant['print_stats']:  # on its own, the thermometer may never start
+            schedule.every(60).seconds.do(self.print_stats)
         self.update_thread = threading.Thread(target=self.scheduler, daemon=True)
         self.update_thread.start()
+        if audio_ready:
+            self.output.emit(self.startup_string + '\n I am listening')
+        else:
+            self.output.emit('I am sorry, I cannot hear you. Your microphone could not be started.')
+        return audio_ready
+
+    def _start_hue(self):
+        HueHelper.bridge.get(timeout=30)  # keeps on trying in the background if it fails
+
+    def _start_joplin(self):
+        JoplinHelper.server.warm_up()
+        self.sync.request(urgent=True)
+
+    def _start_calendar(self):
+        self.cal = CalHelper()
+        self.cal.generate_scheduler_tasks(self.hue.set_alert)  # So that lights will blink when a new event starts
+
+    def _start_porcupine(self):
+        self.porcupine = pvporcupine.create(keywords=['blueberry'], sensitivities=[0.8])
+
+    def _start_audio(self):
+        time.sleep(1)
+        self.pa = hardware.create_audio()  # the seeed card or, simulated, wav files
+        device_index = self._find_device_index(name=cfg.assistant['soundcard_name'])
+        self.audio_stream = self.pa.open(rate=self.porcupine.sample_rate, channels=4,
+                                        format=hardware.INT16, input=True,
+                                        frames_per_buffer=self.porcupine.frame_length,
+                                        input_device_index=device_index)
+        self.setup_audio(self.audio_stream, self.porcupine)
+
+    def _start_stt(self):
+        hot_words = list(create_intent_index().index)  # the words of the commands and activities
+        if cfg.assistant['stt_worker']:
+            self.stt_worker = SttWorker(cfg.assistant['stt_profiles'], hot_words=hot_words)
+            self.stt_worker.start()
+            self.stt_worker.wait_ready()
+            self.stt_backends = self.stt_worker.backends()
+        else:
+            self.stt_backends = load_profiles(cfg.assistant['stt_profiles'], hot_words=hot_words)
+
+    def _start_thermometer(self):
+        self.thermo = Thermometer(good_temp=cfg.thermometer['feel_well_temperature'], history=self.air_history,
+                                  **cfg.thermometer['sensor'])
+        self.thermo.start()
+        self.update_thermo()
+        schedule.every(60).seconds.do(self.update_values)
     
     def __del__(self):
         self.exiting = True
@@ -105,37 +149,59 @@ class Assistant(QThread):
         # Note: This is never called directly. It is called by Qt once the
         # thread environment has been set up.
 
-        self._startup()
+        if not self._startup():
+            return
         # Main loop always running and listening for your hotwords (Blueberry)
         while True:
             self.led.set_standby_leds()
             if self.listen_for_hotword():
                 word = self.listen_for_command()
-                words = set(word.split())
-                #checking if a command exists and executing it
-                for func_name, hotwords in cfg.commands.items():
-                    if any(command.issubset(words) for command in hotwords):
-                        func = getattr(self, func_name, None)
-                        if callable(func):
-                            func()
-                        else:
-                            self.output.emit("I recognized your command and want to help you but your function is not in my memory. Please teach me!")
-                        break
-                #start an activity as specified in the config
-                activity = words.intersection(set(cfg.assistant["activities"]))
-                if len(activity) == 1:
-                    self.start_activity(activity.pop())
-                #setting hue scenes simply according to the name
-                if self.hue_connected:
-                    scene = words.intersection(set(self.hue.scenes_df['name']))
-                    if len(scene) == 1:
-                        self.hue.set_scene_by_name(scene.pop())
-                        self.output.emit('I understood: ' + word + '\n\n' + 'I changed the scene of your lights for you!')
-                #clearing the LEDs
-                with self.led.led_lock:
-                    self.led.leds.clear_strip()
-                    self.thermo.show_temperature(self.led.leds)
+                with self.timer.stage('dispatch'):
+                    try:
+                        self.dispatch(word)
+                    except ConnectionError as e:  # e.g. the hue bridge doesn't answer
+                        print(e)
+                        self.output.emit('I am sorry, I could not reach your devices. Please try again later.')
+                #clearing the LEDs, standby and thermometer are left
+                self.led.clear('listening')
+
+    def dispatch(self, word):
+        """
+        decides what to do with the transcribed words and does it
+        :param word: the transcribed string
+        :return:
+        """
+        intent = self.intent_index().match(word.split())
+        #checking if a command exists and executing it
+        func_name = intent['command']
+        if func_name is not None:
+            func = getattr(self, func_name, None)
+            if callable(func):
+                func()
+            else:
+                self.output.emit("I recognized your command and want to help you but your function is not in my memory. Please teach me!")
+        #start an activity as specified in the config
+        if intent['activity'] is not None:
+            self.start_activity(intent['activity'])
+        #setting hue scenes simply according to the name
+        if intent['scene'] is not None and self.hue_connected:
+            self.hue.set_scene_by_name(intent['scene'])
+            self.output.emit('I understood: ' + word + '\n\n' + 'I changed the scene of your lights for you!')
         
+    def intent_index(self):
+        """
+        The index of commands, activities and scenes, only rebuilt when the scenes of the bridge change
+        (i.e., once it is connected or a scene has been added, removed or renamed)
+        :return: IntentIndex
+        """
+        state = HueHelper.bridge.value if self.hue_connected else None
+        source = (state, state.version) if state is not None else None
+        if self.intents is None or source != self.intents_source:
+            scenes = self.hue.scene_names() if state is not None else ()
+            self.intents = create_intent_index(scenes)
+            self.intents_source = source
+        return self.intents
+
     def listen_for_command(self):
         """
         wakes up blueberry, listens, displays what was understood and returns the wordstring
@@ -149,23 +215,34 @@ class Assistant(QThread):
     
     def take_note(self, todo=False, rgb=(0, 192, 16)):
         """
-        Speech is transcribed, stored in Joplin (the note taking app) and syncronized
+        Records a note and puts it into the note spool. Transcribing, storing it in Joplin (the note taking app)
+        and syncronizing happens in the background, blueberry listens for the hotword again right away
+        :param todo: store it as a todo
         :param rgb: Colors of the LEDs
         :return:
         """
         self.output.emit('I am eager to listen for your note!')
-        word = self.listen_and_think(rgb, chunk_length=5)
-        self.output.emit('I understood: {} \n \n now synchronizig...'.format(word))
-        with self.led.led_lock:
-            print('recorded note: ' + word)
-            stop_threads = False
-            t_wheel_led = threading.Thread(target=self.led.run_color_wheel, args=(lambda: stop_threads, ))
-            t_wheel_led.start()
-            note_title = ' '.join(word.split()[:5])
-            JoplinHelper.write_note(word, note_title, cfg.assistant["joplin_folder"], is_todo=todo)
-            os.system('joplin sync')
-            stop_threads = True
-            t_wheel_led.join()
+        self.show_listening(rgb)
+        with self.timer.stage('listen'):
+            audio = self.listen_for_speech(profile='dictation')
+        if audio is None:  # the capture stopped
+            return
+        self.notes.add(audio, self.porcupine.sample_rate, is_todo=todo)
+        self.output.emit('Got it, I am writing down your note in the background.')
+
+    def _transcribe_note(self, audio):
+        """transcribes a spooled note, called by the note spool in the background"""
+        if not self.startup.wait('stt'):
+            raise RuntimeError('speech to text is not available')
+        return self.stt_backend('dictation').stt(audio)
+
+    def _write_note(self, word, is_todo):
+        """stores a transcribed note in joplin and synchronizes, called by the note spool in the background"""
+        print('recorded note: ' + word)
+        note_title = ' '.join(word.split()[:5])
+        JoplinHelper.write_note(word, note_title, cfg.assistant["joplin_folder"], is_todo=is_todo)
+        self.output.emit('I wrote your note: {}'.format(word))
+        self.sync.request()  # several notes in a row are synced once
         
     def write_todo(self, rgb=(0, 192, 16)):
         """creates a task in Joplin, convenience function"""
@@ -173,30 +250,35 @@ class Assistant(QThread):
         
     def show_notes(self):
         """switches to the note tab to dispay the notes for your current activities"""
-        self.current_tab_signal.emit(2)
+        self.current_tab_signal.emit(3)
     
     def shut_down(self):
         """ shuts down the rasperry pi"""
         os.system('xset dpms force off')
         self.led.set_shutdown_leds()
+        self.capture.stop()
+        if self.stt_worker is not None:
+            self.stt_worker.stop()
         self.audio_stream.close()
         time.sleep(0.2)
         self.pa.terminate()
         time.sleep(0.2)
+        if self.startup.ready('thermometer'):
+            self.thermo.stop()
+            self.air_history.flush()
         try:
-            os.system('joplin sync')
-        except:  # Todo
-            pass
+            self.sync.request(urgent=True)
+            self.sync.flush(timeout=120)
         finally:
-            self.led.leds.clear_strip()
-            self.power.off()
+            self.led.stop()
+            self.led.power.off()
             os.system('sudo shutdown')
             
     def start_work_out(self):
         """Starts tracking the workout time and also sets the hue lamps to a cold white"""
         self.activity_signal.emit('sport')
         self.start_activity_signal.emit(True)
-        self.current_tab_signal.emit(3)
+        self.current_tab_signal.emit(4)
         if self.hue_connected:
             self.hue.set_scene_by_name('energize') # Pre defined hue scene
             
@@ -207,12 +289,12 @@ class Assistant(QThread):
         """
         self.activity_signal.emit(activity)
         self.start_activity_signal.emit(True)
-        self.current_tab_signal.emit(3)
+        self.current_tab_signal.emit(4)
         
     def stop_activity(self):
         """stops the tracking of the current activity"""
         self.stop_activity_signal.emit(True)
-        self.current_tab_signal.emit(3)
+        self.current_tab_signal.emit(4)
         
     def increase_brightness(self):
         """increases the brightness of your hue lights"""
@@ -250,38 +332,33 @@ class Assistant(QThread):
 
     def update_thermo(self):
         """
-        Changes the LEDs according to the current temperature
+        Changes the LEDs according to the latest temperature, the thermometer samples it in the background
         :return:
         """
-        with self.led.led_lock:
-            self.thermo.show_temperature(self.led.leds, value=self.led.thermo_led_value)
         temp, hum, press = self.thermo.get_temperature()
+        self.led.show_temperature(temp, self.thermo.good_temp)
         self.air_signal.emit('Temperature: {:.2f} °C\nHumidity: {:.2f} %\nPressure: {} hPa'.format(temp, hum, int(press)))
             
-    def measure_silence_level(self, length=2):
-        """
-        Measures the background noise, which acts as the baseline for when to stop listening after speech
-        has been finished
-        :param length: duration for the measurement
-        :return:
-        """
-        with self.listen_lock:
-            last_second = np.frombuffer(self.audio_stream.read(self.porcupine.sample_rate*length,
-                                                           exception_on_overflow=False), dtype=np.int16)
-        #pcm2 = struct.unpack_from("h" * len(audio), audio)
-        silence_level = np.median(np.abs(last_second))  # don't need to reshape array because of median
-        if silence_level < 60:  # There seems to be some fluctuations, better be safe
-            silence_level = 60
-        print(silence_level)
-        return silence_level
-    
     def update_values(self):
         """
-        Updates silence level and temperature
+        Updates the temperature
         :return:
         """
-        self.silence_level = self.measure_silence_level()
+        if self.startup.ready('thermometer'):
+            self.air_history.flush()
         self.update_thermo()
+
+    def print_stats(self):
+        """prints the silence level and the counters of the audio capture, leds, hue and the sensor, for measuring"""
+        if self.startup.ready('audio'):  # the noise floor needs the capture
+            print('silence level: {}'.format(self.silence_level))
+            print('audio: {}'.format(self.capture.stats()))
+        print('leds: {}'.format(self.led.stats()))
+        if self.startup.ready('thermometer'):
+            print('thermometer: {}'.format(self.thermo.stats()))
+        print('hue: {}'.format(hue_client.stats()))
+        print('hue commands: {}'.format(hue_commands.stats()))
+        print('hue effects: {}'.format(hue_effects.stats()))
             
     def scheduler(self):
         """
@@ -289,72 +366,48 @@ class Assistant(QThread):
         :return:
         """
         while True:
-            schedule.run_pending()
+            for job in sorted(job for job in schedule.jobs if job.should_run):
+                try:
+                    if job.run() is schedule.CancelJob:
+                        schedule.cancel_job(job)
+                except Exception as e:  # one failing job must not stop the others, e.g. the night lights
+                    print('Scheduled job {} failed: {}'.format(job, e))
+                    # not again in the next second but at its next regular time
+                    job.last_run = datetime.datetime.now()
+                    period = datetime.timedelta(**{job.unit: job.interval})
+                    while job.next_run <= job.last_run:
+                        job.next_run += period
             time.sleep(1)
 
-    def listen_for_hotword(self):
-        """
-        Listens in the background for the hotword from porcupine, if it has been recognized, recording (listen for
-        speech) will be started (in the run function) and analyzed with deepspeech
-        :return: True, if hotword has been heard, else False
-        """
-        with self.listen_lock:
-            pcm = self.audio_stream.read(self.porcupine.frame_length, exception_on_overflow=False)
-        pcm = struct.unpack_from("h" * self.porcupine.frame_length*4, pcm)[0::4]
-        result = self.porcupine.process(pcm)
-        return result
-
-    def listen_for_speech(self, chunk_length=1):
-        """
-        Records the spoken word as long as input volume is greater than silence levels
-        :param chunk_length: minimum recording duration (one block) in sec to compare with silence level
-        :return: the audio data as numpy array
-        """
-        audio=np.array([[],[],[],[]], dtype=np.int16) # empty array with shape (4,0)
-        time.sleep(0.2)  # usual reaction time to not end listening to early
-        last_seconds = np.frombuffer(self.audio_stream.read(self.porcupine.sample_rate*chunk_length,
-                                                           exception_on_overflow=False),
-                                     dtype=np.int16).reshape(4,-1, order='F')
-        audio = np.append(audio, last_seconds, axis=1)
-        #pcm2 = struct.unpack_from("h" * len(audio), audio)
-        while np.median(np.abs(last_seconds))>self.silence_level+20:
-            last_seconds = np.frombuffer(self.audio_stream.read(self.porcupine.sample_rate*chunk_length,
-                                                               exception_on_overflow=False),
-                                        dtype=np.int16).reshape(4,-1, order='F')
-            audio = np.append(audio, last_seconds, axis=1)
-        print('finished_listening')
-        
-        # simple beamforming, does not matter much due to short distance though
-        for i in np.arange(1,4):
-            c = sg.correlate((audio[0]-np.mean(audio[0]))/np.std(audio[0]), (audio[i,:]-np.mean(audio[i,:]))/np.std(audio[i,:]))
-            lag = np.arange(-audio.shape[1]+1, audio.shape[1])[np.argmax(c)]
-            if lag > 0:
-                audio[i,:] = np.append([0]*lag, audio[i,:-lag])
-            elif lag < 0:
-                audio[i,:] = np.append(audio[i,-lag:],[0]*(-1*lag))
-        audio = np.mean(audio.astype(np.float64),axis=0)
-        
-        return audio.astype(np.int16)
-    
-    def listen_and_think(self, rgb=None, chunk_length=1):
+    def listen_and_think(self, rgb=None, profile='command'):
         """
-        calls the listen function first and then transribes the data with mozilla deepspech engine.
+        calls the listen function first and then transribes the data with the speech to text backend.
         Also leds the leds blink
         :param rgb: Tuple (RGB) of the color for the LEDs to blink with
-        :param chunk_length: minimum recording duration (one block) in sec to compare with silence level
+        :param profile: vad profile, 'command' or 'dictation'
         :return: the transcribed text as a string
         """
-        with self.led.led_lock:
-            if rgb:
-                self.led.set_listening_leds(rgb)
-            else:
-                self.led.set_listening_leds()
-            with self.listen_lock:
-                audio = self.listen_for_speech(chunk_length=chunk_length)
-            stop_threads = False
-            t_think_led = threading.Thread(target=self.led.set_thinking_leds, args=(lambda: stop_threads, ))
-            t_think_led.start()
-            word = self.ds_model.stt(audio)
-            stop_threads = True
-            t_think_led.join()
-            return word
+        if not self.startup.ready('stt'):
+            self.output.emit('Just a moment, I am still loading the speech recognition')
+            if not self.startup.wait('stt'):
+                return ''
+        try:
+            return VoicePipeline.listen_and_think(self, rgb, profile)
+        except RuntimeError as e:  # the stt worker crashed, it is restarted in the background
+            print(e)
+            self.output.emit('I am sorry, my speech recognition crashed. Please try again in a moment.')
+            return ''
+
+    def show_listening(self, rgb=None):
+        if rgb:
+            self.led.set_listening_leds(rgb)
+        else:
+            self.led.set_listening_leds()
+
+    @contextlib.contextmanager
+    def thinking(self):
+        self.led.start_thinking_leds()
+        try:
+            yield
+        finally:
+            self.led.stop_thinking_leds()
@@ -0,0 +1,176 @@
+import threading
+import time
+import wave
+import numpy as np
+
+PA_INPUT_OVERFLOWED = -9981  # pyaudio.paInputOverflowed
+
+
+class AudioCapture:
+    """
+    Reads the soundcard in one background thread and writes the interleaved int16 frames into a ring buffer,
+    which is allocated only once. Every consumer (hotword, speech recording, noise level) gets its own
+    AudioReader and takes numpy views out of the buffer at its own pace, so no one is stealing frames from
+    the others anymore.
+    """
+    def __init__(self, stream, frame_length, channels=4, sample_rate=16000, seconds=30, max_read=None):
+        """
+        :param stream: opened (pyaudio) input stream, only read by the capture thread from now on
+        :param frame_length: number of samples per channel read from the stream at once
+        :param channels: number of interleaved channels in the stream
+        :param sample_rate: sample rate of the stream in Hz
+        :param seconds: length of the ring buffer in seconds, older audio is overwritten
+        :param max_read: largest block (samples per channel) a reader may ask for at once, default: 5 seconds
+        """
+        self.stream = stream
+        self.frame_length = frame_length
+        self.channels = channels
+        self.sample_rate = sample_rate
+        if max_read is None:
+            max_read = 5 * sample_rate
+        self.max_read = max_read
+        # whole frames only, so that a single write never wraps around the end of the buffer
+        frames = max(int(np.ceil(seconds * sample_rate / frame_length)), int(np.ceil(max_read / frame_length)) + 1)
+        self.capacity = frames * frame_length
+        # The first max_read samples are mirrored behind the end of the buffer, so every read of up to
+        # max_read samples is one contiguous block and can be returned as a view without copying.
+        self.buffer = np.zeros((self.capacity + max_read, channels), dtype=np.int16)
+        self.written = 0  # total number of samples per channel written since start
+        self.overflows = 0  # number of times the soundcard dropped frames because we were too slow
+        self.errors = 0  # number of failed reads other than overflows
+        self.lost = 0  # samples overwritten before a reader got to them, all readers together
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        """starts the capture thread"""
+        self.running = True
+        self.thread = threading.Thread(target=self._capture, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """stops the capture thread and wakes up all waiting readers"""
+        self.running = False
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _capture(self):
+        backoff = 0.1
+        while self.running:
+            try:
+                data = self.stream.read(self.frame_length, exception_on_overflow=True)
+            except Exception as e:
+                if isinstance(e, IOError) and e.args and e.args[-1] == PA_INPUT_OVERFLOWED:
+                    self.overflows += 1
+                    continue
+                if not self.running:
+                    break
+                # don't let the thread die, the readers would wait for new frames forever
+                self.errors += 1
+                print('audio capture failed: {}, trying again in {} s'.format(e, backoff))
+                time.sleep(backoff)
+                backoff = min(2 * backoff, 5)
+                continue
+            backoff = 0.1
+            self.write(np.frombuffer(data, dtype=np.int16).reshape(-1, self.channels))
+
+    def write(self, block):
+        """
+        Copies one block (frame_length, channels) into the ring buffer
+        :param block: int16 array of shape (frame_length, channels)
+        :return:
+        """
+        n = block.shape[0]
+        pos = self.written % self.capacity
+        self.buffer[pos:pos + n] = block
+        if pos < self.max_read:
+            end = min(pos + n, self.max_read)
+            self.buffer[self.capacity + pos:self.capacity + end] = block[:end - pos]
+        with self.condition:
+            self.written += n
+            self.condition.notify_all()
+
+    def reader(self, position=None):
+        """
+        Creates a new reader
+        :param position: absolute sample position to start reading from, default: the current write position
+        :return: AudioReader
+        """
+        if position is None:
+            position = self.written
+        return AudioReader(self, position)
+
+    def stats(self):
+        """:return: dict with the overflows of the soundcard, the failed reads and the samples lost by slow readers"""
+        return {'overflows': self.overflows, 'errors': self.errors, 'lost': self.lost}
+
+    def latest(self, n):
+        """
+        View of the most recent n samples, without waiting
+        :param n: number of samples per channel (<= max_read)
+        :return: int16 array view of shape (n, channels)
+        """
+        with self.condition:
+            start = max(self.written - n, 0)
+        return self.reader(start).read(min(n, self.written))
+
+
+class AudioReader:
+    """
+    Cursor into the ring buffer of an AudioCapture. Returned blocks are views, they stay valid only until
+    the capture thread has gone once around the buffer, copy them if you want to keep them longer.
+    """
+    def __init__(self, capture, position):
+        self.capture = capture
+        self.position = position
+        self.lost = 0  # samples overwritten before this reader got to them
+
+    def available(self):
+        """number of samples per channel ready to be read without waiting"""
+        return self.capture.written - self.position
+
+    def read(self, n, timeout=None):
+        """
+        Returns the next n samples of all channels, waits until they are captured
+        :param n: number of samples per channel (<= max_read of the capture)
+        :param timeout: maximum waiting time in seconds, None waits forever
+        :return: int16 array view of shape (n, channels), None on timeout or if the capture was stopped
+        """
+        capture = self.capture
+        if n > capture.max_read:
+            raise ValueError('cannot read {} samples at once, max_read is {}'.format(n, capture.max_read))
+        with capture.condition:
+            if not capture.condition.wait_for(lambda: capture.written - self.position >= n or not capture.running,
+                                              timeout):
+                return None
+            if capture.written - self.position < n:  # stopped
+                return None
+            oldest = capture.written - capture.capacity
+            if self.position < oldest:  # we were too slow, skip what has already been overwritten
+                self.lost += oldest - self.position
+                capture.lost += oldest - self.position
+                self.position = oldest
+        start = self.position % capture.capacity
+        self.position += n
+        return capture.buffer[start:start + n]
+
+    def skip_to_latest(self):
+        """drops everything not read yet"""
+        self.position = self.capture.written
+
+
+def read_wav(path):
+    """
+    Reads a 16 bit wav file, e.g. a recording of the mic array
+    :param path: of the file
+    :return: int16 array of shape (n, channels), sample rate
+    """
+    with wave.open(path, 'rb') as f:
+        if f.getsampwidth() != 2:
+            raise ValueError('{} is not 16 bit'.format(path))
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        return data.reshape(-1, f.getnchannels()), f.getframerate()
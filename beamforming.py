@@ -0,0 +1,157 @@
+import numpy as np
+
+SOUND_SPEED = 343.2  # m/s
+# Positions of the mics of the seeed 4 mic array in m (square, 8.1 cm diagonal), in the order of the channels
+MIC_POSITIONS_4 = 0.08127 / 2 * np.array([[-1, 0], [0, -1], [1, 0], [0, 1]])
+
+
+class Beamformer:
+    """
+    Delay and sum beamforming for the mic array. The delays of the channels relative to the first one are found
+    with GCC-PHAT in the frequency domain, but only within the lags the geometry of the array allows, i.e.,
+    a few samples. Lags are cached per direction of arrival, so a weak estimate (you mumbled) falls back to
+    what was found for your usual place in the room.
+    """
+    def __init__(self, sample_rate=16000, mic_positions=MIC_POSITIONS_4, analysis_seconds=1.0, doa_bins=12,
+                 min_confidence=0.15):
+        """
+        :param sample_rate: of the audio in Hz
+        :param mic_positions: array (channels, 2) with the mic positions in m
+        :param analysis_seconds: the lags are estimated on the loudest part of the audio with this length
+        :param doa_bins: number of sectors the directions of arrival are sorted into
+        :param min_confidence: minimum height of the GCC-PHAT peak to trust a new estimate
+        """
+        self.sample_rate = sample_rate
+        self.mic_positions = np.asarray(mic_positions, dtype=np.float64)
+        distances = np.linalg.norm(self.mic_positions[:, None] - self.mic_positions[None], axis=-1)
+        self.max_lag = int(np.ceil(distances.max() / SOUND_SPEED * sample_rate))
+        self.analysis_length = int(analysis_seconds * sample_rate)
+        self.doa_bins = doa_bins
+        self.min_confidence = min_confidence
+        self.lag_cache = {}  # doa bin -> lags
+        self.last_doa = None
+
+    def estimate_lags(self, audio):
+        """
+        Finds the delay of every channel relative to the first one
+        :param audio: int16 array of shape (channels, n)
+        :return: integer array of the lags in samples (first one is 0), positive means the channel leads
+        """
+        segment = self._loudest_segment(audio)
+        n_fft = 1 << int(np.ceil(np.log2(segment.shape[1] + self.max_lag)))
+        spectra = np.fft.rfft(segment.astype(np.float32), n=n_fft, axis=1)
+        cross = spectra[0] * np.conj(spectra[1:])
+        cross /= np.abs(cross) + 1e-12  # phase transform, only the phase carries the delay
+        cc = np.fft.irfft(cross, n=n_fft, axis=1)
+        # only lags within +-max_lag are physically possible
+        window = np.concatenate((cc[:, -self.max_lag:], cc[:, :self.max_lag + 1]), axis=1)
+        peaks = np.argmax(window, axis=1)
+        lags = np.concatenate(([0], peaks - self.max_lag))
+        confidence = window[np.arange(len(peaks)), peaks].min()
+
+        if confidence < self.min_confidence:
+            if self.last_doa is not None:
+                return self.lag_cache[self.last_doa]
+            return lags
+        doa = self.direction_of_arrival(lags)
+        self.lag_cache[doa] = lags
+        self.last_doa = doa
+        return lags
+
+    def direction_of_arrival(self, lags):
+        """
+        Sector of the direction, where the sound is coming from
+        :param lags: as returned by estimate_lags
+        :return: index of the doa bin (int)
+        """
+        # lag_i * c / fs = (p_i - p_0) . u, solved for the direction u
+        baselines = self.mic_positions[1:] - self.mic_positions[0]
+        u = np.linalg.lstsq(baselines, np.asarray(lags[1:]) * SOUND_SPEED / self.sample_rate, rcond=None)[0]
+        azimuth = np.arctan2(u[1], u[0]) % (2 * np.pi)
+        return int(azimuth / (2 * np.pi) * self.doa_bins) % self.doa_bins
+
+    def delay_and_sum(self, audio, lags, out=None):
+        """
+        Shifts the channels by their lags and averages them, no shifted copies of the channels are made
+        :param audio: int16 array of shape (channels, n)
+        :param lags: as returned by estimate_lags
+        :param out: optional int32 array of shape (n,) used as accumulator
+        :return: int16 array of shape (n,)
+        """
+        n = audio.shape[1]
+        if out is None:
+            out = np.empty(n, dtype=np.int32)
+        out[:] = audio[0]
+        for channel, lag in zip(audio[1:], lags[1:]):
+            if lag > 0:
+                out[lag:] += channel[:-lag]
+            elif lag < 0:
+                out[:lag] += channel[-lag:]
+            else:
+                out += channel
+        out //= audio.shape[0]
+        return out.astype(np.int16)
+
+    def align(self, audio):
+        """
+        convenience function, estimates the lags and sums up the channels
+        :param audio: int16 array of shape (channels, n)
+        :return: int16 array of shape (n,)
+        """
+        return self.delay_and_sum(audio, self.estimate_lags(audio))
+
+    def stream(self, lags, channels=4):
+        """
+        Delay and sum for audio coming in block by block
+        :param lags: as returned by estimate_lags
+        :param channels: number of channels
+        :return: DelayAndSumStream
+        """
+        return DelayAndSumStream(lags, self.max_lag, channels)
+
+    def _loudest_segment(self, audio):
+        """the part of the audio with the most energy on the first channel, for estimating the lags"""
+        n = audio.shape[1]
+        if n <= self.analysis_length:
+            return audio
+        block = max(self.analysis_length // 4, 1)
+        blocks = n // block
+        energy = np.square(audio[0, :blocks * block].astype(np.float32)).reshape(blocks, block).sum(axis=1)
+        per_window = np.convolve(energy, np.ones(4), mode='valid')
+        start = int(np.argmax(per_window)) * block
+        return audio[:, start:start + self.analysis_length]
+
+
+class DelayAndSumStream:
+    """
+    Keeps the last samples of the previous block, so there are no gaps at the block borders.
+    The output is delayed by max_lag samples, i.e., a fraction of a millisecond.
+    """
+    def __init__(self, lags, max_lag, channels=4):
+        self.lags = np.asarray(lags)
+        self.max_lag = max_lag
+        self.history = np.zeros((channels, 2 * max_lag), dtype=np.int16)
+        self.extended = np.zeros((channels, 0), dtype=np.int16)
+        self.out = np.zeros(0, dtype=np.int32)
+
+    def process(self, block):
+        """
+        :param block: int16 array of shape (channels, n)
+        :return: int16 array of shape (n,)
+        """
+        channels, n = block.shape
+        h = 2 * self.max_lag
+        if self.extended.shape[1] < h + n:  # only grows if the blocks get larger
+            self.extended = np.zeros((channels, h + n), dtype=np.int16)
+            self.out = np.zeros(n, dtype=np.int32)
+        extended = self.extended[:, :h + n]
+        extended[:, :h] = self.history
+        extended[:, h:] = block
+        out = self.out[:n]
+        out[:] = 0
+        for channel, lag in zip(extended, self.lags):
+            start = self.max_lag - lag
+            out += channel[start:start + n]
+        out //= channels
+        self.history[:] = extended[:, n:]
+        return out.astype(np.int16)
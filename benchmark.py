@@ -0,0 +1,277 @@
+"""
+Small benchmarks for the performance critical parts of blueberry. They run without the seeed card,
+e.g. python3 benchmark.py beamforming --seconds 10
+"""
+import argparse
+import time
+import numpy as np
+
+
+def _timeit(func, repeat=5):
+    """best time of several runs in seconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def _test_audio(seconds, sample_rate=16000, lags=(0, 2, -3, 1)):
+    """noise on four channels, delayed against each other by the given lags"""
+    rng = np.random.default_rng(0)
+    n = int(seconds * sample_rate)
+    margin = max(abs(l) for l in lags)
+    signal = (rng.standard_normal(n + 2 * margin) * 3000).astype(np.int16)
+    return np.stack([signal[margin + lag:margin + lag + n] for lag in lags])
+
+
+def legacy_beamforming(audio):
+    """full length cross correlation as it was done in Assistant.listen_for_speech before"""
+    import scipy.signal as sg
+    for i in np.arange(1,4):
+        c = sg.correlate((audio[0]-np.mean(audio[0]))/np.std(audio[0]), (audio[i,:]-np.mean(audio[i,:]))/np.std(audio[i,:]))
+        lag = np.arange(-audio.shape[1]+1, audio.shape[1])[np.argmax(c)]
+        if lag > 0:
+            audio[i,:] = np.append([0]*lag, audio[i,:-lag])
+        elif lag < 0:
+            audio[i,:] = np.append(audio[i,-lag:],[0]*(-1*lag))
+    audio = np.mean(audio.astype(np.float64),axis=0)
+    return audio.astype(np.int16)
+
+
+def bench_beamforming(args):
+    from beamforming import Beamformer
+    audio = _test_audio(args.seconds)
+    beamformer = Beamformer()
+    new = _timeit(lambda: beamformer.align(audio.copy()))
+    print('GCC-PHAT, lags within +-{} samples: {:8.2f} ms'.format(beamformer.max_lag, new * 1000))
+    try:
+        old = _timeit(lambda: legacy_beamforming(audio.copy()), repeat=1)
+        print('full length correlation:           {:8.2f} ms'.format(old * 1000))
+    except ImportError:
+        print('scipy not installed, skipping the old full length correlation')
+
+
+def bench_hotword_frame(args):
+    import struct
+    from ctypes import c_short
+    from hotword import HotwordDetector
+    frame_length, n = 512, args.frames
+    raw = _test_audio(frame_length / 16000).T.copy()  # interleaved (frame_length, 4)
+    data = raw.tobytes()
+
+    def legacy():
+        # what listen_for_hotword did plus the ctypes array porcupine.process builds from the tuple
+        for _ in range(n):
+            pcm = struct.unpack_from("h" * frame_length*4, data)[0::4]
+            (c_short * len(pcm))(*pcm)
+
+    def tolist():
+        for _ in range(n):
+            pcm = np.frombuffer(data, dtype=np.int16).reshape(-1, 4)[:, 0].tolist()
+            (c_short * len(pcm))(*pcm)
+
+    class Porcupine:  # same interface as pvporcupine, the library call itself is left out
+        frame_length = 512
+        _handle = object()
+
+        @staticmethod
+        def _process_func(handle, pcm, result):
+            return 0
+
+    detector = HotwordDetector(Porcupine(), None)
+
+    def view():
+        for _ in range(n):
+            detector.process(raw)
+
+    budget = frame_length / 16000 * 1e6
+    for name, func in [('struct.unpack + tuple slice', legacy), ('strided view + tolist', tolist),
+                       ('strided view into preallocated buffer', view)]:
+        per_frame = _timeit(func, repeat=3) / n * 1e6
+        print('{:40s} {:8.2f} us/frame ({:.3f} % of a frame)'.format(name, per_frame, per_frame / budget * 100))
+
+
+def bench_vad(args):
+    import config as cfg
+    from audio_capture import read_wav
+    from vad import create_endpointer
+    chunk_length = {'command': 1, 'dictation': 5}[args.profile]  # what listen_for_speech used before
+    saved = []
+    for path in args.wav:
+        audio, sample_rate = read_wav(path)
+        endpointer = create_endpointer(cfg.vad, args.profile, sample_rate=sample_rate)
+        n = endpointer.frame_length
+        frames = [audio[i:i + n] for i in range(0, len(audio) - n + 1, n)]
+        silence_level = args.silence_level
+        if silence_level is None:  # the quiet frames of the recording itself
+            silence_level = max(np.percentile([np.median(np.abs(f)) for f in frames], 10), 60)
+
+        chunk = chunk_length * sample_rate
+        old_stop = len(audio)
+        for i in range(0, len(audio) - chunk + 1, chunk):
+            if not np.median(np.abs(audio[i:i + chunk])) > silence_level + 20:
+                old_stop = i + chunk
+                break
+        new_stop = len(audio)
+        for i, frame in enumerate(frames):
+            if not endpointer.process(frame, silence_level):
+                new_stop = (i + 1) * n
+                break
+        saved.append((old_stop - new_stop) / sample_rate)
+        print('{}: speech ends {:.2f} s, stop with chunks {:.2f} s, with vad {:.2f} s, saved {:.2f} s'.format(
+            path, endpointer.speech_end / sample_rate, old_stop / sample_rate, new_stop / sample_rate, saved[-1]))
+    if saved:
+        print('mean latency saved per utterance: {:.2f} s'.format(np.mean(saved)))
+
+
+def legacy_dispatch(words, commands, activities, scenes):
+    """command, activity and scene matching as it was done in Assistant.dispatch before"""
+    func_name = None
+    for name, hotwords in commands.items():
+        if any(command.issubset(words) for command in hotwords):
+            func_name = name
+            break
+    activity = words.intersection(set(activities))
+    scene = words.intersection(set(scenes))
+    return func_name, activity, scene
+
+
+def bench_intents(args):
+    import config as cfg
+    from intents import create_intent_index
+    rng = np.random.default_rng(0)
+    scenes = ['relax', 'read', 'concentrate', 'energize', 'bright', 'dimmed', 'nightlight', 'savanna sunset']
+    filler = 'please could you the a and now for me my then just'.split()
+    utterances, expected = [], []
+    for func_name, hotwords in cfg.commands.items():
+        for command in hotwords:
+            for _ in range(args.utterances):
+                words = list(command) + list(rng.choice(filler, 3))
+                if rng.random() < args.typos:  # deepspeech heard one character wrong
+                    i = int(np.argmax([len(w) for w in words]))
+                    j = rng.integers(len(words[i]))
+                    words[i] = words[i][:j] + words[i][j + 1:]
+                rng.shuffle(words)
+                utterances.append(words)
+                expected.append(func_name)
+
+    index = create_intent_index(scenes)
+    try:  # the scene names came from a column of the scenes data frame
+        import pandas as pd
+        scene_column = pd.Series(scenes)
+    except ImportError:
+        scene_column = scenes
+    legacy = [legacy_dispatch(set(w), cfg.commands, cfg.assistant['activities'], scenes)[0] for w in utterances]
+    new = [index.match(w)['command'] for w in utterances]
+    old_time = _timeit(lambda: [legacy_dispatch(set(w), cfg.commands, cfg.assistant['activities'], scene_column)
+                                for w in utterances])
+    new_time = _timeit(lambda: [index.match(w) for w in utterances])
+    build_time = _timeit(lambda: create_intent_index(scenes))
+    n = len(utterances)
+    print('{} utterances, {:.0f} % with a misrecognized word, index built in {:.2f} ms'.format(
+        n, args.typos * 100, build_time * 1000))
+    print('loop over all commands: {:6.2f} us/utterance, {:5.1f} % recognized'.format(
+        old_time / n * 1e6, np.mean(np.array(legacy) == np.array(expected)) * 100))
+    print('intent index:           {:6.2f} us/utterance, {:5.1f} % recognized'.format(
+        new_time / n * 1e6, np.mean(np.array(new) == np.array(expected)) * 100))
+
+
+def _stt_corpus(paths):
+    """the recordings (beamformed if they have four channels) with the transcripts from the .txt next to them"""
+    import os
+    from audio_capture import read_wav
+    from beamforming import Beamformer
+    recordings = []
+    for path in paths:
+        audio, sample_rate = read_wav(path)
+        audio = Beamformer(sample_rate).align(audio.T) if audio.shape[1] == 4 else audio[:, 0].copy()
+        with open(os.path.splitext(path)[0] + '.txt') as f:
+            recordings.append((audio, f.read().strip()))
+    return recordings
+
+
+def _stt_scores(backend, recordings, intents):
+    """decodes the recordings and prints word error rate, latency, real time factor and memory"""
+    from intents import edit_distance
+    latencies, errors, words, commands = [], 0, 0, 0
+    for audio, expected in recordings:
+        start = time.perf_counter()
+        transcript = backend.stt(audio)
+        latencies.append(time.perf_counter() - start)
+        errors += edit_distance(expected.split(), transcript.split())
+        words += len(expected.split())
+        commands += intents.match(transcript.split())['command'] == intents.match(expected.split())['command']
+    print('{:12s} WER {:5.1f} %, commands {:5.1f} %, latency p50 {:.2f} s p95 {:.2f} s, RTF {:.2f}, '
+          'load {:.1f} s, {:.0f} MB'.format(backend.name, errors / max(words, 1) * 100,
+                                           commands / len(recordings) * 100, np.percentile(latencies, 50),
+                                           np.percentile(latencies, 95), backend.rtf, backend.load_time,
+                                           backend.memory))
+
+
+def bench_stt(args):
+    from intents import create_intent_index
+    from stt import BACKENDS, create_backend
+    intents = create_intent_index()
+    recordings = _stt_corpus(args.wav)
+    for engine in args.engines or [e for e in BACKENDS if e != 'stub']:
+        try:
+            backend = create_backend(engine)
+        except ImportError as e:
+            print('{:12s} not installed ({})'.format(engine, e))
+            continue
+        _stt_scores(backend, recordings, intents)
+        del backend  # only one model in memory at a time
+
+
+def bench_stt_profiles(args):
+    import config as cfg
+    from intents import create_intent_index
+    from stt import load_profiles
+    intents = create_intent_index()
+    recordings = _stt_corpus(args.wav)
+    for name, backend in load_profiles(cfg.assistant['stt_profiles'], hot_words=list(intents.index)).items():
+        print(name, end=': ')
+        _stt_scores(backend, recordings, intents)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='benchmark')
+    sub.required = True
+
+    p = sub.add_parser('beamforming', help='time alignment of the four mic channels')
+    p.add_argument('--seconds', type=float, default=10, help='length of the recording')
+    p.set_defaults(func=bench_beamforming)
+
+    p = sub.add_parser('hotword-frame', help='cpu cost of handing one frame to porcupine')
+    p.add_argument('--frames', type=int, default=2000, help='number of frames per run')
+    p.set_defaults(func=bench_hotword_frame)
+
+    p = sub.add_parser('vad', help='end of speech detection of recorded utterances, chunks vs. vad')
+    p.add_argument('wav', nargs='+', help='recorded utterances (16 bit wav), starting right after the hotword')
+    p.add_argument('--profile', default='command', choices=['command', 'dictation'])
+    p.add_argument('--silence-level', type=float, help='noise floor, estimated from the recording if not given')
+    p.set_defaults(func=bench_vad)
+
+    p = sub.add_parser('intents', help='finding the command in the transcript, loop vs. intent index')
+    p.add_argument('--utterances', type=int, default=50, help='generated utterances per command phrase')
+    p.add_argument('--typos', type=float, default=0.3, help='share of utterances with a misrecognized word')
+    p.set_defaults(func=bench_intents)
+
+    p = sub.add_parser('stt', help='word error rate, latency and memory of every installed speech to text engine')
+    p.add_argument('wav', nargs='+', help='recordings (16 kHz wav) with the transcript in a .txt next to it')
+    p.add_argument('--engines', nargs='+', help='engines to compare, default: all installed')
+    p.set_defaults(func=bench_stt)
+
+    p = sub.add_parser('stt-profiles', help='decoding recorded commands with every decoder profile')
+    p.add_argument('wav', nargs='+', help='recorded commands (16 kHz wav) with the transcript in a .txt next to it')
+    p.set_defaults(func=bench_stt_profiles)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
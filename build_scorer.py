@@ -0,0 +1,76 @@
+"""
+Builds a small deepspeech scorer (KenLM language model) which only knows the words blueberry reacts to in
+command mode: the commands, the activities and, with --hue, the scenes of your bridge. Needs lmplz and
+build_binary of KenLM and generate_scorer_package of deepspeech 0.9, see
+https://deepspeech.readthedocs.io/en/v0.9.3/Scorer.html
+
+    python3 build_scorer.py --hue --alphabet ~/deepspeech-models/alphabet.txt
+"""
+import argparse
+import itertools
+import os
+import subprocess
+import tempfile
+
+import config as cfg
+
+
+def command_sentences(scenes=()):
+    """
+    The sentences the language model is trained on, every command phrase in all word orders, the activities
+    with the words to start them and the scene names
+    :param scenes: names of the hue scenes
+    :return: list of str
+    """
+    sentences = []
+    for hotwords in cfg.commands.values():
+        for command in hotwords:
+            if len(command) <= 4:
+                sentences += [' '.join(p) for p in itertools.permutations(sorted(command))]
+            else:
+                sentences.append(' '.join(sorted(command)))
+    for activity in cfg.assistant['activities']:
+        sentences += [activity, 'start ' + activity]
+    for scene in scenes:
+        sentences += [scene, scene + ' scene']
+    return sentences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=cfg.assistant['stt_profiles']['command']['scorer'],
+                        help='the scorer to write, default: the one of the command profile')
+    parser.add_argument('--alphabet', required=True, help='alphabet.txt the acoustic model was trained with')
+    parser.add_argument('--hue', action='store_true', help='add the scene names of the hue bridge')
+    parser.add_argument('--kenlm-bin', default='', help='directory with lmplz and build_binary')
+    parser.add_argument('--generate-scorer-package', default='generate_scorer_package',
+                        help='the executable of the native client of deepspeech')
+    parser.add_argument('--order', type=int, default=2, help='n-gram order, the phrases are short')
+    parser.add_argument('--default-alpha', type=float, default=0.931289039105002)
+    parser.add_argument('--default-beta', type=float, default=1.1834137581510284)
+    args = parser.parse_args()
+
+    scenes = ()
+    if args.hue:
+        from hue_helper import HueHelper
+        scenes = HueHelper().scene_names()
+    sentences = command_sentences(scenes)
+    print('{} sentences, {} words'.format(len(sentences), len({w for s in sentences for w in s.split()})))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, 'commands.txt')
+        with open(corpus, 'w') as f:
+            f.write('\n'.join(sentences) + '\n')
+        arpa, lm = os.path.join(tmp, 'lm.arpa'), os.path.join(tmp, 'lm.binary')
+        subprocess.run([os.path.join(args.kenlm_bin, 'lmplz'), '--order', str(args.order), '--text', corpus,
+                        '--arpa', arpa, '--discount_fallback'], check=True)
+        subprocess.run([os.path.join(args.kenlm_bin, 'build_binary'), '-a', '255', '-q', '8', '-v', 'trie',
+                        arpa, lm], check=True)
+        subprocess.run([args.generate_scorer_package, '--alphabet', args.alphabet, '--lm', lm, '--vocab', corpus,
+                        '--package', args.output, '--default_alpha', str(args.default_alpha),
+                        '--default_beta', str(args.default_beta)], check=True)
+    print('scorer written to {}'.format(args.output))
+
+
+if __name__ == "__main__":
+    main()
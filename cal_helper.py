@@ -7,33 +7,51 @@ import config as cfg
 import glob, os
 import schedule
 import threading
+from connection import LazyConnection
 
 
-class CalHelper:
+def _connect_calendars():
     """
-    Class to communicate with a caldav calendar and analyze the data, i.e, compare scheduled dates with tracked
-    activities
+    connects to the caldav server and looks up the two calendars
+    :return: dict with the principal, the scheduled and the tracking calendar
     """
-    url = cfg.calendar["url"]
-    username = cfg.calendar["username"]
-    password = cfg.calendar["password"]
-    client = caldav.DAVClient(url=url, username=username, password=password, ssl_verify_cert=False)
+    client = caldav.DAVClient(url=cfg.calendar["url"], username=cfg.calendar["username"],
+                              password=cfg.calendar["password"], ssl_verify_cert=False)
     principal = client.principal()
+    calendars = principal.calendars()
     try:
-        calendar_scheduled = principal.calendars()[cfg.calendar["index_scheduled"]]
-        calendar_tracking = principal.calendars()[cfg.calendar["index_tracking"]]
+        return {'principal': principal,
+                'scheduled': calendars[cfg.calendar["index_scheduled"]],
+                'tracking': calendars[cfg.calendar["index_tracking"]]}
     except IndexError:
-        print('Cannot find calendar with specified index')
+        raise ValueError('Cannot find calendar with specified index')
+
+
+class CalHelper:
+    """
+    Class to communicate with a caldav calendar and analyze the data, i.e, compare scheduled dates with tracked
+    activities. The server is connected in the background on first use, not at import.
+    """
+    connection = LazyConnection('caldav server', _connect_calendars)
     df_today = pd.DataFrame(columns=('summary', 'start', 'end', 'vevent'))
     scheduler_tasks = {}
 
     def __init__(self):
         self.scheduler_started = False
 
+    @classmethod
+    def calendar(cls, name):
+        """
+        the calendar, waits for the connection
+        :param name: 'scheduled' or 'tracking'
+        :return: caldav calendar
+        """
+        return cls.connection.get()[name]
+
     @classmethod
     def get_calendars(cls):
         """returns the available calendars"""
-        return cls.principal.calendars()
+        return cls.connection.get()['principal'].calendars()
 
     @classmethod
     def write_into_calendar(cls, start_time, stop_time, activity, calendar="tracking"):
@@ -48,9 +66,9 @@ class CalHelper:
         str_start_time = time.strftime("%Y%m%dT%H%M", time.localtime(start_time))
         str_stop_time = time.strftime("%Y%m%dT%H%M", time.localtime(stop_time))
         if calendar == "tracking":
-            calen = cls.calendar_tracking
+            calen = cls.calendar('tracking')
         elif calendar == 'scheduled':
-            calen = cls.calendar_scheduled
+            calen = cls.calendar('scheduled')
         else:
             return False
         my_event = calen.save_event("""BEGIN:VCALENDAR
@@ -73,9 +91,9 @@ END:VCALENDAR
         :return:
         """
         if calendar == "tracking":
-            calen = cls.calendar_tracking
+            calen = cls.calendar('tracking')
         elif calendar == 'scheduled':
-            calen = cls.calendar_scheduled
+            calen = cls.calendar('scheduled')
         else:
             return False
         my_event = calen.save_event(vevent)
@@ -91,7 +109,7 @@ END:VCALENDAR
         """
         if due_date == 0:
             if calendar == "scheduled":
-                my_event = cls.calendar_scheduled.save_event("""BEGIN:VCALENDAR
+                my_event = cls.calendar('scheduled').save_event("""BEGIN:VCALENDAR
 VERSION:2.0
 BEGIN:VTODO
 SUMMARY:{}
@@ -101,7 +119,7 @@ END:VCALENDAR
         else:
             str_due_time = time.strftime("%Y%m%dT%H%M", time.localtime(due_date))
             if calendar == "scheduled":
-                my_event = cls.calendar_scheduled.save_event("""BEGIN:VCALENDAR
+                my_event = cls.calendar('scheduled').save_event("""BEGIN:VCALENDAR
 VERSION:2.0
 BEGIN:VTODO
 DTSTART:{}00
@@ -119,9 +137,9 @@ END:VCALENDAR
         """
         st_time = time.localtime(time.time() - (7 * 24 * 3600))[0:3]
         if calendar == 'tracking':
-            events = cls.calendar_tracking.date_search(datetime(*st_time), datetime(*time.localtime()[0:3]))
+            events = cls.calendar('tracking').date_search(datetime(*st_time), datetime(*time.localtime()[0:3]))
         elif calendar == 'scheduled':
-            events = cls.calendar_scheduled.date_search(datetime(*st_time), datetime(*time.localtime()[0:3]))
+            events = cls.calendar('scheduled').date_search(datetime(*st_time), datetime(*time.localtime()[0:3]))
         else:
             print('wrong input')
             return
@@ -149,7 +167,7 @@ END:VCALENDAR
         I.e. a change in the calendar has occured since the last time, generate data today was executed.
         :return: True or false, depending on today's calendar events have been changed (on the server)
         """
-        events = cls.calendar_scheduled.date_search(datetime(*time.localtime()[0:3], 0, 0),
+        events = cls.calendar('scheduled').date_search(datetime(*time.localtime()[0:3], 0, 0),
                                                     datetime(*time.localtime()[0:3], 23, 59))
         df_today = pd.DataFrame(columns=('summary', 'start', 'end'))
         for e in events:
@@ -169,23 +187,27 @@ END:VCALENDAR
     def get_data_today(cls):
         """
         Only returns the previously generated dataframe without checking the calendar again (convenience function)
-        :return: dataframe of the events
+        :return: dataframe of the events, empty as long as the server is not available
         """
         if len(cls.df_today) == 0:
-            cls.generate_data_today()
+            try:
+                cls.generate_data_today()
+            except ConnectionError as e:
+                print(e)
         return cls.df_today
 
     def generate_scheduler_tasks(self, func):  # schedule only as module, makes problems when run from differnt parts
         """
         Starts a scheduler to update the task dataframe and also to execute a function func at time
-        of the calendar tasks
+        of the calendar tasks. The update job is registered first, so the tasks come back once the server is
+        available, even if it is down now.
         :return: None
         """
+        schedule.every(10).minutes.do(self.update_scheduler, func=func)
         self.generate_data_today()
         for i, start_time in enumerate(self.df_today['start']):
             self.scheduler_tasks[self.df_today.at[i, 'summary']] = schedule.every().day.at(
                 '{:02}:{:02}'.format(start_time.hour, start_time.minute)).do(func).tag('event_start')
-        schedule.every(10).minutes.do(self.update_scheduler, func=func)
 
     def update_scheduler(self, func):
         """
@@ -193,7 +215,13 @@ END:VCALENDAR
         :return: None
         """
         # ToDo: how to avoid jobs for time passed? (should not be a problem at first)
-        if self.generate_data_today():
+        try:
+            changed = self.generate_data_today()
+        except Exception as e:  # the scheduler thread must not die, try again next time
+            print('Cannot update the scheduler: {}'.format(e))
+            self.connection.reset()
+            return
+        if changed:
             schedule.clear('event_start')
             self.scheduler_tasks = {}
             for i, start_time in enumerate(self.df_today['start']):
@@ -229,6 +257,9 @@ END:VCALENDAR
     @classmethod
     def get_data_stats(cls):
         """ Gets the data from the two calendars used and writes+returns them in a pandas dataframe"""
+        if not cls.connection.ready:
+            cls.connection.warm_up()
+            return pd.DataFrame()
         scheduled_data = cls.get_data_last_week(calendar='scheduled')
         actual_data = cls.get_data_last_week(calendar='tracking')
         activites = set(list(scheduled_data.keys())+list(actual_data.keys()))
@@ -241,7 +272,7 @@ END:VCALENDAR
     def get_calendar_tasks(cls, calendar='scheduled'):
         all_tasks = {}
         if calendar == 'scheduled':
-            tasks_cal = cls.calendar_scheduled.date_search(datetime(*time.localtime()[0:3]), compfilter='VTODO')
+            tasks_cal = cls.calendar('scheduled').date_search(datetime(*time.localtime()[0:3]), compfilter='VTODO')
         for t in tasks_cal:
             task_content = {}
             try:
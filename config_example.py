@@ -1,5 +1,11 @@
 hue = {'user': r'https://192.168.0.1/api/XXX',  # XXX represents the token
-       'standard_group': 1}
+       'standard_group': 1,
+       # one keep-alive connection to the bridge, timeouts (connect, answer) in s and retries per request
+       'client': {'timeout': (2, 4), 'retries': 2, 'backoff': 0.1, 'pool_size': 4},
+       # groups, lights and scenes are kept in memory and polled every interval s (scenes every scenes_interval s)
+       'state': {'interval': 5, 'scenes_interval': 300},
+       # changes are sent in the background, at most rate per s and one per group_interval s (voice commands excepted)
+       'queue': {'rate': 10, 'group_interval': 1, 'max_pending': 50}}
 
 calendar = {'url': r"https://192.168.0.2/remote.php/dav",
             'username': r"XXX",
@@ -10,16 +16,57 @@ calendar = {'url': r"https://192.168.0.2/remote.php/dav",
 assistant = {'soundcard_name': 'seeed-4mic-voicecard',
              'deepspeech_model': r'/home/pi/deepspeech-models/deepspeech-0.9.3-models.tflite',
              'deepspeech_scorer': r'/home/pi/deepspeech-models/deepspeech-0.9.3-models.scorer',
+             'vosk_model': r'/home/pi/vosk-model-small-en-us-0.15',  # only needed for the vosk engine
+             # speech to text per vad profile, engine 'deepspeech' (one model shared) or 'vosk' (see stt.py)
+             # a scorer of None is the deepspeech_scorer above
+             'stt_profiles': {'command': {'engine': 'deepspeech',
+                                          'scorer': r'/home/pi/deepspeech-models/commands.scorer',  # build_scorer.py
+                                          'beam_width': 100, 'hot_word_boost': 10.0},
+                              'dictation': {'engine': 'deepspeech', 'scorer': None, 'beam_width': 500,
+                                            'hot_word_boost': 0}},
              'name': 'Your name',
              'night_time': "20:30",  # the leds switch to more nightly colors
              'activities': ['sport', 'reading', 'coding', 'socializing', 'walking',
                                    'writing', 'reflecting', 'relaxing'],  # so far only one word activites work
-             'joplin_folder': 'Inbox'}  # your notes are stored there by default
+             'joplin_folder': 'Inbox',  # your notes are stored there by default
+             'note_spool': r'/home/pi/.blueberry/notes',  # recorded notes wait here until they are in joplin
+             'capture_seconds': 30,  # length of the audio ring buffer, all listeners read from there
+             'stt_streaming': True,  # decode while you are still talking instead of after you are done
+             'stt_worker': True,  # decode in a separate process, keeps the gui and the leds responsive
+             'intents': {'max_distance': 1,  # misrecognized words within this edit distance are corrected
+                         'min_length': 5},  # shorter words have to be recognized exactly
+             'noise_floor': {'window': 10, 'percentile': 20,  # silence level: 20th percentile of the last 10 s
+                             'update_interval': 1, 'minimum': 60},
+             'print_stats': False}  # prints stt latencies, silence level and counters of audio, leds, hue, sensor
+
+vad = {'engine': 'energy',  # or 'webrtc' (pip install webrtcvad)
+       'frame_ms': 30,  # speech or silence is decided for every frame
+       'margin': 20,  # energy vad: frames louder than silence level + margin are speech
+       'lag_estimation_length': 1,  # s, audio used to align the mics in streaming mode
+       'end_padding': 0.2,  # s of silence kept after the speech
+       'profiles': {'command': {'hangover': 0.5, 'max_length': 10, 'start_timeout': 3},  # all in s
+                    'dictation': {'hangover': 1.5, 'max_length': 60, 'start_timeout': 5}}}
 
 joplin = {'url': r'http://localhost:41184/',  # this is the default where the api server is normally running
-          'token': 'XXX'}  # Can be extracted via JoplinHelper.get_token()
+          'token': 'XXX',  # Can be extracted via JoplinHelper.get_token()
+          'sync': {'debounce': 5,  # s without new notes before syncing, notes in a row are synced once
+                   'min_interval': 60,  # s between two syncs at least
+                   'timeout': 600}}  # s until a hanging sync is killed
+
+thermometer = {'feel_well_temperature': 22,
+               # the BME280 measures on its own (normal mode), blueberry reads the latest values every interval s
+               'sensor': {'oversample_temp': 1, 'oversample_pres': 1, 'oversample_hum': 1,  # 0 (off), 1, 2, .., 16
+                          'iir_filter': 4,  # smooths short fluctuations (e.g. a door opening), 0 (off), 2, .., 16
+                          'standby_ms': 1000,  # pause between two measurements of the sensor
+                          'interval': 10},
+               # every reading on disk, downsampled to minutes, hours and days when older (see air_history.py)
+               'history': {'path': '/home/pi/.blueberry/air', 'raw_days': 7, 'minute_days': 90, 'hour_days': 730,
+                           'day_days': 3650}}
 
-thermometer = {'feel_well_temperature': 22}
+hardware = {'backend': 'seeed',  # or 'simulated': no soundcard, leds or sensor needed (see hardware.py)
+            'wav': [],  # simulated: recordings (16 kHz, 1 or 4 channels) played as microphone input
+            'realtime': True,  # simulated: play them at recording speed
+            'bme280_script': None}  # simulated: json with calibration and samples of the sensor, None: defaults
 
 commands = {'take_note': [{'take', 'note'}, {'write', 'note'}, {'write', 'notebook'}, {'new', 'entry'}, {'new', 'note'}],
             'write_todo': [{'new', 'task'}, {'remind', 'me'}, {'new', 'reminder'},],
@@ -29,4 +76,4 @@ commands = {'take_note': [{'take', 'note'}, {'write', 'note'}, {'write', 'notebo
             'start_activity': [{'start', 'activity'}, {'start', 'task'}, {'start', 'up', 'next'}, {'start', 'event'}],
             'stop_activity': [{'finish'},{'finished'}, {'done'}, {'stop', 'activity'}, {'stop', 'it'}, {'stop', 'task'}],
             'increase_brightness': [{'increase', 'brightness'}, {'brighter'}, {'more', 'light'}, {'reduce', 'darkness'}],
-            'reduce_brightness': [{'dimm', 'lights'}, {'darker'}, {'increase', 'darkness'}, 'reduce', 'brightness']}
\ No newline at end of file
+            'reduce_brightness': [{'dimm', 'lights'}, {'darker'}, {'increase', 'darkness'}, {'reduce', 'brightness'}]}
\ No newline at end of file
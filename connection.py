@@ -0,0 +1,83 @@
+import threading
+import time
+
+
+class LazyConnection:
+    """
+    Connects to a service (hue bridge, caldav server, joplin) in a background thread instead of at import time.
+    The state is explicit (idle, connecting, ready, failed) and a failed connection is tried again with an
+    exponentially growing pause, so a service that is down doesn't hold up the rest of blueberry.
+    """
+    def __init__(self, name, connect, timeout=10, min_backoff=1, max_backoff=300):
+        """
+        :param name: of the service, for the messages
+        :param connect: function without arguments, connects and returns whatever the clients need
+        :param timeout: default seconds get() waits for the connection
+        :param min_backoff: seconds to wait before the first reconnect
+        :param max_backoff: maximum seconds between two reconnects
+        """
+        self.name = name
+        self.connect = connect
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.state = 'idle'
+        self.value = None
+        self.error = None
+        self.condition = threading.Condition()
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def warm_up(self):
+        """starts connecting in the background, if not already connected or connecting"""
+        with self.condition:
+            if self.state != 'idle':
+                return
+            self.state = 'connecting'
+        threading.Thread(target=self._connect_loop, daemon=True).start()
+
+    def _connect_loop(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                value = self.connect()
+            except Exception as e:
+                print('Cannot connect to {}: {}, trying again in {} s'.format(self.name, e, backoff))
+                with self.condition:
+                    self.state = 'failed'
+                    self.error = e
+                    self.condition.notify_all()
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            with self.condition:
+                self.value = value
+                self.error = None
+                self.state = 'ready'
+                self.condition.notify_all()
+            return
+
+    def get(self, timeout=None):
+        """
+        Returns the connection, waits for it if it is still being established
+        :param timeout: seconds to wait, default: the timeout of the connection
+        :return: what the connect function returned
+        :raises ConnectionError: if the service is not available (yet)
+        """
+        if timeout is None:
+            timeout = self.timeout
+        self.warm_up()
+        with self.condition:
+            self.condition.wait_for(lambda: self.state in ('ready', 'failed'), timeout)
+            if self.state == 'ready':
+                return self.value
+            raise ConnectionError('{} is not available: {}'.format(self.name, self.error or 'timeout'))
+
+    def reset(self):
+        """forgets the connection, e.g. after an error, the next get() connects again"""
+        with self.condition:
+            if self.state == 'ready':
+                self.state = 'idle'
+                self.value = None
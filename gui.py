@@ -5,6 +5,8 @@ from assistant import Assistant
 import hue_helper
 from cal_helper import CalHelper
 from joplin_helper import JoplinHelper
+from air_history import Decimator
+import numpy as np
 import pandas as pd
 import config as cfg
 import time
@@ -25,6 +27,9 @@ class Window(QMainWindow):
         self.assistant_thread.activity_signal[str].connect(self.tabs.tab_time.select_activity)
         self.assistant_thread.current_tab_signal[int].connect(self.tabs.tabs.setCurrentIndex)
         self.assistant_thread.air_signal[str].connect(self.tabs.tab_home.label_air.setText)
+        self.assistant_thread.startup_signal[str].connect(self.tabs.tab_home.show_startup)
+        self.assistant_thread.sync.status_signal[str].connect(self.tabs.tab_home.label_sync.setText)
+        self.tabs.tab_air.set_history(self.assistant_thread.air_history)
         self.showMaximized()
         self.assistant_thread.start()
 
@@ -39,6 +44,7 @@ class Tabs(QWidget):
         # Initialize tab screen
         self.tabs = QTabWidget()
         self.tab_home = TabHome()
+        self.tab_air = TabAir()
         self.tab_light = TabLights()
         self.tab_notes = TabNotes()
         self.tab_time = TabTime()
@@ -46,6 +52,7 @@ class Tabs(QWidget):
 
         # Add tabs
         self.tabs.addTab(self.tab_home, "Home")
+        self.tabs.addTab(self.tab_air, "Air")
         self.tabs.addTab(self.tab_light, "Lights")
         self.tabs.addTab(self.tab_notes, "Notes")
         self.tabs.addTab(self.tab_time, "Time Tracking")
@@ -61,9 +68,9 @@ class Tabs(QWidget):
 
     @pyqtSlot()
     def update_tab_content(self):
-        if self.tabs.currentIndex() == 1:  # Lights
+        if self.tabs.currentIndex() == 2:  # Lights
             self.tab_light.update_content()
-        if self.tabs.currentIndex() == 3:  # Timetracking
+        if self.tabs.currentIndex() == 4:  # Timetracking
             self.tab_time._update_widgets()
 
 
@@ -77,14 +84,185 @@ class TabHome(QWidget):
         self.label_words.setAlignment(Qt.AlignCenter)
         self.label_words.setFont(QFont('SansSerif', 20))
         layout = QGridLayout()
-        layout.addWidget(self.label_words, 1, 0)
+        layout.addWidget(self.label_words, 1, 0, 1, 2)
         self.label_air = QLabel()
         self.label_air.setText('Temp: \nHumidity: \nPressure:')
         self.label_air.setAlignment(Qt.AlignRight | Qt.AlignBottom)
         self.label_air.setFont(QFont('SansSerif', 14))
-        layout.addWidget(self.label_air, 2,0)
+        layout.addWidget(self.label_air, 2, 1)
+        self.label_startup = QLabel()  # timeline of the startup steps
+        self.label_startup.setAlignment(Qt.AlignLeft | Qt.AlignBottom)
+        self.label_startup.setFont(QFont('Monospace', 9))
+        layout.addWidget(self.label_startup, 2, 0)
+        self.label_sync = QLabel()  # status of the joplin sync
+        self.label_sync.setAlignment(Qt.AlignRight | Qt.AlignTop)
+        self.label_sync.setFont(QFont('SansSerif', 10))
+        layout.addWidget(self.label_sync, 0, 1)
         self.setLayout(layout)
 
+    @pyqtSlot(str)
+    def show_startup(self, timeline):
+        """
+        shows the startup timeline, hides it once the startup is done
+        :param timeline: see StartupGraph.timeline, empty when done
+        :return:
+        """
+        self.label_startup.setText(timeline)
+        self.label_startup.setVisible(bool(timeline))
+
+
+class HistoryChart(QWidget):
+    """
+    Plots one quantity of the air history: the band between min and max and the mean as line. The widget only
+    gets the decimated buckets, a few hundred points, and draws them with QPainter.
+    """
+    def __init__(self, title, unit, color, parent=None):
+        """
+        :param title: e.g. 'Temperature'
+        :param unit: e.g. '°C'
+        :param color: QColor of the line, the band is a lighter version
+        """
+        super(QWidget, self).__init__(parent)
+        self.title = title
+        self.unit = unit
+        self.color = color
+        self.data = None  # times, min, mean, max, start, end
+        self.band = QPolygonF()
+        self.line = QPolygonF()
+        self.setMinimumHeight(120)
+
+    def set_data(self, times, minimum, mean, maximum, start, end):
+        """
+        :param times: numpy array, centers of the buckets
+        :param minimum: numpy array
+        :param mean: numpy array
+        :param maximum: numpy array
+        :param start: time.time() at the left edge
+        :param end: time.time() at the right edge
+        :return:
+        """
+        self.data = times, minimum, mean, maximum, start, end
+        self._build()
+        self.update()
+
+    def resizeEvent(self, event):
+        self._build()
+
+    def _plot_area(self):
+        return QRectF(50, 20, max(self.width() - 60, 1), max(self.height() - 40, 1))
+
+    def _build(self):
+        """maps the buckets to pixels, only when the data or the size change, not on every paint"""
+        self.band, self.line = QPolygonF(), QPolygonF()
+        if self.data is None or not len(self.data[0]):
+            return
+        times, minimum, mean, maximum, start, end = self.data
+        area = self._plot_area()
+        self.low, self.high = np.floor(minimum.min()), np.ceil(maximum.max())
+        if self.high - self.low < 1:
+            self.high = self.low + 1
+        x = area.left() + (times - start) / (end - start) * area.width()
+        def y(values):
+            return area.bottom() - (values - self.low) / (self.high - self.low) * area.height()
+        self.band = QPolygonF([QPointF(*p) for p in zip(np.r_[x, x[::-1]], np.r_[y(maximum), y(minimum[::-1])])])
+        self.line = QPolygonF([QPointF(*p) for p in zip(x, y(mean))])
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        area = self._plot_area()
+        painter.drawText(QPointF(area.left(), 14), self.title)
+        painter.setPen(QPen(Qt.gray))
+        painter.drawRect(area)
+        if self.line.isEmpty():
+            painter.drawText(area, Qt.AlignCenter, 'No readings yet')
+            return
+        painter.drawText(QRectF(0, area.top() - 8, 45, 16), Qt.AlignRight, '{:g} {}'.format(self.high, self.unit))
+        painter.drawText(QRectF(0, area.bottom() - 8, 45, 16), Qt.AlignRight, '{:g} {}'.format(self.low, self.unit))
+        start, end = self.data[4:]
+        time_format = '%H:%M' if end - start <= 86400 else '%d.%m.'
+        painter.drawText(QPointF(area.left(), area.bottom() + 16), time.strftime(time_format, time.localtime(start)))
+        painter.drawText(QRectF(area.right() - 100, area.bottom() + 4, 100, 16), Qt.AlignRight,
+                         time.strftime(time_format, time.localtime(end)))
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(QColor(self.color.red(), self.color.green(), self.color.blue(), 60))
+        painter.drawPolygon(self.band)
+        painter.setPen(QPen(self.color, 2))
+        painter.drawPolyline(self.line)
+
+
+class TabAir(QWidget):
+    """
+    History of temperature and humidity, as the thermometer stores it in the AirHistory. A range of hundreds of
+    thousands of readings is reduced to one min/max bucket per pixel column before it reaches Qt. After that only
+    the new readings are fetched and added to the buckets.
+    """
+    ranges = {'hour': 3600, 'day': 86400, 'week': 7 * 86400, 'month': 30 * 86400}
+    buckets = 400
+
+    def __init__(self, parent=None):
+        super(QWidget, self).__init__(parent)
+        self.history = None
+        self.decimator = None
+        self.level = None
+        self.layout = QGridLayout()
+        self.charts = [HistoryChart('Temperature', '°C', QColor(200, 40, 20)),
+                       HistoryChart('Humidity', '%', QColor(20, 80, 200))]
+        for i, chart in enumerate(self.charts):
+            self.layout.addWidget(chart, i, 0, 1, len(self.ranges))
+        self.range_button_group = QButtonGroup()
+        for i, name in enumerate(self.ranges):
+            button = QRadioButton(name)
+            button.setFont(QFont("Sanserif", 13))
+            button.toggled.connect(lambda checked, name=name: checked and self.select_range(name))
+            self.range_button_group.addButton(button)
+            self.layout.addWidget(button, len(self.charts), i)
+        self.setLayout(self.layout)
+        self.range_name = 'day'
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_content)
+        self.range_button_group.buttons()[1].setChecked(True)
+
+    def set_history(self, history):
+        """
+        :param history: AirHistory of the assistant
+        :return:
+        """
+        self.history = history
+        self.timer.start(int(cfg.thermometer['sensor']['interval'] * 1000))
+        self.select_range(self.range_name)
+
+    @pyqtSlot()
+    def select_range(self, name):
+        """starts over with the readings of the chosen range"""
+        self.range_name = name
+        if self.history is None:
+            return
+        span = self.ranges[name]
+        self.level = self.history.level_for(time.time() - span)
+        self.decimator = Decimator(span, self.buckets)
+        self.fetched = time.time() - span
+        self.update_content()
+
+    @pyqtSlot()
+    def update_content(self):
+        """adds the readings since the last update"""
+        if self.decimator is None:
+            return
+        now = time.time()
+        end = now
+        if self.level != 'raw':  # only complete rollups, the newest one still changes
+            width = self.history.widths[self.level]
+            end = now // width * width
+        changed = self.decimator.add(*self.history.series(self.fetched, end, self.level))
+        self.fetched = max(self.fetched, end)
+        self.decimator.trim(now)
+        if changed or self.isVisible():  # the x axis moves on anyway
+            decimator = self.decimator
+            for i, chart in enumerate(self.charts):
+                chart.set_data(decimator.times, decimator.minimum[:, i], decimator.mean[:, i],
+                               decimator.maximum[:, i], now - decimator.span, now)
+
 
 class TabTime(QWidget):
     """
@@ -441,14 +619,9 @@ class TabLights(QWidget):
         self.layout = QGridLayout()
         self.scenes_group_box = QGroupBox("Scenes")
         self.scenes_group_box.setFont(QFont("Sanserif", 13))
-        scenes_layout = QGridLayout()
+        self.scenes_layout = QGridLayout()
         self.scene_buttons = []
-        for i, s in enumerate(self.hue.scenes_df['name'].tolist()):
-            self.scene_buttons.append(QRadioButton(s))
-            self.scene_buttons[i].setFont(QFont("Sanserif", 13))
-            self.scene_buttons[i].clicked.connect(lambda: self.set_scene(scene_name=s))
-            scenes_layout.addWidget(self.scene_buttons[i], i/2, i%2)
-        self.scenes_group_box.setLayout(scenes_layout)
+        self.scenes_group_box.setLayout(self.scenes_layout)
         self.layout.addWidget(self.scenes_group_box, 0, 0, 3, 3)
 
         self.brightness_box = QGroupBox("Brightness")
@@ -463,15 +636,9 @@ class TabLights(QWidget):
         
         self.groups_group_box = QGroupBox("Groups")
         self.groups_group_box.setFont(QFont("Sanserif", 13))
-        groups_layout = QVBoxLayout()
+        self.groups_layout = QVBoxLayout()
         self.group_buttons = []
-        for i, g in enumerate(hue_helper.HueHelper.groups_df['name'].tolist()):
-            self.group_buttons.append(QCheckBox())
-            self.group_buttons[i].setText(g)
-            self.group_buttons[i].stateChanged.connect(lambda clicked, i=i:
-                                                       self.set_on_off(groupsbutton=self.group_buttons[i]))
-            groups_layout.addWidget(self.group_buttons[i])
-        self.groups_group_box.setLayout(groups_layout)
+        self.groups_group_box.setLayout(self.groups_layout)
         self.layout.addWidget(self.groups_group_box, 0, 4, 2,2)
         
         self.temperature_box = QGroupBox("Temperature")
@@ -497,39 +664,63 @@ class TabLights(QWidget):
         self.layout.addWidget(self.temperature_box, 2,4, 1,2)
         self.setLayout(self.layout)
 
+    def _create_hue_buttons(self):
+        """creates the scene and group buttons, once the bridge is connected"""
+        for i, s in enumerate(self.hue.scenes_df['name'].tolist()):
+            self.scene_buttons.append(QRadioButton(s))
+            self.scene_buttons[i].setFont(QFont("Sanserif", 13))
+            self.scene_buttons[i].clicked.connect(lambda: self.set_scene(scene_name=s))
+            self.scenes_layout.addWidget(self.scene_buttons[i], i/2, i%2)
+        for i, g in enumerate(self.hue.groups_df['name'].tolist()):
+            self.group_buttons.append(QCheckBox())
+            self.group_buttons[i].setText(g)
+            self.group_buttons[i].stateChanged.connect(lambda clicked, i=i:
+                                                       self.set_on_off(groupsbutton=self.group_buttons[i]))
+            self.groups_layout.addWidget(self.group_buttons[i])
+
+    def _call(self, func, *args):
+        """calls the hue helper, a bridge not answering is printed instead of crashing the gui"""
+        try:
+            return func(*args)
+        except ConnectionError as e:
+            print(e)
+
     @pyqtSlot()
     def change_brightness(self):
-        self.hue.set_brightness(self.brightness_slider.value())
+        self._call(self.hue.set_brightness, self.brightness_slider.value())
         
     @pyqtSlot()
     def change_temperature(self):
-        self.hue.set_temperature(self.temp_slider.value())
+        self._call(self.hue.set_temperature, self.temp_slider.value())
 
     @pyqtSlot()
     def set_scene(self, scene_name):
         for s in self.scene_buttons:
             if s.isChecked():
                 scene_name = s.text()
-        self.hue.set_scene_by_name(scene_name)
+        self._call(self.hue.set_scene_by_name, scene_name)
         for g in self.group_buttons:
             if self.hue.get_status(g.text()):
                 g.setChecked(True)
             else:
                 g.setChecked(False)
-        time.sleep(0.5)
         self.update_content()
         
 
     @pyqtSlot()
     def set_on_off(self, groupsbutton):
         if groupsbutton.isChecked():
-            self.hue.turn_on(groupsbutton.text())
+            self._call(self.hue.turn_on, groupsbutton.text())
         else:
-            self.hue.turn_off(groupsbutton.text())
+            self._call(self.hue.turn_off, groupsbutton.text())
             
     @pyqtSlot()
     def update_content(self):
-        brightness = self.hue.get_brightness()
+        if not self.hue.ready:  # still connecting, don't block the gui
+            return
+        if not self.scene_buttons and not self.group_buttons:
+            self._create_hue_buttons()
+        brightness = self.hue.get_brightness()  # from the state in memory, no request
         self.brightness_slider.setValue(brightness)
         temperature = self.hue.get_temperature()
         self.temp_slider.setValue(temperature)
@@ -0,0 +1,281 @@
+"""
+Access to the hardware of blueberry: the seeed soundcard (pyaudio), the APA102 leds, the power pin of the leds
+(gpio) and the BME280 sensor (i2c). With cfg.hardware['backend'] = 'simulated' everything is simulated instead:
+the microphone plays wav files, the led strip records its frames and the sensor replays register data. So the
+assistant runs on any linux box, under CI or a profiler, and the simulated parts count what goes over the wire.
+"""
+import json
+import time
+from collections import deque
+import numpy as np
+
+from audio_capture import read_wav
+import config as cfg
+
+INT16 = 8  # pyaudio.paInt16
+
+
+def simulated():
+    return cfg.hardware['backend'] == 'simulated'
+
+
+class WavStream:
+    """
+    Behaves like the pyaudio input stream, but the audio comes from a wav file. Either as fast as it is read
+    or in real time. After the file some silence follows, then it keeps on delivering silence in real time
+    like a quiet room would.
+    """
+    def __init__(self, audio, sample_rate, realtime=False, padding=3):
+        """
+        :param audio: int16 array (n, channels)
+        :param sample_rate: in Hz
+        :param realtime: deliver the audio at the speed it was recorded
+        :param padding: seconds of silence following the file at full speed
+        """
+        self.audio = np.concatenate((audio, np.zeros((int(padding * sample_rate), audio.shape[1]), np.int16)))
+        self.sample_rate = sample_rate
+        self.realtime = realtime
+        self.position = 0
+        self.start_time = None
+        self.end_time = None
+        self.bytes_read = 0
+
+    @property
+    def end(self):
+        """number of samples of the file and the padding"""
+        return len(self.audio)
+
+    def read(self, n, exception_on_overflow=False):
+        if self.start_time is None:
+            self.start_time = time.perf_counter()
+        if self.position + n <= len(self.audio):
+            block = self.audio[self.position:self.position + n]
+            start, delivered = self.start_time, self.position + n
+        else:
+            block = np.zeros((n, self.audio.shape[1]), np.int16)
+            if self.end_time is None:
+                self.end_time = time.perf_counter()
+            start, delivered = self.end_time, self.position + n - len(self.audio)
+        self.position += n
+        if self.realtime or self.end_time is not None:
+            delay = start + delivered / self.sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        self.bytes_read += block.nbytes
+        return block.tobytes()
+
+    def close(self):
+        pass
+
+
+class SimulatedAudio:
+    """PyAudio with one input device, the wav files of the config one after the other"""
+    def __init__(self, paths, realtime=True):
+        """
+        :param paths: wav files, 1 or 4 channels
+        :param realtime: play them at recording speed, like a microphone
+        """
+        self.paths = paths
+        self.realtime = realtime
+        self.streams = []
+
+    def get_device_count(self):
+        return 1
+
+    def get_device_info_by_index(self, index):
+        return {'name': 'simulated ' + cfg.assistant['soundcard_name'], 'maxInputChannels': 4}
+
+    def open(self, rate, channels, format=INT16, input=True, frames_per_buffer=512, input_device_index=None):
+        parts = []
+        for path in self.paths:
+            audio, sample_rate = read_wav(path)
+            if sample_rate != rate:
+                raise ValueError('{} has {} Hz, expected {} Hz'.format(path, sample_rate, rate))
+            if audio.shape[1] == 1:
+                audio = np.repeat(audio, channels, axis=1)
+            parts += [audio, np.zeros((rate, channels), np.int16)]  # a second of silence in between
+        audio = np.concatenate(parts) if parts else np.zeros((0, channels), np.int16)
+        self.streams.append(WavStream(audio, rate, realtime=self.realtime))
+        return self.streams[-1]
+
+    def terminate(self):
+        pass
+
+    def stats(self):
+        return {'audio_bytes': sum(s.bytes_read for s in self.streams)}
+
+
+class SimulatedPin:
+    """gpiozero LED"""
+    def __init__(self, pin):
+        self.pin = pin
+        self.is_lit = False
+
+    def on(self):
+        self.is_lit = True
+
+    def off(self):
+        self.is_lit = False
+
+
+class SimulatedStrip:
+    """
+    APA102 strip without hardware, counts what show() would send over spi and keeps the last frames
+    """
+    def __init__(self, num_led, history=1000):
+        """
+        :param num_led: number of leds
+        :param history: number of frames to keep
+        """
+        self.num_led = num_led
+        self.pixels = np.zeros((num_led, 4))  # r, g, b, bright_percent
+        self.frames = deque(maxlen=history)  # (time, pixels)
+        self.shows = 0
+        self.pixels_set = 0
+        self.spi_bytes = 0
+        self.start = time.perf_counter()
+
+    def clear_strip(self):
+        self.pixels[:] = 0
+        self.show()
+
+    def set_pixel(self, led_num, red, green, blue, bright_percent=100):
+        self.pixels[led_num] = red, green, blue, bright_percent
+        self.pixels_set += 1
+
+    def show(self):
+        self.shows += 1
+        self.spi_bytes += spi_bytes(self.num_led)
+        self.frames.append((time.perf_counter(), self.pixels.copy()))
+
+    def cleanup(self):
+        pass
+
+    def stats(self):
+        seconds = time.perf_counter() - self.start
+        return {'shows': self.shows, 'pixels_set': self.pixels_set, 'spi_bytes': self.spi_bytes,
+                'shows_per_s': self.shows / seconds, 'spi_bytes_per_s': self.spi_bytes / seconds}
+
+
+def spi_bytes(num_led):
+    """bytes one show() of an APA102 strip sends: start frame, 4 bytes per led and the end frame"""
+    return 4 + 4 * num_led + (num_led + 15) // 16
+
+
+# calibration of the simulated BME280 and its raw readings (pressure, temperature, humidity)
+BME280_CALIBRATION = {'T': [27504, 26435, 50], 'P': [36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000],
+                      'H': [75, 362, 0, 313, 50, 30]}
+BME280_SAMPLES = [(415148, 519888, 30000), (415150, 520100, 30100), (415146, 520300, 30050)]
+
+
+def bme280_registers(calibration=BME280_CALIBRATION, samples=BME280_SAMPLES):
+    """
+    The register contents of a BME280 with the given calibration, the data register cycles through the samples
+    :param calibration: dict with the T, P and H calibration values
+    :param samples: raw (pressure, temperature, humidity) readings
+    :return: dict register -> list of bytes, the data register (0xF7) -> list of readings
+    """
+    def words(values):
+        return [b for v in values for b in (v & 0xFF, (v >> 8) & 0xFF)]
+    h1, h2, h3, h4, h5, h6 = calibration['H']
+    return {0x88: words(calibration['T']), 0x8E: words(calibration['P']), 0xA1: [h1],
+            0xE1: words([h2]) + [h3, h4 >> 4, (h4 & 0x0F) | ((h5 & 0x0F) << 4), h5 >> 4, h6 & 0xFF],
+            0xF7: [[p >> 12, (p >> 4) & 0xFF, (p & 0x0F) << 4, t >> 12, (t >> 4) & 0xFF, (t & 0x0F) << 4,
+                    h >> 8, h & 0xFF] for p, t, h in samples]}
+
+
+class SimulatedBus:
+    """
+    SMBus with a BME280, which replays scripted register data. Every measurement moves on to the next reading
+    of the data register: in forced mode with every write to the control register, in normal mode with every
+    read.
+    """
+    registers = None
+    normal_mode = False
+    reads = 0
+    writes = 0
+    bytes_read = 0
+    measurements = 0
+    start = time.perf_counter()
+
+    def __init__(self, bus):
+        if SimulatedBus.registers is None:
+            SimulatedBus.registers = load_bme280_script(cfg.hardware['bme280_script'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def close(self):
+        pass
+
+    def read_i2c_block_data(self, address, register, length):
+        SimulatedBus.reads += 1
+        SimulatedBus.bytes_read += length
+        if register == 0xF7:
+            if SimulatedBus.normal_mode:
+                SimulatedBus.measurements += 1
+            readings = self.registers[0xF7]
+            return list(readings[(SimulatedBus.measurements - 1) % len(readings)][:length])
+        return list(self.registers[register][:length])
+
+    def write_byte_data(self, address, register, value):
+        SimulatedBus.writes += 1
+        if register == 0xF4:
+            SimulatedBus.normal_mode = value & 0x03 == 0x03
+            if value & 0x03 in (1, 2):  # forced mode, a new measurement
+                SimulatedBus.measurements += 1
+
+    @classmethod
+    def stats(cls):
+        seconds = time.perf_counter() - cls.start
+        return {'i2c_reads': cls.reads, 'i2c_writes': cls.writes, 'i2c_bytes_read': cls.bytes_read,
+                'measurements': cls.measurements, 'i2c_bytes_per_s': cls.bytes_read / seconds}
+
+
+def load_bme280_script(path=None):
+    """
+    :param path: json file with 'calibration' and/or 'samples' (see BME280_CALIBRATION, BME280_SAMPLES),
+        None for the defaults
+    :return: register contents, see bme280_registers
+    """
+    if path is None:
+        return bme280_registers()
+    with open(path) as f:
+        script = json.load(f)
+    return bme280_registers(script.get('calibration', BME280_CALIBRATION),
+                            [tuple(s) for s in script.get('samples', BME280_SAMPLES)])
+
+
+def create_audio():
+    """:return: pyaudio.PyAudio or the simulated one"""
+    if simulated():
+        return SimulatedAudio(cfg.hardware['wav'], realtime=cfg.hardware['realtime'])
+    import pyaudio
+    return pyaudio.PyAudio()
+
+
+def create_led_strip(num_led):
+    """:return: apa102 strip or the simulated one"""
+    if simulated():
+        return SimulatedStrip(num_led)
+    from apa102_pi.driver.apa102 import APA102
+    return APA102(num_led)
+
+
+def create_pin(pin):
+    """:return: gpiozero LED (output pin) or the simulated one"""
+    if simulated():
+        return SimulatedPin(pin)
+    from gpiozero import LED
+    return LED(pin)
+
+
+def open_smbus(bus):
+    """:return: smbus2 SMBus or the simulated one, use it as context manager"""
+    if simulated():
+        return SimulatedBus(bus)
+    from smbus2 import SMBus
+    return SMBus(bus)
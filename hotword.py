@@ -0,0 +1,46 @@
+from ctypes import POINTER, byref, c_int, c_short
+import numpy as np
+
+
+class HotwordDetector:
+    """
+    Feeds one channel of the captured frames to porcupine. This runs every 32 ms around the clock, so
+    no python objects are created per frame: the channel is copied from the strided ring buffer view into a
+    preallocated int16 buffer, whose pointer is handed directly to the porcupine library.
+    """
+    def __init__(self, porcupine, reader, channel=0):
+        """
+        :param porcupine: porcupine handle as created by pvporcupine.create
+        :param reader: AudioReader of the capture
+        :param channel: mic channel to listen on
+        """
+        self.porcupine = porcupine
+        self.reader = reader
+        self.channel = channel
+        self.frame_length = porcupine.frame_length
+        self.pcm = np.zeros(self.frame_length, dtype=np.int16)
+        # porcupine.process builds a new ctypes array out of a python sequence for every frame,
+        # we'd rather call the C function with our buffer. Falls back to process() if it's not there.
+        self._process_func = getattr(porcupine, '_process_func', None)
+        self._handle = getattr(porcupine, '_handle', None)
+        self._success = getattr(getattr(porcupine, 'PicovoiceStatuses', None), 'SUCCESS', 0)
+        self._pcm_pointer = self.pcm.ctypes.data_as(POINTER(c_short))
+        self._result = c_int()
+
+    def process(self, frame=None):
+        """
+        Processes the next frame
+        :param frame: int16 array (frame_length, channels), read from the reader if not given
+        :return: result of porcupine.process, False if the capture has been stopped
+        """
+        if frame is None:
+            frame = self.reader.read(self.frame_length)
+            if frame is None:
+                return False
+        np.copyto(self.pcm, frame[:, self.channel])
+        if self._process_func is None or self._handle is None:
+            return self.porcupine.process(self.pcm.tolist())
+        status = self._process_func(self._handle, self._pcm_pointer, byref(self._result))
+        if status != self._success:
+            return self.porcupine.process(self.pcm.tolist())  # let porcupine raise its own exception
+        return self._result.value
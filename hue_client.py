@@ -0,0 +1,107 @@
+import re
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.exceptions import InsecureRequestWarning
+
+requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+
+
+class HueClient:
+    """
+    Talks to the hue bridge over one keep-alive session, so the tcp and tls handshakes are paid once and not for
+    every request. Every request has a timeout and is retried a few times if the bridge doesn't answer, then a
+    ConnectionError is raised, so a hung bridge never blocks the caller for longer than that. The latency of
+    every request is counted per endpoint.
+    """
+    def __init__(self, url, timeout=(2, 4), retries=2, backoff=0.1, pool_size=4, verify=False):
+        """
+        :param url: base url including the user token, e.g. https://192.168.0.1/api/XXX
+        :param timeout: seconds to connect and to wait for the answer (tuple) or both (float)
+        :param retries: number of retries after a failed request
+        :param backoff: seconds before the first retry, doubled for every next one
+        :param pool_size: number of connections kept open, e.g. gui and assistant thread at the same time
+        :param verify: check the certificate of the bridge (it's self signed)
+        """
+        self.url = url.rstrip('/')
+        self.timeout = tuple(timeout) if isinstance(timeout, (list, tuple)) else timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.verify = verify
+        self.session.mount(self.url, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0))
+        self.lock = threading.Lock()
+        self.counters = {}  # 'GET /groups/{}' -> dict
+
+    def get(self, path):
+        """
+        :param path: e.g. '/groups/1'
+        :return: the answer (json), a dict
+        """
+        result = self.request('GET', path)
+        if not isinstance(result, dict):
+            raise ConnectionError('hue bridge: GET {} did not answer with an object: {}'.format(path, result))
+        return result
+
+    def put(self, path, body):
+        """
+        :param path: e.g. '/groups/1/action'
+        :param body: dict, sent as json
+        :return: the answer (json), a list of successes and errors
+        """
+        result = self.request('PUT', path, body)
+        errors = [r['error'] for r in result if isinstance(r, dict) and 'error' in r]
+        if errors:
+            print('Hue bridge: {}'.format('; '.join(e.get('description', str(e)) for e in errors)))
+        return result
+
+    def request(self, method, path, body=None):
+        """
+        Sends a request, retries it if the bridge doesn't answer. The hue api sets states, so retrying a put
+        does no harm.
+        :param method: 'GET' or 'PUT'
+        :param path: relative to the url
+        :param body: dict, sent as json
+        :return: the answer (json)
+        :raises ConnectionError: if the bridge doesn't answer or answers only with errors (e.g. unauthorized user)
+        """
+        endpoint = '{} {}'.format(method, re.sub(r'/\d+', '/{}', path))
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.url + path, json=body, timeout=self.timeout)
+                response.raise_for_status()
+                result = response.json()
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError, ValueError) as e:
+                self._count(endpoint, time.perf_counter() - start, failed=True)
+                error = e
+                continue
+            self._count(endpoint, time.perf_counter() - start, retried=attempt > 0)
+            errors = [r['error'] for r in result if isinstance(r, dict) and 'error' in r] \
+                if isinstance(result, list) else []
+            if errors and len(errors) == len(result):  # status 200, but nothing worked, retrying won't help
+                raise ConnectionError('hue bridge: {}: {}'.format(
+                    endpoint, '; '.join(e.get('description', str(e)) for e in errors)))
+            return result
+        raise ConnectionError('hue bridge: {} failed {} times: {}'.format(endpoint, self.retries + 1, error))
+
+    def _count(self, endpoint, duration, failed=False, retried=False):
+        with self.lock:
+            counter = self.counters.setdefault(endpoint, {'requests': 0, 'failed': 0, 'retried': 0, 'total': 0.0,
+                                                          'max': 0.0})
+            counter['requests'] += 1
+            counter['failed'] += failed
+            counter['retried'] += retried
+            counter['total'] += duration
+            counter['max'] = max(counter['max'], duration)
+
+    def stats(self):
+        """:return: dict endpoint -> requests, failed, retried (succeeded after a retry), mean and max latency in s"""
+        with self.lock:
+            return {endpoint: {'requests': c['requests'], 'failed': c['failed'], 'retried': c['retried'],
+                               'mean': c['total'] / c['requests'], 'max': c['max']}
+                    for endpoint, c in self.counters.items()}
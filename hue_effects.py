@@ -0,0 +1,209 @@
+"""
+Timed light effects (alert, pulse, sunrise) without sleeping threads. An effect is a timeline of commands to a
+group, a timer wheel fires them one after the other and nobody waits in between. The bridge does the fading
+itself (transitiontime), the timeline only says when which target is set.
+"""
+import itertools
+import math
+import threading
+import time
+
+ALERT_LENGTH = 15  # seconds the bridge blinks after one 'lselect'
+
+
+class Effect:
+    """
+    A timeline of commands to a group
+    """
+    def __init__(self, name, steps, on_cancel=None):
+        """
+        :param name: for the messages
+        :param steps: list of (seconds from the start, body of the group action)
+        :param on_cancel: body sent if the effect is cancelled before the end, e.g. to stop blinking
+        """
+        self.name = name
+        self.steps = sorted(steps, key=lambda step: step[0])
+        self.on_cancel = on_cancel
+
+    @property
+    def duration(self):
+        return self.steps[-1][0] if self.steps else 0
+
+
+def alert(duration=5):
+    """
+    the lights blink, a long alert is renewed every ALERT_LENGTH seconds
+    :param duration: seconds
+    """
+    renewals = max(int(math.ceil(duration / ALERT_LENGTH)), 1)
+    steps = [(i * ALERT_LENGTH, {'alert': 'lselect'}) for i in range(renewals)]
+    return Effect('alert', steps + [(duration, {'alert': 'none'})], on_cancel={'alert': 'none'})
+
+
+def pulse(times=3, period=2, high=254, low=30):
+    """
+    the brightness goes up and down
+    :param times: number of pulses
+    :param period: seconds of one pulse, at least twice the group_interval of the command queue
+    :param high: brightness at the top (0-254)
+    :param low: brightness at the bottom
+    """
+    fade = int(period / 2 * 10)  # transitiontime is in 100 ms
+    steps = []
+    for i in range(times):
+        steps += [(i * period, {'bri': high, 'transitiontime': fade}),
+                  (i * period + period / 2, {'bri': low, 'transitiontime': fade})]
+    return Effect('pulse', steps)
+
+
+def sunrise(minutes=15, brightness=254, start_ct=500, end_ct=250, fade_after=3):
+    """
+    the lights come on very dim and warm and fade to bright and cold, the bridge does the fading
+    :param minutes: length of the sunrise, at most 109 (the longest transitiontime)
+    :param brightness: at the end (0-254)
+    :param start_ct: color temperature at the start (153-500)
+    :param end_ct: at the end
+    :param fade_after: seconds between switching on and starting the fade, more than the group_interval of the
+        command queue, otherwise the queue may merge both steps and the lights start bright
+    """
+    transition = min(int(minutes * 600), 65535)
+    return Effect('sunrise', [(0, {'on': True, 'bri': 1, 'ct': start_ct}),
+                              (fade_after, {'bri': brightness, 'ct': end_ct, 'transitiontime': transition})])
+
+
+class TimerWheel:
+    """
+    Timers in a hashed wheel: slots of tick seconds, a timer goes into the slot of its time and counts the rounds
+    still to go. Adding and cancelling cost the same no matter how many timers there are, one thread fires them
+    and sleeps while there is nothing to do.
+    """
+    def __init__(self, tick=0.1, slots=256):
+        """
+        :param tick: resolution in seconds
+        :param slots: number of slots, one round is tick * slots seconds
+        """
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.condition = threading.Condition()
+        self.position = 0  # the slot handled next
+        self.start = time.monotonic()
+        self.count = 0
+        self.fired = 0
+        self.thread = None
+
+    def schedule(self, delay, func):
+        """
+        :param delay: seconds from now
+        :param func: function without arguments, called in the thread of the wheel, it must not block
+        :return: timer, a list [func, rounds], cancel it with cancel()
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            if not self.count:  # the wheel stood still, continue from now
+                self.position = int((time.monotonic() - self.start) / self.tick)
+            ticks = max(int(round((time.monotonic() - self.start + delay) / self.tick)) - self.position, 0)
+            timer = [func, ticks // len(self.slots)]
+            self.slots[(self.position + ticks) % len(self.slots)].append(timer)
+            self.count += 1
+            self.condition.notify_all()
+        return timer
+
+    def cancel(self, timer):
+        """the timer won't fire, if it hasn't already"""
+        with self.condition:
+            if timer[0] is not None:
+                timer[0] = None
+                self.count -= 1
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.count > 0)
+                delay = self.start + self.position * self.tick - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, self.tick))
+                continue
+            with self.condition:
+                slot = self.slots[self.position % len(self.slots)]
+                due, waiting = [], []
+                for timer in slot:
+                    if timer[0] is None:  # cancelled
+                        continue
+                    if timer[1] == 0:
+                        due.append(timer[0])
+                        timer[0] = None
+                        self.count -= 1
+                    else:
+                        timer[1] -= 1
+                        waiting.append(timer)
+                slot[:] = waiting
+                self.position += 1
+            for func in due:
+                self.fired += 1
+                try:
+                    func()
+                except Exception as e:  # one broken effect must not stop the others
+                    print('Timer failed: {}'.format(e))
+
+
+class EffectPlayer:
+    """
+    Plays effects on groups with the timer wheel, one effect per group, a new one cancels the old one
+    """
+    def __init__(self, send, wheel=None):
+        """
+        :param send: function (group, body), must not block, e.g. queueing the command
+        :param wheel: TimerWheel
+        """
+        self.send = send
+        self.wheel = TimerWheel() if wheel is None else wheel
+        self.lock = threading.Lock()
+        self.playing = {}  # group -> (number, effect, timers)
+        self.numbers = itertools.count()
+
+    def play(self, group, effect):
+        """
+        starts the effect, returns right away
+        :param group: group id
+        :param effect: Effect
+        :return:
+        """
+        self.cancel(group)
+        number = next(self.numbers)
+        with self.lock:
+            timers = []
+            for i, (offset, body) in enumerate(effect.steps):
+                last = i == len(effect.steps) - 1
+                timers.append(self.wheel.schedule(offset, lambda body=body, last=last:
+                                                  self._step(group, number, body, last)))
+            self.playing[group] = number, effect, timers
+
+    def _step(self, group, number, body, last):
+        with self.lock:  # sending under the lock, so a cancel can't come in between and be overwritten
+            if group not in self.playing or self.playing[group][0] != number:  # cancelled meanwhile
+                return
+            if last:
+                del self.playing[group]
+            self.send(group, body)
+
+    def cancel(self, group):
+        """
+        stops the effect of the group, if one is playing
+        :return: True if one was playing
+        """
+        with self.lock:
+            playing = self.playing.pop(group, None)
+        if playing is None:
+            return False
+        number, effect, timers = playing
+        for timer in timers:
+            self.wheel.cancel(timer)
+        if effect.on_cancel is not None:
+            self.send(group, effect.on_cancel)
+        return True
+
+    def stats(self):
+        return {'playing': {group: p[1].name for group, p in self.playing.items()}, 'timers': self.wheel.count,
+                'fired': self.wheel.fired}
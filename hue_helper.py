@@ -1,51 +1,122 @@
-import requests
-from requests.packages.urllib3.exceptions import InsecureRequestWarning
-import json
-import time
 import pandas as pd
+from connection import LazyConnection
+from hue_client import HueClient
+from hue_state import HueState
+import hue_queue
+import hue_effects
 import config as cfg
 
-url = cfg.hue["user"]
-requests.packages.urllib3.disable_warnings(InsecureRequestWarning)
+client = HueClient(cfg.hue["user"], **cfg.hue['client'])
+
+
+def _resync(path, body):
+    """a command got lost, the state in memory is wrong until the next poll, so poll now"""
+    if HueHelper.bridge.ready:
+        HueHelper.bridge.value.refresh_soon()
+
+
+commands = hue_queue.HueCommandQueue(client, on_failure=_resync, **cfg.hue['queue'])
+
+
+def _send_effect_step(group_number, action):
+    """called by the timer wheel, must not wait for anything"""
+    commands.put('/groups/{}/action'.format(group_number), action, hue_queue.BACKGROUND)
+    if HueHelper.bridge.ready:
+        HueHelper.bridge.value.apply_action(group_number, action)
+
+
+effects = hue_effects.EffectPlayer(_send_effect_step)
+
+
+def _load_bridge():
+    """
+    gets the full state of the bridge (groups, lights and scenes) and keeps it up to date in the background
+    :return: HueState
+    """
+    return HueState(client, **cfg.hue['state']).start()
 
 
 class HueHelper:
     """
-    This class helps controlling Hue lights via a Hue bridge. Data is collected from the bridge and stored in
-    a pandas data frame
+    This class helps controlling Hue lights via a Hue bridge. The state of all groups, lights and scenes is kept
+    in memory (HueState), so reading doesn't ask the bridge. Changes go into the command queue and the state
+    right away, the queue sends them in the background. Nothing is requested at import, the bridge is connected
+    in the background.
     """
-    # get groups to switch on and off
-    r = requests.get(url+'/groups', verify=False)
-    groups_df = pd.DataFrame.from_dict(r.json(), orient='index')
-    groups_df = groups_df.loc[groups_df['type'] != 'Entertainment']
+    bridge = LazyConnection('hue bridge', _load_bridge)
 
-    def __init__(self, group_number=cfg.hue["standard_group"]):
-        r = requests.get(url+'/scenes', verify=False)
+    def __init__(self, group_number=cfg.hue["standard_group"], priority=hue_queue.GUI):
+        """
+        :param group_number: the default group
+        :param priority: of the commands in the queue, hue_queue.VOICE for the assistant
+        """
         self.group_number = group_number
-        self.scenes_df = pd.DataFrame.from_dict(r.json(), orient='index')
-        self.scenes_df = self.scenes_df.loc[self.scenes_df['group'] == str(self.group_number)]
-        self.scenes_df['name'] = self.scenes_df['name'].str.lower()
+        self.priority = priority
+        HueHelper.bridge.warm_up()
+
+    @property
+    def ready(self):
+        """True if the bridge is connected"""
+        return HueHelper.bridge.ready
+
+    @property
+    def state(self):
+        """HueState, waits for the connection"""
+        return HueHelper.bridge.get()
+
+    @property
+    def groups_df(self):
+        """groups of the bridge (without entertainment areas), waits for the connection"""
+        with self.state.lock:
+            groups_df = pd.DataFrame.from_dict(self.state.groups, orient='index')
+        return groups_df.loc[groups_df['type'] != 'Entertainment']
+
+    @property
+    def scenes_df(self):
+        """scenes of the default group, waits for the connection"""
+        with self.state.lock:
+            scenes_df = pd.DataFrame.from_dict(self.state.scenes, orient='index')
+        scenes_df['name'] = scenes_df['name'].str.lower()
+        return scenes_df.loc[scenes_df['group'] == str(self.group_number)]
+
+    def scene_names(self):
+        """:return: names of the scenes of all rooms (lower case, each once)"""
+        with self.state.lock:
+            return sorted({scene['name'].lower() for scene in self.state.scenes.values()})
+
+    def _put_action(self, group_number, action):
+        """queues the action for the group and applies it to the state, once the bridge is connected"""
+        commands.put('/groups/{}/action'.format(group_number), action, self.priority)
+        if HueHelper.bridge.ready:  # otherwise the state would block the caller, it is loaded with the connection
+            self.state.apply_action(group_number, action)
 
     def extract_scene_id_by_name(self, name):
         """
-        gets the id of the chosen scene
+        gets the id of the chosen scene, scenes of all rooms are searched. If several rooms have a scene with
+        that name, the one of the default group wins
         :param name: name of the scene you want to set
-        :return:
-        """
-        list_index = self.scenes_df.index[self.scenes_df['name'] == name].tolist()
-        if len(list_index) == 1:
-            return list_index[0]
+        :return: scene id and its group or False
+        """
+        scenes = self.state.find_scenes(name)
+        for scene_id, group in scenes:
+            if group == str(self.group_number):
+                return scene_id, group
+        if len(scenes) == 1:
+            return scenes[0]
         else:
             return False
 
-    def set_scene(self, scene_id):
+    def set_scene(self, scene_id, group_number=None):
         """
         sets the scene by ID
         :param scene_id: scene_id as defined by HUE
+        :param group_number: the group of the scene, if not specified, default group is used
         :return:
         """
-        _ = requests.put(url+'/groups/{}/action'.format(self.group_number),
-                         data=json.dumps({"on": True, "scene": scene_id}), verify=False)
+        if group_number is None:
+            group_number = self.group_number
+        self._put_action(group_number, {"on": True, "scene": scene_id})
+        self.state.refresh_soon()  # the colors of the scene are only known to the bridge
 
     def set_scene_by_name(self, name):
         """
@@ -53,16 +124,16 @@ class HueHelper:
         :param name: name of the scene you want to set
         :return:
         """
-        id = self.extract_scene_id_by_name(name)
-        if id:
-            self.set_scene(id)
+        scene = self.extract_scene_id_by_name(name)
+        if scene:
+            self.set_scene(*scene)
         
     def get_brightness(self):
         """
-        asks the current brightness level (0-255) of the default groupe
+        the current brightness level (0-255) of the default groupe
         :return: int value of brightness
         """
-        return int(requests.get(url+'/groups/{}'.format(self.group_number), verify=False).json()['action']['bri'])
+        return int(self.state.group(self.group_number)['action']['bri'])
 
     def reduce_brightness(self, multiplicator=0.7):
         """
@@ -72,8 +143,7 @@ class HueHelper:
         """
         brightness = self.get_brightness()
         new_brightness = brightness*multiplicator
-        requests.put(url+'/groups/{}/action'.format(self.group_number),
-                     data=json.dumps({"bri": int(new_brightness)}), verify=False)
+        self._put_action(self.group_number, {"bri": int(new_brightness)})
         
     def increase_brightness(self, multiplicator=0.7):
         """
@@ -85,7 +155,7 @@ class HueHelper:
         new_brightness = brightness/multiplicator
         if new_brightness > 254:
             new_brightness = 254
-        requests.put(url+'/groups/1/action', data=json.dumps({"bri": int(new_brightness)}), verify=False)
+        self._put_action(self.group_number, {"bri": int(new_brightness)})
 
     def set_brightness(self, value):
         """
@@ -97,17 +167,17 @@ class HueHelper:
             value = 254
         elif value < 0:
             value = 0
-        requests.put(url + '/groups/1/action', data=json.dumps({"bri": int(value)}), verify=False)
+        self._put_action(self.group_number, {"bri": int(value)})
 
     def get_temperature(self, group_number=None):
         """
         gets the temperature of the group
-        :param group_number: number of the group to request, if not specified, default group is used
+        :param group_number: number of the group, if not specified, default group is used
         return: temperature value
         """
         if group_number is None:
             group_number = self.group_number
-        return int(requests.get(url+'/groups/{}'.format(group_number), verify=False).json()['action']['ct'])
+        return int(self.state.group(group_number)['action']['ct'])
     
     def set_temperature(self, value, group_number=None):
         """
@@ -121,7 +191,7 @@ class HueHelper:
             value = 153
         if group_number is None:
             group_number = self.group_number
-        requests.put(url+'/groups/{}/action'.format(group_number), data=json.dumps({"ct": int(value)}), verify=False)
+        self._put_action(group_number, {"ct": int(value)})
     
     def turn_on(self, name):
         """
@@ -129,9 +199,9 @@ class HueHelper:
         :param name: name of the group
         :return:
         """
-        index = HueHelper.groups_df.index[HueHelper.groups_df['name'] == name].tolist()[0]
-        if index:
-            requests.put(url + '/groups/{}/action'.format(index), data=json.dumps({'on': True}), verify=False)
+        group_id = self.state.group_id(name)
+        if group_id is not None:
+            self._put_action(group_id, {'on': True})
 
     def turn_off(self, name):
         """
@@ -139,28 +209,43 @@ class HueHelper:
         :param name: name of the group
         :return:
         """
-        index = HueHelper.groups_df.index[HueHelper.groups_df['name'] == name].tolist()[0]
-        if index:
-            requests.put(url + '/groups/{}/action'.format(index), data=json.dumps({'on': False}), verify=False)
+        group_id = self.state.group_id(name)
+        if group_id is not None:
+            self._put_action(group_id, {'on': False})
 
     def get_status(self, name):
-        """gets on/off status of the group"""
-        index = HueHelper.groups_df.index[HueHelper.groups_df['name'] == name].tolist()[0]
-        return requests.get(url + '/groups/{}'.format(index), verify=False).json()['action']['on']
+        """gets on/off status of the group, None if there's no group with that name"""
+        group = self.state.group(self.state.group_id(name))
+        if group is None:
+            return None
+        return group['action']['on']
 
     def set_alert(self, duration=5, group_number=None):
         """
-        lets your light blinks
+        lets your light blinks, returns right away
         :param duration: duration of blinking in seconds
         :param group_number: of the lights to control
         :return:
         """
+        self.play_effect(hue_effects.alert(duration), group_number)
+
+    def play_effect(self, effect, group_number=None):
+        """
+        plays a timed effect (see hue_effects), replaces the one the group is playing, returns right away
+        :param effect: hue_effects.Effect, e.g. hue_effects.sunrise(minutes=20)
+        :param group_number: of the lights to control, if not specified, default group is used
+        :return:
+        """
+        if group_number is None:
+            group_number = self.group_number
+        effects.play(str(group_number), effect)
+
+    def stop_effect(self, group_number=None):
+        """
+        stops the effect of the group
+        :param group_number: if not specified, default group is used
+        :return: True if an effect was playing
+        """
         if group_number is None:
             group_number = self.group_number
-        if duration > 15:  # max value
-            duration = 15
-        requests.put(url + '/groups/{}/action'.format(group_number), data=json.dumps({'alert': 'lselect'}),
-                     verify=False)
-        time.sleep(duration)
-        requests.put(url + '/groups/{}/action'.format(group_number), data=json.dumps({'alert': 'none'}),
-                     verify=False)
+        return effects.cancel(str(group_number))
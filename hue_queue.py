@@ -0,0 +1,139 @@
+import itertools
+import threading
+import time
+
+# priorities, lower goes first
+VOICE = 0
+GUI = 1
+BACKGROUND = 2
+
+
+class Command:
+    def __init__(self, path, body, priority, number):
+        self.path = path
+        self.body = body
+        self.priority = priority
+        self.number = number  # order of arrival
+
+
+class HueCommandQueue:
+    """
+    Sends the puts to the hue bridge from a background thread, so nobody waits for the bridge. A command for a
+    group or light which still waits is merged with the new one (the latest value wins), e.g. 30 brightness
+    values of a dragged slider become one or two puts. The queue keeps to the rate limit of the bridge (about 10
+    commands per second, a group at most every group_interval seconds), voice commands go first and don't wait
+    for the group interval.
+    """
+    def __init__(self, client, rate=10, group_interval=1, max_pending=50, on_failure=None):
+        """
+        :param client: HueClient
+        :param rate: maximum commands per second
+        :param group_interval: minimum seconds between two commands to the same group, except for voice commands
+        :param max_pending: maximum number of waiting commands, the oldest background ones are dropped
+        :param on_failure: function (path, body), called if a command can't be sent
+        """
+        self.client = client
+        self.rate = rate
+        self.group_interval = group_interval
+        self.max_pending = max_pending
+        self.on_failure = on_failure
+        self.condition = threading.Condition()
+        self.pending = {}  # path -> Command
+        self.last_sent = {}  # path -> time.monotonic()
+        self.next_slot = 0  # time.monotonic() when the next command may go out
+        self.numbers = itertools.count()
+        self.sending = False
+        self.counters = {'queued': 0, 'sent': 0, 'coalesced': 0, 'dropped': 0, 'failed': 0}
+        self.thread = None
+
+    def put(self, path, body, priority=BACKGROUND):
+        """
+        Queues a command, returns right away
+        :param path: e.g. '/groups/1/action'
+        :param body: dict
+        :param priority: VOICE, GUI or BACKGROUND
+        :return:
+        """
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+            self.counters['queued'] += 1
+            waiting = self.pending.get(path)
+            if waiting is not None:
+                self.counters['coalesced'] += 1
+                if 'scene' in body:  # the scene sets everything anew
+                    waiting.body = dict(body)
+                else:
+                    waiting.body.update(body)
+                waiting.priority = min(waiting.priority, priority)
+            else:
+                self.pending[path] = Command(path, dict(body), priority, next(self.numbers))
+                if len(self.pending) > self.max_pending:
+                    oldest = max(self.pending.values(), key=lambda c: (c.priority, -c.number))
+                    del self.pending[oldest.path]
+                    self.counters['dropped'] += 1
+            self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        waits until everything is sent
+        :param timeout: seconds
+        :return: True if nothing is waiting any more
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.pending and not self.sending, timeout)
+
+    def _due(self, command):
+        """:return: time.monotonic() from when on the command may be sent"""
+        if command.priority == VOICE or not command.path.startswith('/groups/'):
+            return 0
+        return self.last_sent.get(command.path, -self.group_interval) + self.group_interval
+
+    def _next(self, now):
+        """:return: the command to send now (or None) and the seconds until the next one may be sent"""
+        if not self.pending:
+            return None, None
+        ready = [c for c in self.pending.values() if self._due(c) <= now]
+        if not ready:
+            return None, min(self._due(c) for c in self.pending.values()) - now
+        if now < self.next_slot:
+            return None, self.next_slot - now
+        return min(ready, key=lambda c: (c.priority, c.number)), 0
+
+    def _run(self):
+        while True:
+            with self.condition:
+                command, wait = self._next(time.monotonic())
+                while command is None:
+                    self.condition.wait(wait)
+                    command, wait = self._next(time.monotonic())
+                del self.pending[command.path]
+                self.sending = True
+                now = time.monotonic()
+                self.last_sent[command.path] = now
+                self.next_slot = now + 1 / self.rate
+            failed = True
+            try:
+                self.client.put(command.path, command.body)
+                failed = False
+            except Exception as e:  # the sender thread must not die, or nothing is sent any more
+                print('Cannot send {} to the hue bridge: {}'.format(command.path, e))
+            finally:
+                with self.condition:
+                    self.sending = False
+                    self.counters['failed' if failed else 'sent'] += 1
+                    self.condition.notify_all()
+            if failed and self.on_failure is not None:
+                try:
+                    self.on_failure(command.path, command.body)
+                except Exception as e:
+                    print('Hue command queue: on_failure failed: {}'.format(e))
+
+    def stats(self):
+        """
+        :return: dict with the number of queued, sent, coalesced (merged into a waiting one), dropped and failed
+            commands and the number waiting
+        """
+        with self.condition:
+            return dict(self.counters, pending=len(self.pending))
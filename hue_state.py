@@ -0,0 +1,134 @@
+import threading
+import time
+
+
+class HueState:
+    """
+    All groups, lights and scenes of the bridge in memory. It starts from one snapshot of the full state, after
+    that a background thread polls groups and lights every interval seconds (the scenes more rarely) and applies
+    what changed. Everyone reads from memory, writes are applied optimistically right after they were sent, so
+    a poll which started before the write doesn't undo them.
+    """
+    def __init__(self, client, interval=5, scenes_interval=300):
+        """
+        :param client: HueClient
+        :param interval: seconds between two polls of groups and lights
+        :param scenes_interval: seconds between two polls of the scenes
+        """
+        self.client = client
+        self.interval = interval
+        self.scenes_interval = scenes_interval
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.groups = {}  # id -> dict as the bridge sends it
+        self.lights = {}
+        self.scenes = {}
+        self.written = {}  # ('groups', id) -> time.monotonic() of the last write
+        self.version = 0  # changes if groups or scenes are added, removed or renamed
+        self.polls = 0
+        self.changes = 0
+        self.scenes_polled = 0
+        self.thread = None
+        start = time.monotonic()
+        full = client.get('')  # groups, lights, scenes, config, rules, ... in one request
+        for kind in ('groups', 'lights', 'scenes'):
+            self._apply(kind, full[kind], start)
+        self.scenes_polled = start
+
+    def start(self):
+        """starts polling in the background"""
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def refresh_soon(self):
+        """polls right away instead of after the interval, e.g. after setting a scene"""
+        self.wake.set()
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.poll()
+            except Exception as e:  # keep the last state, try again next time, the thread must not die
+                print('Cannot poll the hue bridge: {}'.format(e))
+
+    def poll(self):
+        """gets groups and lights and, if it's time, the scenes and applies the changes"""
+        start = time.monotonic()
+        self._apply('groups', self.client.get('/groups'), start)
+        self._apply('lights', self.client.get('/lights'), start)
+        if start - self.scenes_polled > self.scenes_interval:
+            self._apply('scenes', self.client.get('/scenes'), start)
+            self.scenes_polled = start
+        self.polls += 1
+
+    def _apply(self, kind, new, start):
+        """
+        :param kind: 'groups', 'lights' or 'scenes'
+        :param new: dict id -> dict from the bridge
+        :param start: time.monotonic() when the request was sent, later writes win
+        :return: ids which changed
+        """
+        with self.lock:
+            current = getattr(self, kind)
+            changed = [i for i, value in new.items() if current.get(i) != value
+                       and self.written.get((kind, i), 0) < start]
+            removed = [i for i in current if i not in new]
+            if kind != 'lights' and (removed or any(i not in current or current[i].get('name') != new[i].get('name')
+                                                    for i in changed)):
+                self.version += 1
+            for i in changed:
+                current[i] = new[i]
+            for i in removed:
+                del current[i]
+            self.changes += len(changed) + len(removed)
+        return changed + removed
+
+    def apply_action(self, group_id, action):
+        """
+        Applies a successful put to /groups/<id>/action to the group and its lights
+        :param group_id: str
+        :param action: dict as sent to the bridge
+        :return:
+        """
+        now = time.monotonic()
+        state = {key: value for key, value in action.items() if key not in ('scene', 'alert', 'transitiontime')}
+        with self.lock:
+            group = self.groups.get(str(group_id))
+            light_ids = self.lights if str(group_id) == '0' else (group['lights'] if group else [])
+            if group is not None:
+                group['action'].update(state)
+                if 'on' in state:
+                    group['state'] = {'any_on': state['on'], 'all_on': state['on']}
+                self.written[('groups', str(group_id))] = now
+            for light_id in light_ids:
+                if light_id in self.lights:
+                    self.lights[light_id]['state'].update(state)
+                    self.written[('lights', light_id)] = now
+
+    def group(self, group_id):
+        """:return: the group dict, None if there's none with that id"""
+        return self.groups.get(str(group_id))
+
+    def group_id(self, name):
+        """:return: id of the group with that name, None if there's none"""
+        with self.lock:
+            for group_id, group in self.groups.items():
+                if group['name'] == name:
+                    return group_id
+        return None
+
+    def find_scenes(self, name):
+        """
+        :param name: of the scene, lower case
+        :return: list of (scene id, group id) of all rooms, group id '0' (all lights) for light scenes
+        """
+        with self.lock:
+            return [(scene_id, scene.get('group', '0')) for scene_id, scene in self.scenes.items()
+                    if scene['name'].lower() == name]
+
+    def stats(self):
+        return {'groups': len(self.groups), 'lights': len(self.lights), 'scenes': len(self.scenes),
+                'polls': self.polls, 'changes': self.changes}
@@ -0,0 +1,135 @@
+from collections import defaultdict
+import config as cfg
+
+
+def edit_distance(a, b):
+    """
+    Levenshtein distance of two words
+    :param a: word (str)
+    :param b: word (str)
+    :return: number of inserted, deleted or replaced characters to get from a to b
+    """
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def _deletes(word, distance):
+    """all variants of the word with up to distance characters deleted (including the word itself)"""
+    variants = {word}
+    for _ in range(distance):
+        variants |= {v[:i] + v[i + 1:] for v in variants for i in range(len(v))}
+    return variants
+
+
+class IntentIndex:
+    """
+    Finds the command, activity and hue scene in the transcribed words. Built once from the config (and the
+    scenes of the bridge), every word points to the phrases it appears in, so matching only looks at the words
+    spoken instead of going through all commands. Words deepspeech got slightly wrong ('brightnes', 'darkar')
+    are corrected to the closest known word, as long as it is within max_distance and unambiguous.
+    """
+    def __init__(self, commands, activities=(), scenes=(), max_distance=1, min_length=5):
+        """
+        :param commands: dict function name -> list of hotword sets, like cfg.commands
+        :param activities: names of the activities (one word each)
+        :param scenes: names of the hue scenes (lower case)
+        :param max_distance: edit distance up to which an unknown word is corrected, 0 switches it off
+        :param min_length: shorter words are never corrected, there are too many similar ones
+        """
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.phrases = []  # (kind, name, number of words), the order of the config decides between commands
+        self.index = defaultdict(list)  # word -> ids of the phrases containing it
+        for func_name, hotwords in commands.items():
+            for command in hotwords:
+                self._add('command', func_name, command)
+        for activity in activities:
+            self._add('activity', activity, {activity})
+        for scene in scenes:
+            self._add('scene', scene, set(scene.split()))
+        self.index = dict(self.index)
+        # symmetric delete lookup: a word and its misspelling share a variant with some characters deleted
+        self.deletes = defaultdict(set)
+        if max_distance > 0:
+            for word in self.index:
+                if len(word) >= min_length:
+                    for variant in _deletes(word, max_distance):
+                        self.deletes[variant].add(word)
+        self.deletes = dict(self.deletes)
+        self.corrections = {}
+
+    def _add(self, kind, name, words):
+        for word in words:
+            self.index[word].append(len(self.phrases))
+        self.phrases.append((kind, name, len(words)))
+
+    def correct(self, word):
+        """
+        :param word: spoken word
+        :return: the known word it (probably) is, None if there is none
+        """
+        if word in self.index:
+            return word
+        if word in self.corrections:
+            return self.corrections[word]
+        known = None
+        if self.max_distance > 0 and len(word) >= self.min_length:
+            candidates = set()
+            for variant in _deletes(word, self.max_distance):
+                candidates |= self.deletes.get(variant, set())
+            scored = sorted((edit_distance(word, c), c) for c in candidates)
+            scored = [s for s in scored if s[0] <= self.max_distance]
+            if len(scored) == 1 or (len(scored) > 1 and scored[0][0] < scored[1][0]):
+                known = scored[0][1]
+        if len(self.corrections) > 10000:  # the same few misrecognitions come again and again
+            self.corrections.clear()
+        self.corrections[word] = known
+        return known
+
+    def match(self, words):
+        """
+        :param words: the spoken words (iterable of str)
+        :return: dict with the 'command' (first in the config), the 'activity' and the 'scene' (only if exactly
+            one was spoken, the longest name wins) or None each, and the corrected 'words'
+        """
+        known = {self.correct(w) for w in words}
+        known.discard(None)
+        hits = defaultdict(int)
+        for word in known:
+            for phrase in self.index[word]:
+                hits[phrase] += 1
+        result = {'words': known, 'command': None, 'activity': None, 'scene': None}
+        command = None
+        longest = {'activity': 0, 'scene': 0}
+        names = {'activity': set(), 'scene': set()}
+        for phrase, n in hits.items():
+            kind, name, length = self.phrases[phrase]
+            if n != length:
+                continue
+            if kind == 'command':
+                if command is None or phrase < command:
+                    command = phrase
+            elif length > longest[kind]:
+                longest[kind], names[kind] = length, {name}
+            elif length == longest[kind]:
+                names[kind].add(name)
+        if command is not None:
+            result['command'] = self.phrases[command][1]
+        for kind in ('activity', 'scene'):
+            if len(names[kind]) == 1:
+                result[kind] = names[kind].pop()
+        return result
+
+
+def create_intent_index(scenes=()):
+    """
+    Builds the index from the commands and activities of the config
+    :param scenes: names of the hue scenes, if the bridge is connected
+    :return: IntentIndex
+    """
+    return IntentIndex(cfg.commands, cfg.assistant['activities'], scenes, **cfg.assistant['intents'])
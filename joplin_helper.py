@@ -2,17 +2,31 @@ import requests
 import subprocess
 import sqlite3
 import config as cfg
+from connection import LazyConnection
 
 
-class JoplinHelper:
+def _start_server():
     """
-    Class to communicate via the joplin api to store and extract notes.
+    starts the joplin server (the api) unless it is already running
+    :return: None
     """
-
+    try:  # already answering, e.g. the stand-in of standins.py, which has no joplin to ask
+        if requests.get(cfg.joplin['url'] + 'ping', timeout=2).text == 'JoplinClipperServer':
+            return
+    except requests.exceptions.RequestException:
+        pass
     proc = subprocess.Popen(["joplin", "server", "status"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE,)
-    out = proc.stdout.read()
+    out = proc.communicate(timeout=30)[0]
     if 'not' in (str(out).split()):  # Server is not yet running
-        proc = subprocess.Popen(["joplin", "server", "start"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE,)
+        subprocess.Popen(["joplin", "server", "start"], stderr=subprocess.STDOUT, stdout=subprocess.PIPE,)
+
+
+class JoplinHelper:
+    """
+    Class to communicate via the joplin api to store and extract notes. The server is started in the background
+    on first use, not at import.
+    """
+    server = LazyConnection('joplin server', _start_server, timeout=30)
     token = cfg.joplin['token']
     url = cfg.joplin['url']
     params = {'fields':'id, title, body, is_todo', 'token': token}
@@ -41,12 +55,16 @@ class JoplinHelper:
         """
         notes_all = {'tag': [], 'todo': [], 'content': []}
         try:
+            cls.server.get()
             notes_tag = requests.get(cls.url+'search?query=tag:{}'.format(search_word), cls.params).json()
             notes = requests.get(cls.url+'search?query={}'.format(search_word), cls.params).json()
             print(notes)
         except requests.exceptions.ConnectionError:
             print('Connection Error')
             return notes_all
+        except ConnectionError as e:
+            print(e)
+            return notes_all
         notes_all['tag'] += notes_tag['items']
         if 'items' in notes.keys():
             for note in notes['items']:
@@ -65,8 +83,11 @@ class JoplinHelper:
         :param notebook: notebook to store the note in (str)
         :param is_todo: whether or not the note is a todo (bool)
         :return:
+        :raises: ConnectionError or requests.exceptions.RequestException if the note could not be written
         """
+        cls.server.get()
         results = requests.get(cls.url+'search?query={}&type=folder'.format(notebook), {'token': cls.token}).json()
         notebook_id = results['items'][0]['id']
         result = requests.post(cls.url+'notes?token='+cls.token,
                                json={"title": title, "body": note, "parent_id": notebook_id, 'is_todo':is_todo})
+        result.raise_for_status()  # the note spool tries again later
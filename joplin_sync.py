@@ -0,0 +1,121 @@
+import subprocess
+import threading
+import time
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class SyncCoordinator(QObject):
+    """
+    Runs 'joplin sync' in the background. Requests are debounced and coalesced: notes taken one after the other
+    cause one sync, there is never more than one sync running and at least min_interval seconds between two.
+    Nobody waits for it except flush() at shut down. The status is emitted for the gui.
+    """
+    status_signal = pyqtSignal(str)  # text for the gui
+    finished_signal = pyqtSignal(bool, float)  # success, duration in s
+
+    def __init__(self, command=('joplin', 'sync'), debounce=5, min_interval=60, timeout=600, parent=None):
+        """
+        :param command: the sync command
+        :param debounce: seconds without new requests before the sync starts
+        :param min_interval: minimum seconds from the end of one sync to the start of the next
+        :param timeout: seconds after which a hanging sync is killed
+        :param parent: QObject
+        """
+        QObject.__init__(self, parent)
+        self.command = list(command)
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.requested = None  # time of the latest request not yet synced
+        self.urgent = False
+        self.running = False
+        self.last_end = 0
+        self.last_success = None
+        self.last_duration = None
+        self.syncs = 0
+        self.requests = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, urgent=False):
+        """
+        Asks for a sync, returns right away
+        :param urgent: skip the debounce and the minimum interval, e.g. at startup
+        :return:
+        """
+        with self.condition:
+            self.requests += 1
+            self.requested = time.time()
+            self.urgent = self.urgent or urgent
+            self.condition.notify_all()
+            running = self.running
+        if not running:
+            self.status_signal.emit('Joplin: sync pending')
+
+    def flush(self, timeout=None):
+        """
+        Syncs now, if anything has been requested, and waits for it, e.g. before shutting down
+        :param timeout: seconds to wait
+        :return: True if everything is synced
+        """
+        with self.condition:
+            if self.requested is not None:
+                self.urgent = True
+                self.condition.notify_all()
+            return self.condition.wait_for(lambda: self.requested is None and not self.running, timeout)
+
+    def _due(self):
+        """seconds until the requested sync may start, None if nothing is requested"""
+        if self.requested is None:
+            return None
+        if self.urgent:
+            return 0
+        return max(self.requested + self.debounce, self.last_end + self.min_interval) - time.time()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self._due() is None or self._due() > 0:
+                    self.condition.wait(self._due())
+                self.requested = None
+                self.urgent = False
+                self.running = True
+            start = time.time()
+            success = False
+            try:
+                self.status_signal.emit('Joplin: syncing...')
+                success = self._sync()
+            except Exception as e:  # the thread must survive, or no note would be synced anymore
+                print('joplin sync failed: {}'.format(e))
+            finally:
+                duration = time.time() - start
+                with self.condition:
+                    self.running = False
+                    self.last_end = time.time()
+                    self.last_success, self.last_duration = success, duration
+                    self.syncs += 1
+                    self.condition.notify_all()
+            try:
+                self.status_signal.emit('Joplin: {} at {} ({:.0f} s)'.format(
+                    'synced' if success else 'sync failed', time.strftime('%H:%M'), duration))
+                self.finished_signal.emit(success, duration)
+            except Exception as e:
+                print('Cannot report the joplin sync: {}'.format(e))
+
+    def _sync(self):
+        try:
+            proc = subprocess.Popen(self.command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        except OSError as e:
+            print('Cannot start joplin sync: {}'.format(e))
+            return False
+        try:
+            out = proc.communicate(timeout=self.timeout)[0]
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            print('joplin sync took longer than {} s, killed it'.format(self.timeout))
+            return False
+        if proc.returncode != 0:
+            print('joplin sync failed: {}'.format(out.decode(errors='replace').strip()))
+        return proc.returncode == 0
@@ -1,30 +1,199 @@
-from gpiozero import LED
-from apa102_pi.driver.apa102 import APA102  # for LEDs
 import numpy as np
-from time import sleep
+import time
 import threading
 
+import hardware
+
+NUM_LEDS = 12
+# layers from bottom to top, a pixel of a higher layer covers the ones below
+LAYERS = ('standby', 'thermometer', 'listening', 'thinking', 'wheel', 'shutdown')
+
+
+def static_frame(pixels, num_leds=NUM_LEDS):
+    """
+    A single frame, shape (1, leds, 4): red, green, blue, bright_percent. Pixels not given are transparent
+    (bright_percent -1), i.e., the layers below shine through
+    :param pixels: dict led number -> (r, g, b, bright_percent)
+    :param num_leds: number of leds of the strip
+    :return: numpy array
+    """
+    frame = np.full((1, num_leds, 4), -1.0)
+    for led, value in pixels.items():
+        frame[0, led] = value
+    return frame
+
+
+def thinking_frames(max_values, fps, f=0.75, num_leds=NUM_LEDS):
+    """
+    all leds pulse sinusoidally, one period
+    :param max_values: rgb amplitude of the sine
+    :param fps: frames per second
+    :param f: frequency of the sine
+    :return: numpy array (frames, leds, 4)
+    """
+    sin = np.sin(f * 2 * np.pi * np.arange(0, 1 / f, 1 / fps))
+    rgb = np.floor(0.5 * np.outer(sin, max_values) + 0.5 * np.asarray(max_values))
+    frames = np.empty((len(sin), num_leds, 4))
+    frames[:, :, :3] = rgb[:, None, :]
+    frames[:, :, 3] = 100
+    return frames
+
+
+def color_wheel_frames(colors, bright_percent=10):
+    """
+    leds going on clockwise one after the other, then off again, one frame each
+    :param colors: rgb tuple for every led
+    :return: numpy array (2 * leds, leds, 4)
+    """
+    colors = np.asarray(colors)
+    num_leds = len(colors)
+    frames = np.zeros((2 * num_leds, num_leds, 4))
+    frames[:, :, 3] = bright_percent
+    for i in range(num_leds):
+        frames[i, :i + 1, :3] = colors[:i + 1]
+        frames[num_leds + i, i + 1:, :3] = colors[i + 1:]
+    return frames
+
+
+class Animation:
+    def __init__(self, frames, fps, loop):
+        self.frames = frames
+        self.fps = fps
+        self.loop = loop
+        self.start = time.perf_counter()
+
+    def frame(self, now):
+        """
+        :param now: time.perf_counter()
+        :return: the frame to show now and if the next one will be different
+        """
+        i = int((now - self.start) * self.fps)
+        if self.loop:
+            return self.frames[i % len(self.frames)], len(self.frames) > 1
+        return self.frames[min(i, len(self.frames) - 1)], i < len(self.frames) - 1
+
 
 class LedHelper:
     """
     Class to control the LEDs on the seeedstudio sound/LED card for the blueberry assistant.
     Functions are simply different ways of how the LEDs blink to give feedback for the user.
+
+    One compositor thread owns the strip. Everyone else only posts animations (precomputed numpy frames) into
+    one of the LAYERS and returns right away. The thread stacks the layers at a fixed frame rate and only talks
+    to the strip if something changed, and then only sets the pixels which changed.
     """
-    power = LED(5)
-    power.on()
-    leds = APA102(12)
-    leds.clear_strip()
-    led_lock = threading.Lock()
     color_wheel_values = {0: (255,0,0), 1: (255,127,0), 2: (255,255,0), 3:(127, 255, 0), 4: (0,255,0), 5: (0,255,127),
                           6: (0,255,255), 7: (0,127,255), 8: (0,0,255), 9: (127,0,255), 10: (255,0, 255),
                           11: (255,0,127)}
 
-    def __init__(self):
+    def __init__(self, fps=30):
+        """
+        :param fps: frame rate of the compositor
+        """
+        self.fps = fps
+        self.power = hardware.create_pin(5)
+        self.power.on()
+        self.leds = hardware.create_led_strip(NUM_LEDS)
+        self.leds.clear_strip()
         self.standby_leds = [3, 4, 5, 6]
+        self.thermo_leds = (9, 10, 11, 0)
         self.thinking_max_values = (0, 0, 255 - 16)
         self.listening_led_values = (12, 0, 192)
         self.standby_led_values = (8, 8, 8)
         self.thermo_led_value = 32
+        self._precompute()
+        self.layers = {}  # layer -> Animation
+        self.changed = threading.Event()
+        self.running = True
+        self.shown = np.zeros((NUM_LEDS, 4))  # what the strip shows right now
+        self.frames_shown = 0
+        self.pixels_set = 0
+        self.errors = 0  # failed frames, e.g. a broken animation or spi write
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _precompute(self):
+        """the animations for the current colors"""
+        self.standby_frames = static_frame({i: (*self.standby_led_values, 25) for i in self.standby_leds})
+        self.listening_frames = static_frame({i: (*self.listening_led_values, 100) for i in range(NUM_LEDS)})
+        self.thinking_frames = thinking_frames(self.thinking_max_values, fps=20)
+
+    def play(self, layer, frames, fps=1, loop=True):
+        """
+        Shows an animation in a layer, replaces the one which was there before
+        :param layer: one of LAYERS
+        :param frames: numpy array (frames, leds, 4) with red, green, blue and bright_percent, -1 is transparent
+        :param fps: frames per second of the animation
+        :param loop: start again at the end, otherwise the last frame stays
+        :return:
+        """
+        current = self.layers.get(layer)
+        if current is not None and current.frames is frames:  # e.g. the standby leds, set every loop
+            return
+        self.layers[layer] = Animation(frames, fps, loop)
+        self.changed.set()
+
+    def clear(self, layer):
+        """removes the animation of the layer"""
+        if self.layers.pop(layer, None) is not None:
+            self.changed.set()
+
+    def compose(self, now):
+        """
+        :param now: time.perf_counter()
+        :return: the frame of all layers stacked, shape (leds, 4), and if it is animated
+        """
+        frame = np.zeros((NUM_LEDS, 4))
+        animated = False
+        layers = dict(self.layers)
+        for name in LAYERS:
+            animation = layers.get(name)
+            if animation is None:
+                continue
+            top, moving = animation.frame(now)
+            animated = animated or moving
+            visible = top[:, 3] >= 0
+            frame[visible] = top[visible]
+        return frame, animated
+
+    def _run(self):
+        while self.running:
+            self.changed.clear()
+            try:
+                frame, animated = self.compose(time.perf_counter())
+                dirty = np.flatnonzero(np.any(frame != self.shown, axis=1))
+                if len(dirty):
+                    for i in dirty:
+                        r, g, b, bright = frame[i]
+                        self.leds.set_pixel(int(i), int(r), int(g), int(b), bright_percent=bright)
+                    self.leds.show()
+                    self.pixels_set += len(dirty)
+                    self.shown = frame
+                    self.frames_shown += 1
+            except Exception as e:  # keep the compositor alive, try again after a second
+                self.errors += 1
+                print('Cannot show the leds: {}'.format(e))
+                self.changed.wait(1)
+                continue
+            if animated:
+                self.changed.wait(1 / self.fps)
+            else:  # nothing moves, sleep until something is posted
+                self.changed.wait()
+
+    def stats(self):
+        """:return: dict with the frames sent to the strip, the pixels set and the spi bytes, in total and per s"""
+        seconds = time.perf_counter() - self.start_time
+        spi = self.frames_shown * hardware.spi_bytes(NUM_LEDS)
+        return {'frames': self.frames_shown, 'pixels_set': self.pixels_set, 'spi_bytes': spi, 'errors': self.errors,
+                'frames_per_s': self.frames_shown / seconds, 'spi_bytes_per_s': spi / seconds}
+
+    def stop(self):
+        """stops the compositor and switches the leds off"""
+        self.running = False
+        self.changed.set()
+        self.thread.join(1)
+        self.leds.clear_strip()
 
     def set_night_lights(self):
         """
@@ -35,6 +204,9 @@ class LedHelper:
         self.listening_led_values = (32, 4, 0)
         self.standby_led_values = (8, 8, 0)
         self.thermo_led_value = 4
+        self._precompute()
+        if 'standby' in self.layers:
+            self.play('standby', self.standby_frames)
 
     def set_listening_leds(self, rgb=None):
         """
@@ -43,82 +215,49 @@ class LedHelper:
         :return:
         """
         if rgb is None:
-            rgb = self.listening_led_values
-        self.leds.clear_strip()
-        for i in range(12):
-            self.leds.set_pixel(i, *rgb)
-        self.leds.show()
+            self.play('listening', self.listening_frames)
+        else:
+            self.play('listening', static_frame({i: (*rgb, 100) for i in range(NUM_LEDS)}))
 
     def set_shutdown_leds(self, rgb=(2, 1, 0)):
-        self.leds.clear_strip()
-        for i in range(12):
-            self.leds.set_pixel(i, *rgb)
-        self.leds.show()
+        self.play('shutdown', static_frame({i: (*rgb, 100) for i in range(NUM_LEDS)}))
 
-    def set_thinking_leds(self, stop, interval=1 / 20, f=0.75, max_values=None):
-        """
-        Leds blink sinusoidally to indicate the blueberry assistant is thinking
-        :param stop: (bool) to end the thread
-        :param interval: pause in between steps
-        :param f: frequency of the sine
-        :param max_values: amplitude of the sine
-        :return:
+    def start_thinking_leds(self):
+        """Leds blink sinusoidally to indicate the blueberry assistant is thinking, until stop_thinking_leds"""
+        self.play('thinking', self.thinking_frames, fps=20)
+
+    def stop_thinking_leds(self):
+        self.clear('thinking')
+
+    def set_standby_leds(self):
+        """four leds indicating blueberry is in standby"""
+        self.play('standby', self.standby_frames)
+
+    def start_color_wheel(self, rgb=None):
         """
-        if max_values is None:
-            max_values = self.thinking_max_values
-        ts = np.arange(0, 1 / f, interval)
-        sin = np.sin(f * 2 * np.pi * ts)
-        while True:
-            for s in sin:
-                r = 0.5 * max_values[0] * s + 0.5 * max_values[0]
-                g = 0.5 * max_values[1] * s + 0.5 * max_values[1]
-                b = 0.5 * max_values[2] * s + 0.5 * max_values[2]
-                for i in range(12):  # standby_leds:
-                    self.leds.set_pixel(i, int(r), int(g), int(b), bright_percent=100)
-                self.leds.show()
-                sleep(interval)
-            if stop():
-                break
-
-    def set_standby_leds(self, standby_led_values=None):
-        """
-        four leds indicating blueberry is in standby
-        :param standby_led_values:
+        leds start going on clockwise to symbolize a loading, until clear('wheel')
+        :param rgb: color of the LEDS (rgb) tuple, default: all colors of the wheel
         :return:
         """
-        if standby_led_values is None:
-            standby_led_values = self.standby_led_values
-        for i in self.standby_leds:
-                self.leds.set_pixel(i, *standby_led_values, bright_percent=25)
-                self.leds.show()
+        if rgb is None:
+            colors = [self.color_wheel_values[i] for i in range(NUM_LEDS)]
+        else:
+            colors = [rgb] * NUM_LEDS
+        self.play('wheel', color_wheel_frames(colors), fps=1)
 
-    def run_color_wheel(self, stop, rgb=None):
+    def show_temperature(self, temperature, good_temperature):
         """
-        leds start going on clockwise to symbolize a loading
-        :param stop: (bool) to end the thread
-        :param rgb: color of the LEDS (rgb) tuple
+        Converts the measured temperature into the LED colorcode. At good temp all 4 leds shine green.
+        If it's colder the LEDs change to blue, one for each degree. If it's warmer, they change to red.
+        :param temperature: measured temperature
+        :param good_temperature: the one you feel well at
         :return:
         """
-        if rgb is None:
-            rgb = self.color_wheel_values
-        else:
-            rgb = [rgb]*12
-        self.leds.clear_strip()
-        while True:
-            for i in np.arange(12):
-                if stop():
-                    break
-                for j in np.arange(i+1):
-                    self.leds.set_pixel(j, *rgb[j], bright_percent=10)
-                self.leds.show()
-                sleep(1)
-            for i in np.arange(12):
-                if stop():
-                    break
-                for j in np.arange(i+1):
-                    self.leds.set_pixel(j, 0,0,0, bright_percent=10)
-                self.leds.show()
-                sleep(1)
-            if stop():
-                break
-        self.leds.clear_strip()
+        difference = int(np.clip(np.rint(temperature - good_temperature), -4, 4))
+        value = self.thermo_led_value
+        colors = [(0, value, 0)] * 4
+        if difference < 0:
+            colors = [(0, 0, value)] * -difference + [(0, value, 0)] * (4 + difference)
+        elif difference > 0:
+            colors = [(0, value, 0)] * (4 - difference) + [(value, 0, 0)] * difference
+        self.play('thermometer', static_frame({led: (*c, 0.1) for led, c in zip(self.thermo_leds, colors)}))
@@ -1,11 +1,13 @@
 import sys, os
-from gui import Window
-from PyQt5.QtWidgets import QApplication
 
 
 if __name__ == "__main__":
+    # imported here, not at the top: the stt worker process is spawned and imports this module again, it must
+    # not load the gui, the assistant and the leds a second time
+    from gui import Window
+    from PyQt5.QtWidgets import QApplication
     os.system('xset dpms 60 60 60')
     app = QApplication(sys.argv)
     window = Window()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
@@ -0,0 +1,102 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+import numpy as np
+
+
+class NoteSpool:
+    """
+    Notes on their way from the microphone to joplin. As soon as a note is recorded, the audio is written into
+    the spool directory and the assistant goes back to listening for the hotword. A background thread transcribes
+    it, writes it into joplin and only then removes it from the spool, so a note survives a crash or a restart
+    in between and is finished after the next start.
+
+    Every note is a json file (and the audio as .npy until it is transcribed), named by the time it was taken.
+    """
+    def __init__(self, path, transcribe, write, retry_interval=30, max_retry_interval=900):
+        """
+        :param path: spool directory, created if needed
+        :param transcribe: function audio (int16 numpy array) -> text
+        :param write: function (text, is_todo) storing the note, raises if it can't
+        :param retry_interval: seconds until a failed note is tried again, doubled on every failure
+        :param max_retry_interval: maximum seconds between two tries
+        """
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self.transcribe = transcribe
+        self.write = write
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.queue = queue.Queue()
+        self.failures = {}  # note id -> number of failed tries
+        self.thread = None
+
+    def _file(self, note_id, extension):
+        return os.path.join(self.path, note_id + extension)
+
+    def _save_meta(self, note_id, meta):
+        tmp = self._file(note_id, '.json.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file(note_id, '.json'))  # never a half written note
+
+    def add(self, audio, sample_rate, is_todo=False):
+        """
+        Spools a recorded note, returns right away
+        :param audio: int16 numpy array (mono)
+        :param sample_rate: of the audio
+        :param is_todo: store it as a todo
+        :return: id of the note
+        """
+        note_id = '{}-{}'.format(time.strftime('%Y%m%d-%H%M%S'), uuid.uuid4().hex[:6])
+        tmp = self._file(note_id, '.tmp.npy')
+        np.save(tmp, np.asarray(audio, dtype=np.int16))
+        os.replace(tmp, self._file(note_id, '.npy'))
+        self._save_meta(note_id, {'time': time.time(), 'sample_rate': sample_rate, 'is_todo': is_todo,
+                                  'transcript': None})
+        self.queue.put(note_id)
+        return note_id
+
+    def pending(self):
+        """:return: ids of the notes in the spool, oldest first"""
+        return sorted(f[:-len('.json')] for f in os.listdir(self.path) if f.endswith('.json'))
+
+    def start(self):
+        """starts the background thread and queues the notes left over from the last run"""
+        for note_id in self.pending():
+            self.queue.put(note_id)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            note_id = self.queue.get()
+            try:
+                self._process(note_id)
+            except Exception as e:
+                self.failures[note_id] = self.failures.get(note_id, 0) + 1
+                delay = min(self.retry_interval * 2 ** (self.failures[note_id] - 1), self.max_retry_interval)
+                print('Note {} failed ({}), trying again in {} s'.format(note_id, e, delay))
+                timer = threading.Timer(delay, self.queue.put, args=(note_id, ))
+                timer.daemon = True
+                timer.start()
+            else:
+                self.failures.pop(note_id, None)
+
+    def _process(self, note_id):
+        if not os.path.exists(self._file(note_id, '.json')):  # queued twice and already done
+            return
+        with open(self._file(note_id, '.json')) as f:
+            meta = json.load(f)
+        if meta['transcript'] is None:
+            meta['transcript'] = self.transcribe(np.load(self._file(note_id, '.npy')))
+            self._save_meta(note_id, meta)
+            os.remove(self._file(note_id, '.npy'))
+        if meta['transcript'].strip():
+            self.write(meta['transcript'], meta['is_todo'])
+        else:
+            print('Note {} is empty, dropping it'.format(note_id))
+        os.remove(self._file(note_id, '.json'))
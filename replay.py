@@ -0,0 +1,179 @@
+"""
+Replays recorded utterances (multichannel wav files) through the voice pipeline of blueberry, i.e., the same
+code the assistant runs with the soundcard: hotword detection, listening until you are done, beamforming,
+speech to text and finding the command. Per stage timings are collected and written into a latency report.
+
+Porcupine and speech to text are replaced by stubs unless --porcupine / --stt are given, so it runs on
+any linux box without the seeed card or the model files. The stub stt returns the transcript from a .txt file
+next to the wav (e.g. corpus/lights_01.wav and corpus/lights_01.txt).
+
+    python3 replay.py corpus/*.wav --realtime --report latency.json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+
+from audio_capture import read_wav
+from hardware import WavStream
+from voice import VoicePipeline
+from intents import create_intent_index
+from stt import StubBackend
+import config as cfg
+
+
+class StubPorcupine:
+    """Hotword engine that 'hears' the hotword after a fixed time"""
+    frame_length = 512
+    sample_rate = 16000
+
+    def __init__(self, hotword_at=0.0):
+        """
+        :param hotword_at: seconds into the recording where the hotword is recognized
+        """
+        self.trigger_frame = int(hotword_at * self.sample_rate / self.frame_length)
+        self.frames = 0
+
+    def process(self, pcm):
+        self.frames += 1
+        return self.frames - 1 == self.trigger_frame
+
+    def delete(self):
+        pass
+
+
+class ReplayPipeline(VoicePipeline):
+    """
+    Voice pipeline reading from wav files instead of the soundcard, only finds the command instead of executing it
+    """
+    def __init__(self, porcupine, stt_backends, realtime=False, silence_level=None):
+        self.porcupine = porcupine
+        self.stt_backends = stt_backends
+        self.realtime = realtime
+        self.fixed_silence_level = silence_level
+        self.stage_timer = None
+        self.results = []
+        self.intents = create_intent_index()
+
+    def dispatch(self, word):
+        """
+        :param word: transcribed string
+        :return: name of the command (or activity) that would be executed
+        """
+        intent = self.intents.match(word.split())
+        func_name = intent['command']
+        if func_name is None and intent['activity'] is not None:
+            func_name = 'start_activity({})'.format(intent['activity'])
+        return func_name
+
+    def replay(self, path):
+        """
+        Runs one recorded utterance through the pipeline
+        :param path: of the wav file
+        :return: dict with the transcript, the command and the timings of this utterance
+        """
+        audio, sample_rate = read_wav(path)
+        if sample_rate != self.porcupine.sample_rate:
+            raise ValueError('{} has {} Hz, expected {} Hz'.format(path, sample_rate, self.porcupine.sample_rate))
+        if audio.shape[1] == 1:  # mono recordings on all four channels
+            audio = np.repeat(audio, 4, axis=1)
+        expected = ''
+        if os.path.exists(os.path.splitext(path)[0] + '.txt'):
+            with open(os.path.splitext(path)[0] + '.txt') as f:
+                expected = f.read().strip()
+        for backend in self.stt_backends.values():
+            if isinstance(backend, StubBackend):
+                backend.transcript = expected
+        if isinstance(self.porcupine, StubPorcupine):
+            self.porcupine.frames = 0
+
+        stream = WavStream(audio, sample_rate, realtime=self.realtime)
+        self.setup_audio(stream, self.porcupine, channels=audio.shape[1])
+        if self.stage_timer is None:
+            self.stage_timer = self.timer
+        self.timer = self.stage_timer  # one timer for the whole corpus
+        frames = [audio[i:i + 480] for i in range(0, len(audio) - 479, 480)]
+        self.noise_floor.level = self.fixed_silence_level or max(
+            np.percentile([np.median(np.abs(f)) for f in frames], 10), self.noise_floor.minimum)
+
+        result = {'file': path, 'expected': expected}
+        try:
+            start = time.perf_counter()
+            heard = False
+            while not heard and self.hotword_reader.position < stream.end:
+                heard = self.listen_for_hotword()
+            if not heard:
+                result['error'] = 'hotword not detected'
+                return result
+            self.timer.add('hotword', time.perf_counter() - start)
+            hotword = time.perf_counter()
+            before = {name: len(t) for name, t in self.timer.timings.items()}
+            word = self.listen_and_think()
+            with self.timer.stage('dispatch'):
+                result['command'] = self.dispatch(word)
+            self.timer.add('total', time.perf_counter() - hotword)
+            result['transcript'] = word
+            result['timings'] = {name: t[-1] for name, t in self.timer.timings.items()
+                                 if len(t) > before.get(name, 0)}
+            return result
+        finally:
+            self.capture.stop()
+            self.results.append(result)
+
+    def write_report(self, path):
+        """
+        writes the per stage percentiles and the single utterances into a json file
+        :param path: of the report
+        :return:
+        """
+        with open(path, 'w') as f:
+            json.dump({'mode': 'streaming' if cfg.assistant['stt_streaming'] else 'batch',
+                       'realtime': self.realtime, 'stages': self.timer.summary(),
+                       'stt': {name: b.stats() for name, b in self.stt_backends.items()}, 'utterances': self.results},
+                      f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('wav', nargs='+', help='recorded utterances, 16 kHz, 16 bit, 1 or 4 channels')
+    parser.add_argument('--realtime', action='store_true', help='replay at recording speed instead of full speed')
+    parser.add_argument('--report', help='write the latency report as json into this file')
+    parser.add_argument('--porcupine', action='store_true', help='use porcupine, the wav has to contain the hotword')
+    parser.add_argument('--hotword-at', type=float, default=0.0, help='stub porcupine: hotword after these seconds')
+    parser.add_argument('--stt', action='store_true', help='use the speech to text of the command profile')
+    parser.add_argument('--stub-rtf', type=float, default=0.0, help='stub stt: decoding time / audio length')
+    parser.add_argument('--silence-level', type=float, help='fixed noise floor instead of estimating it per file')
+    args = parser.parse_args()
+
+    if args.porcupine:
+        import pvporcupine
+        porcupine = pvporcupine.create(keywords=['blueberry'], sensitivities=[0.8])
+    else:
+        porcupine = StubPorcupine(args.hotword_at)
+    if args.stt and cfg.assistant['stt_worker']:  # like the assistant, in a separate process
+        from stt_worker import SttWorker
+        worker = SttWorker({'command': cfg.assistant['stt_profiles']['command']},
+                           hot_words=list(create_intent_index().index))
+        worker.start()
+        worker.wait_ready()
+        stt_backends = worker.backends()
+    elif args.stt:
+        from stt import load_profiles
+        profiles = {'command': cfg.assistant['stt_profiles']['command']}
+        stt_backends = load_profiles(profiles, hot_words=list(create_intent_index().index))
+    else:
+        stt_backends = {'command': StubBackend(args.stub_rtf)}
+
+    pipeline = ReplayPipeline(porcupine, stt_backends, realtime=args.realtime, silence_level=args.silence_level)
+    for path in args.wav:
+        result = pipeline.replay(path)
+        print('{}: {} -> {}'.format(path, result.get('transcript'), result.get('command', result.get('error'))))
+    print(pipeline.timer.report())
+    if args.report:
+        pipeline.write_report(args.report)
+        print('report written to {}'.format(args.report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,575 @@
+"""
+Local stand-ins for the hue bridge, the caldav server and the joplin api. They answer the requests blueberry sends
+with generated data of any size and add latency and errors on purpose, so the network clients can be run and
+measured on any machine without the real services, e.g.
+    python3 standins.py --events 5000 --notes 10000 --latency 0.05 --error-rate 0.02
+prints what to put into the config and serves until ctrl-c.
+"""
+import argparse
+import json
+import random
+import re
+import string
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+ROOMS = ('Living room', 'Bedroom', 'Kitchen', 'Office', 'Bathroom', 'Hallway')
+SCENES = ('Bright', 'Relax', 'Concentrate', 'Read', 'Energize', 'Dimmed', 'Nightlight', 'Savanna sunset')
+CALENDARS = ('Scheduled', 'Personal', 'Tracking')  # the config uses index 0 and 2
+ACTIVITIES = ('work', 'sport', 'reading', 'cooking', 'meeting', 'guitar', 'language course', 'cleaning')
+FOLDERS = ('Inbox', '1 Next Actions', 'Someday', 'Projects', 'Reference', 'Shopping', 'Recipes', 'Journal')
+WORDS = ('buy', 'call', 'milk', 'bread', 'doctor', 'appointment', 'idea', 'book', 'train', 'ticket', 'birthday',
+         'present', 'garden', 'bike', 'repair', 'email', 'invoice', 'holiday', 'plan', 'meeting', 'notes', 'recipe',
+         'pasta', 'coffee', 'music', 'guitar', 'lesson', 'running', 'shoes', 'window', 'plants', 'water')
+
+CALDAV = '{urn:ietf:params:xml:ns:caldav}'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive like the real services
+
+    def _handle(self):
+        self.server.standin.handle(self)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_PROPFIND = do_REPORT = _handle
+
+    def log_message(self, format, *args):  # no line per request
+        pass
+
+
+def _json(value, status=200):
+    return status, 'application/json', json.dumps(value).encode()
+
+
+class StandIn:
+    """
+    An http server in a background thread which delays and fails requests on purpose. The subclasses answer the
+    requests (route), every request is counted per endpoint.
+    """
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, stall_rate=0.0, stall=10.0, seed=0):
+        """
+        :param latency: seconds added to every answer
+        :param jitter: up to this many seconds are added at random on top
+        :param error_rate: fraction of the requests answered with 503
+        :param stall_rate: fraction of the requests answered only after stall seconds, e.g. to test timeouts
+        :param stall: seconds
+        :param seed: of the random generator, the same seed gives the same data and the same faults
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall = stall
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {}  # 'GET /groups/{}' -> dict
+        self.server = None
+
+    def start(self, host='127.0.0.1', port=0):
+        """
+        serves in a background thread
+        :param port: 0 picks a free one
+        :return: self
+        """
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.standin = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def address(self):
+        """e.g. http://127.0.0.1:8000"""
+        host, port = self.server.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def handle(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        body = request.rfile.read(length) if length else b''
+        url = urlsplit(request.path)
+        path = unquote(url.path)
+        endpoint = '{} {}'.format(request.command, re.sub(r'/(\d+|[0-9a-f]{32}|[^/]+\.ics)(?=/|$)', '/{}', path))
+        with self.lock:
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            if self.random.random() < self.stall_rate:
+                delay += self.stall
+            failed = self.random.random() < self.error_rate
+        time.sleep(delay)
+        if failed:
+            status, content_type, data = 503, 'text/plain', b'injected error'
+        else:
+            try:
+                status, content_type, data = self.route(request.command, path, parse_qs(url.query), body,
+                                                        request.headers)
+            except Exception as e:  # a bug in the stand-in must not look like a hanging service
+                print('{}: {} failed: {!r}'.format(type(self).__name__, endpoint, e))
+                status, content_type, data = 500, 'text/plain', str(e).encode()
+        try:
+            request.send_response(status)
+            request.send_header('Content-Type', content_type)
+            request.send_header('Content-Length', str(len(data)))
+            request.end_headers()
+            request.wfile.write(data)
+            gone = False
+        except ConnectionError:  # the client gave up waiting, e.g. after a stall
+            request.close_connection = True
+            gone = True
+        with self.lock:
+            counter = self.counters.setdefault(endpoint, {'requests': 0, 'errors': 0, 'gone': 0, 'bytes': 0})
+            counter['requests'] += 1
+            counter['errors'] += status >= 400
+            counter['gone'] += gone
+            counter['bytes'] += 0 if gone else len(data)
+
+    def route(self, method, path, query, body, headers):
+        """
+        :param method: 'GET', 'PUT', ...
+        :param path: unquoted, without the query
+        :param query: dict name -> list of values
+        :param body: bytes
+        :param headers: of the request
+        :return: status, content type and the answer (bytes)
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """:return: dict endpoint -> requests, errors (injected or not), gone (the client didn't wait) and bytes sent"""
+        with self.lock:
+            return {endpoint: dict(counter) for endpoint, counter in self.counters.items()}
+
+
+class HueStandIn(StandIn):
+    """
+    The hue bridge under /api/<user>: the full state, groups, lights and scenes, and putting group actions and
+    light states. Like the bridge it answers bad requests with status 200 and a list of errors.
+    """
+    def __init__(self, rooms=4, lights_per_room=3, scenes_per_room=6, user='standin', **faults):
+        """
+        :param rooms: number of groups of type Room
+        :param lights_per_room: number of lights
+        :param scenes_per_room: number of scenes, the names repeat in every room
+        :param user: the token in the url
+        :param faults: see StandIn
+        """
+        super().__init__(**faults)
+        self.user = user
+        self.groups, self.lights, self.scenes = {}, {}, {}
+        self.scene_states = {}  # scene id -> state of its lights, the bridge doesn't list it with the scenes
+        for room in range(1, rooms + 1):
+            light_ids = []
+            for _ in range(lights_per_room):
+                light_id = str(len(self.lights) + 1)
+                self.lights[light_id] = {'name': 'Light {}'.format(light_id), 'type': 'Extended color light',
+                                         'state': self._light_state()}
+                light_ids.append(light_id)
+            name = ROOMS[(room - 1) % len(ROOMS)] + ('' if room <= len(ROOMS) else ' {}'.format(room))
+            self.groups[str(room)] = {'name': name, 'type': 'Room', 'lights': light_ids,
+                                      'state': {'all_on': False, 'any_on': False}, 'action': self._light_state()}
+            for i in range(scenes_per_room):
+                scene_id = ''.join(self.random.choice(string.ascii_letters + string.digits) for _ in range(15))
+                self.scenes[scene_id] = {'name': SCENES[i % len(SCENES)], 'type': 'GroupScene', 'group': str(room),
+                                         'lights': light_ids, 'recycle': False, 'locked': False}
+                self.scene_states[scene_id] = {'on': True, 'bri': self.random.randint(30, 254),
+                                               'ct': self.random.randint(153, 500)}
+
+    @staticmethod
+    def _light_state():
+        return {'on': False, 'bri': 254, 'ct': 366, 'hue': 8418, 'sat': 140, 'xy': [0.4573, 0.41],
+                'alert': 'none', 'effect': 'none', 'colormode': 'ct', 'reachable': True}
+
+    @property
+    def url(self):
+        """for hue['user'] in the config"""
+        return '{}/api/{}'.format(self.address, self.user)
+
+    def route(self, method, path, query, body, headers):
+        parts = [p for p in path.split('/') if p]
+        if parts[:1] != ['api'] or len(parts) < 2:
+            return 404, 'text/plain', b'not found'
+        if parts[1] != self.user:
+            return _json([{'error': {'type': 1, 'address': '/', 'description': 'unauthorized user'}}])
+        address = '/' + '/'.join(parts[2:])
+        with self.lock:
+            if method == 'GET':
+                return self._get(parts[2:], address)
+            if method == 'PUT':
+                try:
+                    changes = json.loads(body.decode())
+                except ValueError:
+                    return _json([{'error': {'type': 2, 'address': address,
+                                             'description': 'body contains invalid json'}}])
+                return self._put(parts[2:], address, changes)
+        return _json([{'error': {'type': 4, 'address': address,
+                                 'description': 'method, {}, not available for resource, {}'.format(method, address)}}])
+
+    def _get(self, parts, address):
+        if not parts:
+            return _json({'groups': self.groups, 'lights': self.lights, 'scenes': self.scenes,
+                          'config': {'name': 'Stand-in bridge', 'apiversion': '1.41.0'}, 'rules': {},
+                          'schedules': {}, 'sensors': {}, 'resourcelinks': {}})
+        kind = getattr(self, parts[0], None) if parts[0] in ('groups', 'lights', 'scenes') else None
+        if kind is not None and len(parts) == 1:
+            return _json(kind)
+        if kind is not None and len(parts) == 2 and parts[1] in kind:
+            resource = dict(kind[parts[1]])
+            if parts[0] == 'scenes':
+                resource['lightstates'] = {light_id: self.scene_states[parts[1]] for light_id in resource['lights']}
+            return _json(resource)
+        return _json([{'error': {'type': 3, 'address': address,
+                                 'description': 'resource, {}, not available'.format(address)}}])
+
+    def _put(self, parts, address, changes):
+        if len(parts) == 3 and parts[0] == 'groups' and parts[2] == 'action' and \
+                (parts[1] in self.groups or parts[1] == '0'):
+            light_ids = list(self.lights) if parts[1] == '0' else self.groups[parts[1]]['lights']
+            group = self.groups.get(parts[1])
+        elif len(parts) == 3 and parts[0] == 'lights' and parts[2] == 'state' and parts[1] in self.lights:
+            light_ids, group = [parts[1]], None
+        else:
+            return _json([{'error': {'type': 3, 'address': address,
+                                     'description': 'resource, {}, not available'.format(address)}}])
+        state = {key: value for key, value in changes.items() if key not in ('scene', 'transitiontime')}
+        if 'scene' in changes:
+            if changes['scene'] not in self.scene_states:
+                return _json([{'error': {'type': 7, 'address': address + '/scene',
+                                         'description': 'invalid value, {}, for parameter, scene'.format(
+                                             changes['scene'])}}])
+            state = dict(self.scene_states[changes['scene']], **state)
+        for light_id in light_ids:
+            self.lights[light_id]['state'].update(state)
+        for group_id, other in self.groups.items():
+            if group_id == parts[1] or set(other['lights']) & set(light_ids):
+                on = [self.lights[light_id]['state']['on'] for light_id in other['lights']]
+                other['state'] = {'all_on': all(on), 'any_on': any(on)}
+        if group is not None:
+            group['action'].update({key: value for key, value in state.items() if key != 'alert'})
+        return _json([{'success': {'{}/{}'.format(address, key): value}} for key, value in changes.items()])
+
+
+class CalDavStandIn(StandIn):
+    """
+    A caldav server laid out like nextcloud: finding the principal and its calendars (PROPFIND), searching events
+    by date (REPORT with a time-range) and writing, reading and deleting events. Enough for the caldav library
+    (principal, calendars, date_search, save_event), the login is not checked.
+    """
+    def __init__(self, events=5000, days=365, calendars=CALENDARS, user='standin', **faults):
+        """
+        :param events: number of events in every calendar
+        :param days: the events are spread over this many days before and after today
+        :param calendars: display names
+        :param user: in the urls
+        :param faults: see StandIn
+        """
+        super().__init__(**faults)
+        self.root = '/remote.php/dav/'
+        self.principal = '{}principals/users/{}/'.format(self.root, user)
+        self.home = '{}calendars/{}/'.format(self.root, user)
+        self.calendars = {}  # href -> {'name', 'starts', 'events'}, events sorted by start
+        self.longest = timedelta(0)  # to find the events that started before a time range and still go on
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        for name in calendars:
+            href = '{}{}/'.format(self.home, name.lower().replace(' ', '-'))
+            generated = []
+            for i in range(events):
+                start = now + timedelta(minutes=15 * self.random.randint(-days * 96, days * 96))
+                end = start + timedelta(minutes=15 * self.random.randint(1, 12))
+                uid = 'standin-{}-{}'.format(name.lower(), i)
+                generated.append((start, end, uid, self._ics(uid, start, end, self.random.choice(ACTIVITIES))))
+                self.longest = max(self.longest, end - start)
+            generated.sort()
+            self.calendars[href] = {'name': name, 'starts': [event[0] for event in generated], 'events': generated}
+
+    @property
+    def url(self):
+        """for calendar['url'] in the config"""
+        return self.address + self.root.rstrip('/')
+
+    @staticmethod
+    def _ics(uid, start, end, summary):
+        return ('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//blueberry//standins//EN\r\nBEGIN:VEVENT\r\n'
+                'UID:{}\r\nDTSTAMP:{:%Y%m%dT%H%M%SZ}\r\nDTSTART:{:%Y%m%dT%H%M%SZ}\r\nDTEND:{:%Y%m%dT%H%M%SZ}\r\n'
+                'SUMMARY:{}\r\nEND:VEVENT\r\nEND:VCALENDAR\r\n').format(uid, start, start, end, summary)
+
+    @staticmethod
+    def _time(ics, name):
+        """DTSTART or DTEND of the ics as utc, times without Z or TZID are taken as local time"""
+        match = re.search(r'^{}[^:\r\n]*:(\d{{8}})(T(\d{{6}})(Z?))?'.format(name), ics, re.MULTILINE)
+        if match is None:
+            return None
+        value = datetime.strptime(match.group(1) + (match.group(3) or '000000'), '%Y%m%d%H%M%S')
+        return value.replace(tzinfo=timezone.utc) if match.group(4) else value.astimezone(timezone.utc)
+
+    def _store(self, href, uid, start, end, ics):
+        """adds or replaces an event, keeps the events sorted by start"""
+        calendar = self.calendars[href]
+        self._remove(href, uid)
+        i = bisect_left(calendar['starts'], start)
+        calendar['starts'].insert(i, start)
+        calendar['events'].insert(i, (start, end, uid, ics))
+        self.longest = max(self.longest, end - start)
+
+    def _remove(self, href, uid):
+        """:return: True if there was such an event"""
+        calendar = self.calendars[href]
+        for i, event in enumerate(calendar['events']):
+            if event[2] == uid:
+                del calendar['starts'][i], calendar['events'][i]
+                return True
+        return False
+
+    def route(self, method, path, query, body, headers):
+        if not path.endswith('/') and not path.endswith('.ics'):
+            path += '/'
+        href, _, name = path.rpartition('/') if path.endswith('.ics') else (path, '', '')
+        href += '/' if name else ''
+        with self.lock:
+            if method == 'PROPFIND':
+                return self._propfind(path, headers.get('Depth', '0'))
+            if method == 'REPORT' and href in self.calendars and not name:
+                return self._report(href, body)
+            if href in self.calendars and name:
+                uid = name[:-len('.ics')]
+                if method == 'PUT':
+                    ics = body.decode()
+                    start, end = self._time(ics, 'DTSTART'), self._time(ics, 'DTEND')
+                    if start is None:
+                        return 400, 'text/plain', b'no DTSTART'
+                    existed = self._remove(href, uid)
+                    self._store(href, uid, start, end or start, ics)
+                    return 204 if existed else 201, 'text/plain', b''
+                if method == 'DELETE':
+                    return (204 if self._remove(href, uid) else 404), 'text/plain', b''
+                if method == 'GET':
+                    for event in self.calendars[href]['events']:
+                        if event[2] == uid:
+                            return 200, 'text/calendar; charset=utf-8', event[3].encode()
+        return 404, 'text/plain', b'not found'
+
+    @staticmethod
+    def _multistatus(responses):
+        """
+        :param responses: list of (href, xml of the properties)
+        :return: status 207 and the xml
+        """
+        xml = ''.join('<d:response><d:href>{}</d:href><d:propstat><d:prop>{}</d:prop>'
+                      '<d:status>HTTP/1.1 200 OK</d:status></d:propstat></d:response>'.format(escape(href), props)
+                      for href, props in responses)
+        return (207, 'application/xml; charset=utf-8',
+                ('<?xml version="1.0" encoding="utf-8"?><d:multistatus xmlns:d="DAV:" '
+                 'xmlns:cal="urn:ietf:params:xml:ns:caldav">{}</d:multistatus>').format(xml).encode())
+
+    def _propfind(self, path, depth):
+        if path in (self.root, self.principal):
+            props = ('<d:current-user-principal><d:href>{}</d:href></d:current-user-principal>'
+                     '<cal:calendar-home-set><d:href>{}</d:href></cal:calendar-home-set>').format(self.principal,
+                                                                                           self.home)
+            return self._multistatus([(path, props + '<d:resourcetype><d:collection/></d:resourcetype>')])
+        collection = '<d:resourcetype><d:collection/></d:resourcetype>'
+        if path == self.home:
+            responses = [(path, collection)]
+            if depth != '0':
+                responses += [(href, '<d:resourcetype><d:collection/><cal:calendar/></d:resourcetype>'
+                                     '<d:displayname>{}</d:displayname>'.format(escape(calendar['name'])))
+                              for href, calendar in self.calendars.items()]
+            return self._multistatus(responses)
+        if path in self.calendars:
+            responses = [(path, '<d:resourcetype><d:collection/><cal:calendar/></d:resourcetype>'
+                                '<d:displayname>{}</d:displayname>'.format(escape(self.calendars[path]['name'])))]
+            if depth != '0':
+                responses += [('{}{}.ics'.format(path, event[2]), '<d:resourcetype/>')
+                              for event in self.calendars[path]['events']]
+            return self._multistatus(responses)
+        return 404, 'text/plain', b'not found'
+
+    def _report(self, href, body):
+        """calendar-query: the events within the time-range, or all of them without one"""
+        calendar = self.calendars[href]
+        root = ElementTree.fromstring(body) if body else None
+        filters = [] if root is None else root.findall('.//{}comp-filter'.format(CALDAV))
+        if any(f.get('name') not in ('VCALENDAR', 'VEVENT') for f in filters):  # only events here, no todos
+            return self._multistatus([])
+        time_range = None if root is None else root.find('.//{}time-range'.format(CALDAV))
+        if time_range is None:
+            events = calendar['events']
+        else:
+            start = time_range.get('start')
+            end = time_range.get('end')
+            start = datetime.strptime(start, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc) if start else None
+            end = datetime.strptime(end, '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc) if end else None
+            first = 0 if start is None else bisect_left(calendar['starts'], start - self.longest)
+            last = len(calendar['starts']) if end is None else bisect_left(calendar['starts'], end)
+            events = [event for event in calendar['events'][first:last] if start is None or event[1] > start]
+        return self._multistatus([('{}{}.ics'.format(href, uid), '<cal:calendar-data>{}</cal:calendar-data>'.format(
+            escape(ics))) for _, _, uid, ics in events])
+
+
+class JoplinStandIn(StandIn):
+    """
+    The joplin data api: search for notes, folders and tags (query, tag:, * at the end of a word), listing
+    notes and folders and posting notes, with the token. Results come in pages of 'limit' items like in the real
+    api.
+    """
+    def __init__(self, notes=10000, folders=FOLDERS, tags=50, words=40, todo_rate=0.2, token='XXX', **faults):
+        """
+        :param notes: number of notes
+        :param folders: titles of the notebooks
+        :param tags: number of tags, every note has up to three
+        :param words: length of the body of a note
+        :param todo_rate: fraction of the notes which are todos
+        :param token: the api token
+        :param faults: see StandIn
+        """
+        super().__init__(**faults)
+        self.token = token
+        self.folders = {}  # id -> dict
+        self.tags = {}
+        self.notes = {}
+        self.words = {}  # note id -> set of the lower case words of title and body
+        self.note_tags = {}  # note id -> set of tag ids
+        for title in folders:
+            self.folders[self._id()] = {'title': title, 'parent_id': ''}
+        for i in range(tags):
+            self.tags[self._id()] = {'title': '{}{}'.format(WORDS[i % len(WORDS)], '' if i < len(WORDS) else i)}
+        folder_ids, tag_ids = list(self.folders), list(self.tags)
+        for _ in range(notes):
+            note_id = self._add_note(' '.join(self.random.choice(WORDS) for _ in range(3)).capitalize(),
+                                     ' '.join(self.random.choice(WORDS) for _ in range(words)),
+                                     self.random.choice(folder_ids), self.random.random() < todo_rate)
+            self.note_tags[note_id] = set(self.random.sample(tag_ids, min(self.random.randint(0, 3), len(tag_ids))))
+
+    def _id(self):
+        return '{:032x}'.format(self.random.getrandbits(128))
+
+    def _add_note(self, title, body, parent_id, is_todo):
+        note_id = self._id()
+        now = int(time.time() * 1000)
+        self.notes[note_id] = {'id': note_id, 'title': title, 'body': body, 'parent_id': parent_id,
+                               'is_todo': int(bool(is_todo)), 'todo_completed': 0, 'created_time': now,
+                               'updated_time': now}
+        self.words[note_id] = set(re.findall(r'\w+', '{} {}'.format(title, body).lower()))
+        self.note_tags[note_id] = set()
+        return note_id
+
+    @property
+    def url(self):
+        """for joplin['url'] in the config"""
+        return self.address + '/'
+
+    def route(self, method, path, query, body, headers):
+        parts = [p for p in path.split('/') if p]
+        if parts == ['ping']:
+            return 200, 'text/plain', b'JoplinClipperServer'
+        if query.get('token', [None])[0] != self.token:
+            return _json({'error': 'Invalid "token" parameter'}, 403)
+        fields = [f.strip() for f in query.get('fields', ['id,parent_id,title'])[0].split(',')]
+        page = int(query.get('page', ['1'])[0])
+        limit = min(int(query.get('limit', ['10'])[0]), 100)
+        with self.lock:
+            if method == 'GET' and parts == ['search']:
+                kind = query.get('type', ['note'])[0]
+                items = self._search(query.get('query', [''])[0].lower(), kind)
+                return self._page(items, fields, page, limit)
+            if method == 'GET' and len(parts) == 1 and parts[0] in ('notes', 'folders', 'tags'):
+                items = getattr(self, parts[0])
+                return self._page([dict(item, id=i) for i, item in items.items()], fields, page, limit)
+            if method == 'GET' and len(parts) == 2 and parts[0] == 'notes' and parts[1] in self.notes:
+                return _json({f: self.notes[parts[1]].get(f) for f in fields})
+            if method == 'POST' and parts == ['notes']:
+                try:
+                    note = json.loads(body.decode())
+                except ValueError:
+                    return _json({'error': 'invalid json'}, 400)
+                note_id = self._add_note(note.get('title', ''), note.get('body', ''), note.get('parent_id') or
+                                         next(iter(self.folders)), note.get('is_todo', False))
+                return _json(self.notes[note_id])
+        return _json({'error': 'Not found'}, 404)
+
+    @staticmethod
+    def _matches(term, words):
+        if term.endswith('*'):
+            return any(word.startswith(term[:-1]) for word in words)
+        return term in words
+
+    def _search(self, query, kind):
+        """
+        :param query: lower case, all words must match, 'tag:name' finds the notes with that tag
+        :param kind: 'note', 'folder' or 'tag'
+        :return: list of items
+        """
+        terms = query.split()
+        if kind in ('folder', 'tag'):
+            items = self.folders if kind == 'folder' else self.tags
+            return [dict(item, id=i) for i, item in items.items()
+                    if all(self._matches(term, set(item['title'].lower().split())) for term in terms)]
+        tags = [term[len('tag:'):] for term in terms if term.startswith('tag:')]
+        words = [term for term in terms if not term.startswith('tag:')]
+        tag_ids = [{i for i, tag in self.tags.items() if self._matches(name, {tag['title'].lower()})}
+                   for name in tags]
+        return [note for note_id, note in self.notes.items()
+                if all(self.note_tags[note_id] & ids for ids in tag_ids)
+                and all(self._matches(word, self.words[note_id]) for word in words) and (tags or words)]
+
+    @staticmethod
+    def _page(items, fields, page, limit):
+        chosen = items[(page - 1) * limit:page * limit]
+        return _json({'items': [{f: item.get(f) for f in fields} for item in chosen],
+                      'has_more': page * limit < len(items)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--hue-port', type=int, default=8000, help='0: no hue bridge')
+    parser.add_argument('--caldav-port', type=int, default=8001, help='0: no caldav server')
+    parser.add_argument('--joplin-port', type=int, default=41184, help='0: no joplin api')
+    parser.add_argument('--rooms', type=int, default=4, help='hue groups, each with 3 lights and 6 scenes')
+    parser.add_argument('--events', type=int, default=5000, help='events in each of the three calendars')
+    parser.add_argument('--notes', type=int, default=10000)
+    parser.add_argument('--token', default='XXX', help='joplin api token')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every answer')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds added at random')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--stall-rate', type=float, default=0.0, help='fraction of requests answered very late')
+    parser.add_argument('--stall', type=float, default=10.0, help='seconds a stalled request takes')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    faults = {'latency': args.latency, 'jitter': args.jitter, 'error_rate': args.error_rate,
+              'stall_rate': args.stall_rate, 'stall': args.stall, 'seed': args.seed}
+    standins = []
+    if args.hue_port:
+        hue = HueStandIn(rooms=args.rooms, **faults).start(args.host, args.hue_port)
+        print("hue = {{'user': r'{}', ...}}".format(hue.url))
+        standins.append(hue)
+    if args.caldav_port:
+        caldav = CalDavStandIn(events=args.events, **faults).start(args.host, args.caldav_port)
+        print("calendar = {{'url': r'{}', ...}}".format(caldav.url))
+        standins.append(caldav)
+    if args.joplin_port:
+        joplin = JoplinStandIn(notes=args.notes, token=args.token, **faults).start(args.host, args.joplin_port)
+        print("joplin = {{'url': r'{}', 'token': '{}', ...}}".format(joplin.url, args.token))
+        standins.append(joplin)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    for standin in standins:
+        standin.stop()
+        for endpoint, counter in sorted(standin.stats().items()):
+            print('{:14} {:40} {requests:7} requests {errors:6} errors {gone:6} gone {bytes:11} bytes'.format(
+                type(standin).__name__, endpoint, **counter))
+
+
+if __name__ == "__main__":
+    main()
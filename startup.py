@@ -0,0 +1,117 @@
+import threading
+import time
+import traceback
+
+
+class StartupStep:
+    def __init__(self, name, func, depends):
+        self.name = name
+        self.func = func
+        self.depends = depends
+        self.status = 'waiting'  # -> running -> done / failed / skipped
+        self.start = None
+        self.end = None
+        self.error = None
+        self.finished = threading.Event()
+
+
+class StartupGraph:
+    """
+    The startup of blueberry as a graph of steps with their dependencies. Every step runs in its own thread as
+    soon as the steps it depends on are done, so the independent ones (e.g. loading deepspeech and connecting
+    to the hue bridge) run at the same time. If a step fails, the steps depending on it are skipped.
+    """
+    def __init__(self, on_change=None):
+        """
+        :param on_change: function called with the graph whenever a step changes its status
+        """
+        self.steps = {}
+        self.on_change = on_change
+        self.start_time = None
+        self.lock = threading.Lock()
+
+    def add(self, name, func, depends=()):
+        """
+        Adds a step
+        :param name: of the step
+        :param func: function without arguments doing the work
+        :param depends: names of the steps, which have to be done before
+        :return:
+        """
+        for d in depends:
+            if d not in self.steps:
+                raise ValueError('step {} depends on unknown step {}'.format(name, d))
+        self.steps[name] = StartupStep(name, func, tuple(depends))
+
+    def start(self):
+        """starts all steps, returns right away"""
+        self.start_time = time.time()
+        for step in self.steps.values():
+            threading.Thread(target=self._run_step, args=(step, ), daemon=True).start()
+
+    def _run_step(self, step):
+        for d in step.depends:
+            self.steps[d].finished.wait()
+        failed = [d for d in step.depends if self.steps[d].status != 'done']
+        if failed:
+            self._set_status(step, 'skipped', error='{} not available'.format(', '.join(failed)))
+            return
+        step.start = time.time()
+        self._set_status(step, 'running')
+        try:
+            step.func()
+        except Exception as e:
+            traceback.print_exc()
+            step.end = time.time()
+            self._set_status(step, 'failed', error=str(e))
+        else:
+            step.end = time.time()
+            self._set_status(step, 'done')
+
+    def _set_status(self, step, status, error=None):
+        with self.lock:
+            step.status = status
+            step.error = error
+            if status in ('done', 'failed', 'skipped'):
+                step.finished.set()
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def wait(self, name, timeout=None):
+        """
+        Waits for a step to finish
+        :param name: of the step
+        :param timeout: in seconds, None waits forever
+        :return: True if the step is done successfully
+        """
+        step = self.steps[name]
+        step.finished.wait(timeout)
+        return step.status == 'done'
+
+    def ready(self, name):
+        """:return: True if the step is done successfully, without waiting"""
+        return self.steps[name].status == 'done'
+
+    def done(self):
+        """:return: True if all steps are done successfully, without waiting"""
+        with self.lock:
+            return all(step.status == 'done' for step in self.steps.values())
+
+    def timeline(self):
+        """
+        :return: printable table with start time, duration and status of every step
+        """
+        now = time.time()
+        lines = []
+        with self.lock:
+            for step in self.steps.values():
+                if step.start is None:
+                    line = '{:12s} {:>7s} {:>7s}  {}'.format(step.name, '', '', step.status)
+                else:
+                    took = (step.end or now) - step.start
+                    line = '{:12s} {:6.1f}s {:6.1f}s  {}'.format(step.name, step.start - self.start_time, took,
+                                                                step.status)
+                if step.error:
+                    line += ' ({})'.format(step.error)
+                lines.append(line)
+        return '\n'.join(lines)
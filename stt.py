@@ -0,0 +1,310 @@
+"""
+Speech to text engines behind one interface, so blueberry is not bound to deepspeech. Every backend transcribes
+either a whole recording (stt) or while you are still talking (create_stream) and keeps track of its load time,
+real time factor and memory.
+
+There is one backend per decoder profile: commands are decoded with a small scorer built from the command words
+(see build_scorer.py), a narrow beam and boosted hot words, notes with the full english scorer. The deepspeech
+profiles share one acoustic model, only the decoder settings are switched.
+"""
+import json
+import os
+import threading
+import time
+import resource
+import config as cfg
+
+
+def rss():
+    """:return: resident memory of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):  # no procfs, the peak has to do
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SttStream:
+    """Transcription while the audio is still coming in, times the engine like SttBackend.stt"""
+    def __init__(self, backend, stream):
+        self.backend = backend
+        self.stream = stream
+        self.samples = 0
+        self.decode_time = 0
+
+    def feed_audio(self, audio):
+        """
+        :param audio: int16 numpy array (mono)
+        :return:
+        """
+        start = time.perf_counter()
+        self.stream.feed(audio)
+        self.decode_time += time.perf_counter() - start
+        self.samples += len(audio)
+
+    def finish(self):
+        """:return: the transcribed text"""
+        start = time.perf_counter()
+        text = self.stream.finish()
+        self.backend.add_decoding(self.samples, self.decode_time + time.perf_counter() - start)
+        return text
+
+
+class SttBackend:
+    """
+    Base class of the speech to text engines. Subclasses load the model in __init__ (wrapped by load()) and
+    implement _stt(audio) and _create_stream(), the latter returns an object with feed(audio) and finish().
+    """
+    name = None
+    sample_rate = 16000
+
+    def __init__(self):
+        self.load_time = 0
+        self.memory = 0  # MB the model takes
+        self.decoded_samples = 0
+        self.decode_time = 0
+
+    def load(self, func):
+        """
+        Runs the loading of the model and measures its time and memory
+        :param func: function without arguments, loading the model
+        :return: what func returns
+        """
+        memory, start = rss(), time.perf_counter()
+        result = func()
+        self.load_time = time.perf_counter() - start
+        self.memory = rss() - memory
+        return result
+
+    def stt(self, audio):
+        """
+        Transcribes a whole recording
+        :param audio: int16 numpy array (mono)
+        :return: the transcribed text
+        """
+        start = time.perf_counter()
+        text = self._stt(audio)
+        self.add_decoding(len(audio), time.perf_counter() - start)
+        return text
+
+    def create_stream(self):
+        """:return: SttStream, feed it the audio while you are talking"""
+        return SttStream(self, self._create_stream())
+
+    def add_decoding(self, samples, seconds):
+        self.decoded_samples += samples
+        self.decode_time += seconds
+
+    @property
+    def rtf(self):
+        """real time factor, decoding time / audio length over everything decoded so far"""
+        if self.decoded_samples == 0:
+            return None
+        return self.decode_time / (self.decoded_samples / self.sample_rate)
+
+    def stats(self):
+        """:return: dict with load time, memory and real time factor"""
+        return {'engine': self.name, 'load_time': self.load_time, 'memory': self.memory, 'rtf': self.rtf}
+
+    def _stt(self, audio):
+        raise NotImplementedError
+
+    def _create_stream(self):
+        raise NotImplementedError
+
+
+class _DeepSpeechStream:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def feed(self, audio):
+        self.stream.feedAudioContent(audio)
+
+    def finish(self):
+        return self.stream.finishStream()
+
+
+class _SharedDeepSpeechModel:
+    """
+    One deepspeech model for all profiles, the acoustic model is the large part of the memory. The scorer, beam
+    width and hot words of a profile are set before one of its streams is created, a stream keeps the decoder
+    settings it has been created with. They are only switched if the profile changes, the scorer is memory mapped,
+    so loading it again is cheap after the first time.
+    """
+    models = {}  # path -> _SharedDeepSpeechModel
+    models_lock = threading.Lock()
+
+    def __init__(self, path):
+        import deepspeech as ds
+        self.model = ds.Model(path)
+        self.default_beam_width = self.model.beamWidth()
+        self.lock = threading.Lock()
+        self.settings = None  # of the profile the decoder is set up for
+
+    @classmethod
+    def get(cls, path):
+        """:return: the shared model of the path, loads it on first use"""
+        with cls.models_lock:
+            if path not in cls.models:
+                cls.models[path] = cls(path)
+            return cls.models[path]
+
+    def create_stream(self, settings):
+        """
+        :param settings: (scorer, beam_width, alpha, beta, ((hot word, boost), ...)) of the profile
+        :return: deepspeech stream
+        """
+        with self.lock:
+            if settings != self.settings:
+                scorer, beam_width, alpha, beta, hot_words = settings
+                self.model.setBeamWidth(beam_width or self.default_beam_width)
+                self.model.enableExternalScorer(scorer)  # resets alpha and beta to the defaults of the scorer
+                if alpha is not None and beta is not None:
+                    self.model.setScorerAlphaBeta(alpha, beta)
+                self.model.clearHotWords()
+                for word, boost in hot_words:
+                    self.model.addHotWord(word, boost)
+                self.settings = settings
+            return self.model.createStream()
+
+
+class DeepSpeechBackend(SttBackend):
+    """mozilla deepspeech 0.9, the reference. The profiles share one model, see _SharedDeepSpeechModel"""
+    name = 'deepspeech'
+
+    def __init__(self, model=None, scorer=None, beam_width=None, alpha=None, beta=None, hot_words=(),
+                 hot_word_boost=0):
+        """
+        :param model: path of the acoustic model (.tflite or .pbmm), default: the deepspeech_model of the config,
+            loaded once for all profiles
+        :param scorer: path of the scorer (language model), None: the deepspeech_scorer of the config. If it has
+            not been built yet, the one of the config is used as well
+        :param beam_width: of the decoder, None keeps the default of the model
+        :param alpha: language model weight, None keeps the default of the scorer
+        :param beta: word insertion weight, None keeps the default of the scorer
+        :param hot_words: words whose probability is boosted
+        :param hot_word_boost: how much, 0 switches it off
+        """
+        SttBackend.__init__(self)
+        if scorer is None:
+            scorer = cfg.assistant['deepspeech_scorer']
+        elif not os.path.exists(scorer):
+            print('Scorer {} not found, using the full one (run build_scorer.py)'.format(scorer))
+            scorer = cfg.assistant['deepspeech_scorer']
+        self.settings = (scorer, beam_width, alpha, beta,
+                         tuple((word, hot_word_boost) for word in hot_words) if hot_word_boost else ())
+        # the memory is only counted for the first profile, the others share its model
+        self.shared = self.load(lambda: _SharedDeepSpeechModel.get(model or cfg.assistant['deepspeech_model']))
+        self.sample_rate = self.shared.model.sampleRate()
+
+    def _stt(self, audio):
+        stream = self._create_stream()
+        stream.feed(audio)
+        return stream.finish()
+
+    def _create_stream(self):
+        return _DeepSpeechStream(self.shared.create_stream(self.settings))
+
+
+class _VoskStream:
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+
+    def feed(self, audio):
+        self.recognizer.AcceptWaveform(audio.tobytes())
+
+    def finish(self):
+        return json.loads(self.recognizer.FinalResult())['text']
+
+
+class VoskBackend(SttBackend):
+    """kaldi based vosk (pip install vosk), the small english model fits on the pi"""
+    name = 'vosk'
+
+    def __init__(self, model=None, hot_words=(), hot_word_boost=0, **kwargs):
+        """
+        :param model: path of the model directory, default: the vosk_model of the config
+        :param hot_words: with hot_word_boost, the recognizer is restricted to these words (and [unk])
+        :param hot_word_boost: anything but 0 restricts the vocabulary to the hot words
+        :param kwargs: options of other engines, ignored
+        """
+        SttBackend.__init__(self)
+        import vosk
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = self.load(lambda: vosk.Model(model or cfg.assistant['vosk_model']))
+        self.grammar = json.dumps(list(hot_words) + ['[unk]']) if hot_word_boost and hot_words else None
+
+    def _recognizer(self):
+        if self.grammar is None:
+            return self.vosk.KaldiRecognizer(self.model, self.sample_rate)
+        return self.vosk.KaldiRecognizer(self.model, self.sample_rate, self.grammar)
+
+    def _stt(self, audio):
+        stream = self._create_stream()
+        stream.feed(audio)
+        return stream.finish()
+
+    def _create_stream(self):
+        return _VoskStream(self._recognizer())
+
+
+class _StubStream:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def feed(self, audio):
+        time.sleep(len(audio) / self.backend.sample_rate * self.backend.stub_rtf)
+
+    def finish(self):
+        return self.backend.transcript
+
+
+class StubBackend(SttBackend):
+    """
+    Returns the expected transcript, for the replay harness. It takes stub_rtf times the audio length to 'decode'
+    to simulate the cost of a real engine.
+    """
+    name = 'stub'
+
+    def __init__(self, stub_rtf=0.0, transcript='', **kwargs):
+        SttBackend.__init__(self)
+        self.stub_rtf = stub_rtf
+        self.transcript = transcript
+
+    def _stt(self, audio):
+        time.sleep(len(audio) / self.sample_rate * self.stub_rtf)
+        return self.transcript
+
+    def _create_stream(self):
+        return _StubStream(self)
+
+
+BACKENDS = {'deepspeech': DeepSpeechBackend, 'vosk': VoskBackend, 'stub': StubBackend}
+
+
+def create_backend(engine='deepspeech', **options):
+    """
+    :param engine: name of the engine, see BACKENDS
+    :param options: of the engine, e.g. scorer and beam_width for deepspeech
+    :return: SttBackend
+    :raises ImportError: if the engine is not installed
+    """
+    if engine not in BACKENDS:
+        raise ValueError('unknown speech to text engine {}, choose from {}'.format(engine, ', '.join(BACKENDS)))
+    return BACKENDS[engine](**options)
+
+
+def load_profiles(profiles, hot_words=()):
+    """
+    Loads one backend for every decoder profile
+    :param profiles: dict profile name -> dict with the engine and its options, like cfg.assistant['stt_profiles']
+    :param hot_words: words to boost in the profiles with a hot_word_boost
+    :return: dict profile name -> SttBackend
+    """
+    backends = {}
+    for name, profile in profiles.items():
+        backends[name] = create_backend(hot_words=hot_words, **profile)
+        print('{} speech to text ({}) loaded in {:.1f} s, {:.0f} MB'.format(
+            name, backends[name].name, backends[name].load_time, backends[name].memory))
+    return backends
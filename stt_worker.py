@@ -0,0 +1,331 @@
+"""
+Runs the speech to text in its own process, which keeps the models loaded. Decoding takes seconds of pure cpu
+and, in the assistant's thread, competes with the led animations, the scheduler and the gui for the interpreter.
+In the worker it doesn't, and if the native library crashes, only the worker dies and is started again.
+
+The audio is not pickled but written into a ring buffer in shared memory, only the positions are sent through
+the pipe. The results come back as futures.
+"""
+import multiprocessing as mp
+import threading
+import time
+import traceback
+from concurrent.futures import Future, TimeoutError
+import numpy as np
+
+from stt import SttBackend, load_profiles
+
+
+def _read_ring(ring, start, n):
+    """copies n samples from the ring buffer, starting at the absolute position start"""
+    capacity = len(ring)
+    start %= capacity
+    if start + n <= capacity:
+        return ring[start:start + n].copy()
+    return np.concatenate((ring[start:], ring[:start + n - capacity]))
+
+
+def _worker_main(conn, audio, consumed, busy, profiles, hot_words):
+    """the worker process: loads the backends and decodes what the pipe asks for"""
+    ring = np.frombuffer(audio, dtype=np.int16)
+    fed = {}  # stream id -> samples
+    try:
+        backends = load_profiles(profiles, hot_words=hot_words)
+    except Exception as e:
+        traceback.print_exc()
+        conn.send(('failed', str(e)))
+        return
+    conn.send(('ready', {name: b.stats() for name, b in backends.items()}))
+    streams = {}
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:  # the assistant is gone
+            return
+        command, stream_id = message[0], message[1] if len(message) > 1 else None
+        try:
+            if command == 'open':
+                streams[stream_id] = backends[message[2]].create_stream()
+                fed[stream_id] = 0
+            elif command == 'feed':
+                start, n = message[2:]
+                fed[stream_id] += n
+                busy[:] = [time.monotonic(), n]  # the engines decode while they are fed
+                streams[stream_id].feed_audio(_read_ring(ring, start, n))
+                consumed.value = start + n
+            elif command == 'finish':
+                busy[:] = [time.monotonic(), fed.pop(stream_id)]
+                conn.send(('result', stream_id, streams.pop(stream_id).finish(), None))
+            elif command == 'stop':
+                return
+        except Exception as e:
+            traceback.print_exc()
+            streams.pop(stream_id, None)
+            fed.pop(stream_id, None)
+            conn.send(('result', stream_id, None, '{}: {}'.format(type(e).__name__, e)))
+        busy[0] = 0
+
+
+class SttWorker:
+    """
+    The speech to text worker process, one backend per decoder profile like stt.load_profiles. backends()
+    returns stand-ins with the interface of SttBackend, the pipeline uses them like the local ones.
+    """
+    def __init__(self, profiles, hot_words=(), buffer_seconds=70, sample_rate=16000, timeout=60, min_backoff=1,
+                 max_backoff=300):
+        """
+        :param profiles: dict profile name -> engine and its options, like cfg.assistant['stt_profiles']
+        :param hot_words: words to boost in the profiles with a hot_word_boost
+        :param buffer_seconds: length of the shared ring buffer, the assistant waits if the worker lags behind more
+        :param sample_rate: of the audio
+        :param timeout: seconds one feed or finish may take on top of twice the length of its audio, and seconds
+            the worker may do nothing while a transcript is awaited, then it hangs and is restarted. Waiting
+            for other streams, e.g. a long note, doesn't count.
+        :param min_backoff: seconds before restarting a crashed worker, doubled for every crash in a row
+        :param max_backoff: maximum seconds before a restart
+        """
+        self.profiles = profiles
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.hot_words = list(hot_words)
+        self.sample_rate = sample_rate
+        self.context = mp.get_context('spawn')  # no forking of the qt and audio threads
+        self.audio = self.context.RawArray('h', int(buffer_seconds * sample_rate))
+        self.ring = np.frombuffer(self.audio, dtype=np.int16)
+        self.consumed = self.context.RawValue('q', 0)
+        self.busy = self.context.RawArray('d', 2)  # time.monotonic() since the worker decodes (0: idle), samples
+        self.written = 0
+        self.lock = threading.RLock()
+        self.feed_lock = threading.Lock()  # the note spool and the command stream feed at the same time
+        self.pending = {}  # stream id -> Future of the transcript
+        self.next_id = 0
+        self.stats = {}
+        self.ready = threading.Event()
+        self.error = None
+        self.restarts = 0
+        self.crashes = 0  # in a row, without a transcript in between
+        self.stopped = False
+        self.process = None
+        self.conn = None
+
+    def start(self):
+        """starts the worker process and the thread receiving the results, returns right away"""
+        with self.lock:
+            self.ready.clear()
+            self.error = None
+            self.written = 0
+            self.consumed.value = 0
+            self.busy[0] = 0
+            self.conn, child_conn = self.context.Pipe()
+            self.process = self.context.Process(target=_worker_main, daemon=True, name='stt worker',
+                                                args=(child_conn, self.audio, self.consumed, self.busy, self.profiles,
+                                                      self.hot_words))
+            self.process.start()
+            child_conn.close()
+            threading.Thread(target=self._receive, args=(self.conn, self.process), daemon=True).start()
+
+    def wait_ready(self, timeout=None):
+        """
+        Waits until the models are loaded
+        :param timeout: in seconds
+        :return: True if the worker is ready
+        """
+        self.ready.wait(timeout)
+        if self.error is not None:
+            raise RuntimeError('stt worker failed to start: {}'.format(self.error))
+        return self.ready.is_set()
+
+    def _receive(self, conn, process):
+        while True:
+            try:
+                if not conn.poll(0.5):
+                    if process.is_alive():
+                        continue
+                    raise EOFError
+                message = conn.recv()
+            except (EOFError, OSError):
+                self._crashed(process)
+                return
+            if message[0] == 'ready':
+                self.stats = message[1]
+                self.ready.set()
+            elif message[0] == 'failed':
+                self.error = message[1]
+                self.stopped = True
+                self.ready.set()
+            elif message[0] == 'result':
+                _, stream_id, text, error = message
+                with self.lock:
+                    self.crashes = 0
+                    future = self.pending.pop(stream_id, None)
+                if future is None:
+                    continue
+                if error is None:
+                    future.set_result(text)
+                else:
+                    future.set_exception(RuntimeError(error))
+
+    def _crashed(self, process):
+        with self.lock:
+            if process is not self.process:  # already restarted
+                return
+            process.join(1)
+            self._fail_pending('stt worker died (exit code {})'.format(process.exitcode))
+            if self.stopped:
+                return
+            self.crashes += 1
+            backoff = min(self.min_backoff * 2 ** (self.crashes - 1), self.max_backoff)
+            print('stt worker died (exit code {}), restarting in {} s'.format(process.exitcode, backoff))
+        time.sleep(backoff)  # a worker crashing on every start is not restarted in a tight loop
+        with self.lock:
+            if self.stopped or process is not self.process:
+                return
+            self.restarts += 1
+            self.start()
+
+    def _fail_pending(self, error):
+        """all waiting transcripts get a RuntimeError"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError(error))
+
+    def _send(self, *message):
+        with self.lock:
+            if self.stopped:
+                raise RuntimeError('stt worker is not running')
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError) as e:  # the worker died, the receiving thread restarts it
+                self._fail_pending('stt worker died: {}'.format(e))
+                raise RuntimeError('stt worker died: {}'.format(e))
+
+    def result(self, stream_id, future):
+        """
+        Waits for the transcript. If the worker hangs (see timeout), it is restarted
+        :param stream_id: of open()
+        :param future: of open()
+        :return: the transcript
+        :raises RuntimeError: if the worker died or hung
+        """
+        idle_since = time.monotonic()
+        while True:
+            try:
+                return future.result(1)
+            except TimeoutError:
+                pass
+            now = time.monotonic()
+            since, samples = self.busy[:]
+            if since:
+                idle_since = now
+                hung = now - since > self.timeout + 2 * samples / self.sample_rate
+            else:  # our audio is sent, the worker has something to do
+                hung = now - idle_since > self.timeout
+            if hung:
+                print('stt worker hangs, restarting it')
+                self.busy[0] = 0
+                idle_since = now
+                self.process.terminate()  # the receiving thread notices, fails the transcripts and restarts it
+
+    def open(self, profile):
+        """
+        :param profile: decoder profile
+        :return: stream id and the future of its transcript
+        """
+        with self.lock:
+            stream_id, self.next_id = self.next_id, self.next_id + 1
+            future = Future()
+            self.pending[stream_id] = future
+            self._send('open', stream_id, profile)
+        return stream_id, future
+
+    def feed(self, stream_id, audio):
+        """
+        copies the audio into the shared ring buffer and tells the worker where it is
+        :param stream_id: of open()
+        :param audio: int16 numpy array (mono)
+        :return:
+        """
+        capacity = len(self.ring)
+        for i in range(0, len(audio), capacity // 2):
+            chunk = audio[i:i + capacity // 2]
+            with self.feed_lock:  # checking for space and writing must not be split by another feed
+                process = self.process
+                while self.written + len(chunk) - self.consumed.value > capacity:  # the worker lags behind
+                    if process is not self.process or not process.is_alive():
+                        raise RuntimeError('stt worker died')
+                    time.sleep(0.01)
+                with self.lock:
+                    start = self.written % capacity
+                    first = min(len(chunk), capacity - start)
+                    self.ring[start:start + first] = chunk[:first]
+                    self.ring[:len(chunk) - first] = chunk[first:]
+                    self._send('feed', stream_id, self.written, len(chunk))
+                    self.written += len(chunk)
+
+    def finish(self, stream_id):
+        """tells the worker that the audio is complete, the future of open() gets the transcript"""
+        self._send('finish', stream_id)
+
+    def backends(self):
+        """:return: dict profile name -> WorkerBackend"""
+        return {name: WorkerBackend(self, name) for name in self.profiles}
+
+    def stop(self):
+        """stops the worker process"""
+        if self.process is None:
+            return
+        with self.lock:
+            self.stopped = True
+            try:
+                self.conn.send(('stop', ))
+            except (OSError, ValueError):
+                pass
+        self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class _WorkerStream:
+    def __init__(self, worker, profile):
+        self.worker = worker
+        self.stream_id, self.future = worker.open(profile)
+
+    def feed(self, audio):
+        self.worker.feed(self.stream_id, audio)
+
+    def finish(self):
+        self.worker.finish(self.stream_id)
+        return self.worker.result(self.stream_id, self.future)
+
+
+class WorkerBackend(SttBackend):
+    """SttBackend running in the worker process, load time and memory are the ones reported by the worker"""
+    def __init__(self, worker, profile):
+        SttBackend.__init__(self)
+        self.worker = worker
+        self.profile = profile
+        stats = worker.stats.get(profile, {})
+        self.name = '{} (worker)'.format(stats.get('engine'))
+        self.load_time = stats.get('load_time', 0)
+        self.memory = stats.get('memory', 0)
+        self.sample_rate = worker.sample_rate
+
+    def stt_async(self, audio):
+        """
+        :param audio: int16 numpy array (mono)
+        :return: Future of the transcript
+        """
+        stream = _WorkerStream(self.worker, self.profile)
+        stream.feed(audio)
+        self.worker.finish(stream.stream_id)
+        return stream.future
+
+    def _stt(self, audio):
+        stream = _WorkerStream(self.worker, self.profile)
+        stream.feed(audio)
+        return stream.finish()
+
+    def _create_stream(self):
+        return _WorkerStream(self.worker, self.profile)
@@ -1,38 +1,110 @@
 import numpy as np
-from smbus2 import SMBus  # This package does the i2c communication
-from time import sleep
 import struct as st
+import threading
+import time
+
+import hardware  # smbus2 does the i2c communication
 
 address = 0x76
 REG_DATA = 0xF7
 REG_CONTROL = 0xF4
+REG_CONTROL_HUM = 0xF2
+REG_CONFIG = 0xF5
 REG_CAL_T = 0x88
 REG_CAL_H = 0xE1
 REG_CAL_P = 0x8E
 
+MODE_NORMAL = 3
+# register codes of the settings
+OVERSAMPLING = {0: 0, 1: 1, 2: 2, 4: 3, 8: 4, 16: 5}  # 0: measurement skipped
+IIR_FILTER = {0: 0, 2: 1, 4: 2, 8: 3, 16: 4}  # 0: off
+STANDBY_MS = {0.5: 0, 62.5: 1, 125: 2, 250: 3, 500: 4, 1000: 5, 10: 6, 20: 7}
+
+
+def raw_values(data):
+    """
+    :param data: 8 bytes of the data register
+    :return: raw temperature, pressure and humidity (int, int, int)
+    """
+    temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
+    pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
+    hum_raw = (data[6] << 8) + data[7]
+    return temp_raw, pres_raw, hum_raw
+
+
+def compensate(temp_raw, pres_raw, hum_raw, calibration):
+    """
+    Converts the raw values to temperature, humdity and, pressure. Works on single values and on numpy arrays,
+    e.g. to process a whole history again. No explanations given in the data sheet. It's basically copy and past
+    :param temp_raw: raw temperature (int or int array)
+    :param pres_raw: raw pressure
+    :param hum_raw: raw humidity
+    :param calibration: dict with the calibration values 'T' (3), 'P' (9) and 'H' (6), see Thermometer.calibration
+    :return: temperature, humidity, pressure (float or float arrays)
+    """
+    temp_raw, pres_raw, hum_raw = (np.asarray(v, dtype=np.int64) for v in (temp_raw, pres_raw, hum_raw))
+    dig_T1, dig_T2, dig_T3 = calibration['T']
+    dig_P = [0] + list(calibration['P'])
+    dig_H1, dig_H2, dig_H3, dig_H4, dig_H5, dig_H6 = calibration['H']
+    var1 = (((temp_raw >> 3)-(dig_T1 << 1)) * dig_T2) >> 11
+    var2 = (((((temp_raw >> 4) - dig_T1) * ((temp_raw >> 4) - dig_T1)) >> 12) * dig_T3) >> 14
+    t_fine = var1+var2
+    temperature = (((t_fine * 5) + 128) >> 8) / 100
+
+    humidity = t_fine - 76800.0
+    humidity = (hum_raw - (dig_H4 * 64.0 + dig_H5 / 16384.0 * humidity)) * (dig_H2 / 65536.0 * (1.0 + dig_H6 / 67108864.0 * humidity * (1.0 + dig_H3 / 67108864.0 * humidity)))
+    humidity = humidity * (1.0 - dig_H1 * humidity / 524288.0)
+
+    var1 = t_fine / 2.0 - 64000.0
+    var2 = var1 * var1 * dig_P[6] / 32768.0
+    var2 = var2 + var1 * dig_P[5] * 2.0
+    var2 = var2 / 4.0 + dig_P[4] * 65536.0
+    var1 = (dig_P[3] * var1 * var1 / 524288.0 + dig_P[2] * var1) / 524288.0
+    var1 = (1.0 + var1 / 32768.0) * dig_P[1]
+
+    pressure = 1048576.0 - pres_raw
+    pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
+    var1 = dig_P[9] * pressure * pressure / 2147483648.0
+    var2 = pressure * dig_P[8] / 32768.0
+    pressure = (pressure + (var1 + var2 + dig_P[7]) / 16.0)/100
+
+    return temperature, humidity, pressure
+
 
 class Thermometer:
     """
-    Class to communicate with the SMB280 temperature sensor. Extracts the temperature and also shows the
-    temperature on the LEDs of the SEEED 4 mic array. The latter function may be moved later.
+    Class to communicate with the SMB280 temperature sensor. Extracts the temperature, the LEDs of the SEEED
+    4 mic array show it via LedHelper.show_temperature.
+
+    The sensor runs in normal mode, i.e., it measures on its own every standby_ms. A background thread keeps the
+    bus open, reads the data registers every interval seconds and publishes the compensated values. Everyone else
+    gets the latest reading from get_temperature without touching the bus.
     """
-    def __init__(self):
+    def __init__(self, oversample_temp=1, oversample_pres=1, oversample_hum=1, iir_filter=0, standby_ms=1000,
+                 interval=10, good_temp=22, history=None):
         """
         In the init routine we get the calibration data for the conversion of ADC values to temperature.
         We have to shift the bytes to get the correct values, which are stored on the chip.
-        Also, we calculate the register value for the forced mode with an oversampling of 1. This means we have to start
-        the measurement manually.
+        Then the sensor is configured and the first reading is taken, the background thread is started by start().
+        :param oversample_temp: oversampling of the temperature, 0 (skipped), 1, 2, 4, 8 or 16
+        :param oversample_pres: of the pressure
+        :param oversample_hum: of the humidity
+        :param iir_filter: coefficient of the sensor's iir filter against short fluctuations, 0 (off), 2, 4, 8 or 16
+        :param standby_ms: pause of the sensor between two measurements, 0.5, 10, 20, 62.5, 125, 250, 500 or 1000
+        :param interval: seconds between two readings of the background thread
+        :param good_temp: the temperature you feel well at
+        :param history: AirHistory, which gets every reading
         """
-        with SMBus(1) as bus:
-            cal_data_T = bus.read_i2c_block_data(address, REG_CAL_T, 6)
-            cal_data_H0 = bus.read_i2c_block_data(address, 0xA1, 1)
-            cal_data_H = bus.read_i2c_block_data(address, REG_CAL_H, 7)
-            cal_data_P = bus.read_i2c_block_data(address, REG_CAL_P, 18)
+        self.bus = hardware.open_smbus(1)
+        cal_data_T = self.bus.read_i2c_block_data(address, REG_CAL_T, 6)
+        cal_data_H0 = self.bus.read_i2c_block_data(address, 0xA1, 1)
+        cal_data_H = self.bus.read_i2c_block_data(address, REG_CAL_H, 7)
+        cal_data_P = self.bus.read_i2c_block_data(address, REG_CAL_P, 18)
 
         self.dig_T1 = (cal_data_T[1] << 8) + cal_data_T[0]
         self.dig_T2 = (cal_data_T[3] << 8) + cal_data_T[2]
         self.dig_T3 = (cal_data_T[5] << 8) + cal_data_T[4]
-        
+
         self.dig_P = [0]
         for i in np.arange(0,18,2):
             if i == 0:
@@ -46,80 +118,92 @@ class Thermometer:
         self.dig_H4 = st.unpack('h', st.pack('H', (cal_data_H[3] << 4) + (cal_data_H[4] & 15)))[0]
         self.dig_H5 = st.unpack('h', st.pack('H', (cal_data_H[4] >> 4 & 0x0F) | (cal_data_H[5] << 4)))[0]
         self.dig_H6 = st.unpack('b', st.pack('B', cal_data_H[6]))[0]
-        
-        self.oversample_temp = 1
-        self.oversample_pres = 1
-        self.mode = 1
-        # need to shift the bits for the control reg
-        self.control = self.oversample_temp << 5 | self.oversample_pres << 2 | self.mode
-        self.good_temp=22
 
-    def get_temperature(self):
+        # need to shift the bits for the control and config regs
+        self.control_hum = OVERSAMPLING[oversample_hum]
+        self.control = OVERSAMPLING[oversample_temp] << 5 | OVERSAMPLING[oversample_pres] << 2 | MODE_NORMAL
+        self.config = STANDBY_MS[standby_ms] << 5 | IIR_FILTER[iir_filter] << 2
+        # maximum time of one measurement from the data sheet in s
+        self.measurement_time = (1.25 + 2.3 * oversample_temp + (2.3 * oversample_pres + 0.575) * bool(oversample_pres)
+                                 + (2.3 * oversample_hum + 0.575) * bool(oversample_hum)) / 1000
+        self.interval = interval
+        self.good_temp = good_temp
+        self.history = history
+        self.readings = 0
+        self.errors = 0
+        self.read_time = 0
+        self.running = False
+        self.thread = None
+
+        # ctrl_hum only takes effect with the next write of ctrl_meas, config only while sleeping
+        self.bus.write_byte_data(address, REG_CONTROL, 0)
+        self.bus.write_byte_data(address, REG_CONFIG, self.config)
+        self.bus.write_byte_data(address, REG_CONTROL_HUM, self.control_hum)
+        self.bus.write_byte_data(address, REG_CONTROL, self.control)
+        time.sleep(self.measurement_time)
+        self.latest = None  # (temperature, humidity, pressure, time)
+        if history is not None:
+            history.set_calibration(self.calibration())
+        self.sample()
+
+    def start(self):
+        """starts the background thread reading the sensor every interval seconds"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """stops the thread, puts the sensor to sleep and closes the bus"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(self.interval + 1)
+        self.bus.write_byte_data(address, REG_CONTROL, 0)
+        self.bus.close()
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except Exception as e:  # e.g. a loose cable or a bad reading, try again next time
+                self.errors += 1
+                print('Cannot read the thermometer: {}'.format(e))
+
+    def sample(self):
         """
-        Here we get the temperature, humdity and, pressure, by writing into the control register and then by asking the data from the
-        data register. After that we have to convert the data to temperature. No explanations given in the data
-        sheet. It's basically copy and past
+        Reads the data registers (in one burst, so all values belong to the same measurement) and publishes
+        the compensated values
         :return: temperature, humidity, pressure (float, float, float)
         """
-        with SMBus(1) as bus:
-            bus.write_byte_data(address, REG_CONTROL, self.control)
-            sleep(0.5)
-            data = bus.read_i2c_block_data(address, REG_DATA, 8)
-        temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
-        pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
-        hum_raw = (data[6] << 8) + data[7]
-        var1 = (((temp_raw >> 3)-(self.dig_T1 << 1)) * self.dig_T2) >> 11
-        var2 = (((((temp_raw >> 4) - self.dig_T1) * ((temp_raw >> 4) - self.dig_T1)) >> 12) * self.dig_T3) >> 14
-        t_fine = var1+var2
-        temperature = float(((t_fine * 5) + 128) >> 8)/100
-        
-        humidity = t_fine - 76800.0
-        humidity = (hum_raw - (self.dig_H4 * 64.0 + self.dig_H5 / 16384.0 * humidity)) * (self.dig_H2 / 65536.0 * (1.0 + self.dig_H6 / 67108864.0 * humidity * (1.0 + self.dig_H3 / 67108864.0 * humidity)))
-        humidity = humidity * (1.0 - self.dig_H1 * humidity / 524288.0)
-            
-        var1 = t_fine / 2.0 - 64000.0
-        var2 = var1 * var1 * self.dig_P[6] / 32768.0
-        var2 = var2 + var1 * self.dig_P[5] * 2.0
-        var2 = var2 / 4.0 + self.dig_P[4] * 65536.0
-        var1 = (self.dig_P[3] * var1 * var1 / 524288.0 + self.dig_P[2] * var1) / 524288.0
-        var1 = (1.0 + var1 / 32768.0) * self.dig_P[1]
-
-        pressure = 1048576.0 - pres_raw
-        pressure = ((pressure - var2 / 4096.0) * 6250.0) / var1
-        var1 = self.dig_P[9] * pressure * pressure / 2147483648.0
-        var2 = pressure * self.dig_P[8] / 32768.0
-        pressure = (pressure + (var1 + var2 + self.dig_P[7]) / 16.0)/100
-        
+        start = time.perf_counter()
+        data = self.bus.read_i2c_block_data(address, REG_DATA, 8)
+        self.read_time += time.perf_counter() - start
+        self.readings += 1
+        raw = raw_values(data)
+        temperature, humidity, pressure = (float(v) for v in compensate(*raw, self.calibration()))
+        now = time.time()
+        self.latest = temperature, humidity, pressure, now  # one assignment, never half updated
+        if self.history is not None:
+            self.history.append(now, raw, (temperature, humidity, pressure))
         return temperature, humidity, pressure
 
-    # ToDo: move to led_helper and pass temperature
-    def show_temperature(self, leds, value=64, leds_num=(9, 10, 11, 0)):
+    def get_temperature(self):
         """
-        Converts the measured temperature into the LED colorcode. At good temp all 4 leds shine green.
-        If it's colder the LEDs change to blue, one for each degree. If it's warmer, they change to red.
-        :param leds: the led object to be controlled
-        :param value: brightness of the LED
-        :param leds_num: The led number on the LED stripe
-        :return:
+        The latest reading of the background thread, no i2c involved
+        :return: temperature, humidity, pressure (float, float, float)
         """
-        temp, _, _ = self.get_temperature()
-        difference = int(np.rint(temp - self.good_temp))
-        if difference > 4:
-            difference = 4
-        if difference < -4:
-            difference = -4
-
-        if difference < 0:
-            for i in np.arange(difference * (-1)):
-                leds.set_pixel(leds_num[i], 0, 0, value, bright_percent=0.1)
-            for i in np.arange(difference * (-1), 4):
-                leds.set_pixel(leds_num[i], 0, value, 0, bright_percent=0.1)
-        elif difference > 0:
-            for i in np.arange(4 - difference):
-                leds.set_pixel(leds_num[i], 0, value, 0, bright_percent=0.1)
-            for i in np.arange(4 - difference, 4):
-                leds.set_pixel(leds_num[i], value, 0, 0, bright_percent=0.1)
-        else:
-            for i in np.arange(4):
-                leds.set_pixel(leds_num[i], 0, value, 0, bright_percent=0.1)
-        leds.show()
+        return self.latest[:3]
+
+    def age(self):
+        """:return: seconds since the latest reading"""
+        return time.time() - self.latest[3]
+
+    def calibration(self):
+        """:return: dict with the calibration values of the sensor, see compensate"""
+        return {'T': [self.dig_T1, self.dig_T2, self.dig_T3], 'P': self.dig_P[1:],
+                'H': [self.dig_H1, self.dig_H2, self.dig_H3, self.dig_H4, self.dig_H5, self.dig_H6]}
+
+    def stats(self):
+        """:return: dict with the number of readings, failed ones, the mean time a reading takes and its age"""
+        return {'readings': self.readings, 'errors': self.errors,
+                'mean_read_time': self.read_time / max(self.readings, 1), 'age': self.age()}
@@ -0,0 +1,149 @@
+import numpy as np
+
+try:
+    import webrtcvad  # optional, pip install webrtcvad
+except ImportError:
+    webrtcvad = None
+
+
+class EnergyVad:
+    """
+    Simplest voice activity detector: a frame is speech if its median amplitude is above the silence level
+    plus a margin. Same criterion as blueberry always used, but for 10-30 ms frames instead of whole seconds.
+    """
+    def __init__(self, margin=20, **kwargs):
+        self.margin = margin
+
+    def is_speech(self, frame, silence_level):
+        """
+        :param frame: int16 array (n, channels) or (n,)
+        :param silence_level: current noise floor
+        :return: bool
+        """
+        return np.median(np.abs(frame)) > silence_level + self.margin
+
+
+class WebRtcVad:
+    """
+    Voice activity detector of the WebRTC project, more robust against noise than the energy. Only works with
+    frames of 10, 20 or 30 ms at 8, 16, 32 or 48 kHz.
+    """
+    def __init__(self, aggressiveness=2, sample_rate=16000, **kwargs):
+        if webrtcvad is None:
+            raise ImportError('webrtcvad is not installed, use the energy vad or pip install webrtcvad')
+        self.vad = webrtcvad.Vad(aggressiveness)
+        self.sample_rate = sample_rate
+
+    def is_speech(self, frame, silence_level):
+        if frame.ndim > 1:
+            frame = frame[:, 0]
+        return self.vad.is_speech(np.ascontiguousarray(frame).tobytes(), self.sample_rate)
+
+
+VADS = {'energy': EnergyVad, 'webrtc': WebRtcVad}
+
+
+def create_vad(engine='energy', **kwargs):
+    """
+    Creates the voice activity detector by name
+    :param engine: one of VADS
+    :param kwargs: passed on to the detector
+    :return: vad object with is_speech(frame, silence_level)
+    """
+    return VADS[engine](**kwargs)
+
+
+class Endpointer:
+    """
+    Decides frame by frame when you have finished talking. Waits for speech to start (start_timeout), then stops
+    once there has been no speech for the hangover time or the utterance has reached max_length.
+    """
+    def __init__(self, vad, frame_length, sample_rate=16000, hangover=0.6, max_length=10, start_timeout=3):
+        """
+        :param vad: voice activity detector
+        :param frame_length: samples per frame
+        :param sample_rate: in Hz
+        :param hangover: seconds of silence after speech until the recording stops
+        :param max_length: maximum length of the recording in seconds
+        :param start_timeout: seconds to wait for speech to start
+        """
+        self.vad = vad
+        self.frame_length = frame_length
+        self.hangover_frames = int(np.ceil(hangover * sample_rate / frame_length))
+        self.max_frames = int(max_length * sample_rate / frame_length)
+        self.start_frames = int(start_timeout * sample_rate / frame_length)
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.speech_started = False
+        self.last_speech = -1  # index of the last frame with speech
+
+    def process(self, frame, silence_level):
+        """
+        :param frame: int16 array (frame_length, channels)
+        :param silence_level: current noise floor
+        :return: True as long as the recording should go on
+        """
+        if self.vad.is_speech(frame, silence_level):
+            self.speech_started = True
+            self.last_speech = self.frames
+        self.frames += 1
+        if self.frames >= self.max_frames:
+            return False
+        if not self.speech_started:
+            return self.frames < self.start_frames
+        return self.frames - 1 - self.last_speech < self.hangover_frames
+
+    @property
+    def speech_end(self):
+        """number of samples until the end of the last speech frame"""
+        return (self.last_speech + 1) * self.frame_length
+
+
+def create_endpointer(config, profile, sample_rate=16000):
+    """
+    Creates the endpointer for a profile of the vad config
+    :param config: vad config dict (cfg.vad)
+    :param profile: 'command' or 'dictation'
+    :param sample_rate: in Hz
+    :return: Endpointer
+    """
+    frame_length = int(config['frame_ms'] * sample_rate / 1000)
+    vad = create_vad(config['engine'], margin=config['margin'], sample_rate=sample_rate)
+    return Endpointer(vad, frame_length, sample_rate, **config['profiles'][profile])
+
+
+class NoiseFloorTracker:
+    """
+    Keeps the silence level up to date from the frames the hotword detection reads anyway, so the mic never has
+    to be paused for a measurement. The level of every frame (median amplitude) goes into a ring of the last
+    seconds and the noise floor is a low percentile of it, speech is too short and sparse to pull it up.
+    """
+    def __init__(self, frame_length, sample_rate=16000, window=10, percentile=20, update_interval=1, minimum=60):
+        """
+        :param frame_length: samples per frame
+        :param sample_rate: in Hz
+        :param window: seconds of frame levels to look at
+        :param percentile: of the frame levels that is taken as noise floor
+        :param update_interval: seconds between the percentile calculations
+        :param minimum: lowest silence level, there seem to be some fluctuations, better be safe
+        """
+        self.levels = np.zeros(max(int(window * sample_rate / frame_length), 1), dtype=np.float32)
+        self.update_frames = max(int(update_interval * sample_rate / frame_length), 1)
+        self.percentile = percentile
+        self.minimum = minimum
+        self.count = 0
+        self.level = minimum
+
+    def update(self, frame):
+        """
+        :param frame: int16 array (frame_length, channels)
+        :return: current silence level
+        """
+        self.levels[self.count % len(self.levels)] = np.median(np.abs(frame))
+        self.count += 1
+        if self.count % self.update_frames == 0:
+            filled = self.levels[:min(self.count, len(self.levels))]
+            self.level = max(float(np.percentile(filled, self.percentile)), self.minimum)
+        return self.level
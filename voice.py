@@ -0,0 +1,230 @@
+import time
+import contextlib
+from collections import defaultdict
+import numpy as np
+
+from audio_capture import AudioCapture
+from beamforming import Beamformer
+from hotword import HotwordDetector
+from vad import create_endpointer, NoiseFloorTracker
+import config as cfg
+
+
+class StageTimer:
+    """
+    Collects the durations of the stages of the voice pipeline (hotword, listen, beamform, stt, dispatch),
+    to see where the time goes between you saying something and blueberry doing it.
+    """
+    def __init__(self):
+        self.timings = defaultdict(list)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager timing everything inside
+        :param name: of the stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name].append(time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        """adds a duration measured somewhere else"""
+        self.timings[name].append(seconds)
+
+    def summary(self):
+        """
+        :return: dict stage -> dict with count, p50, p95 and max in seconds
+        """
+        return {name: {'count': len(t), 'p50': float(np.percentile(t, 50)), 'p95': float(np.percentile(t, 95)),
+                       'max': float(np.max(t))} for name, t in self.timings.items() if t}
+
+    def report(self):
+        """:return: the summary as a printable table"""
+        lines = ['{:10s} {:>6s} {:>9s} {:>9s} {:>9s}'.format('stage', 'count', 'p50 [s]', 'p95 [s]', 'max [s]')]
+        for name, s in self.summary().items():
+            lines.append('{:10s} {:6d} {:9.3f} {:9.3f} {:9.3f}'.format(name, s['count'], s['p50'], s['p95'],
+                                                                       s['max']))
+        return '\n'.join(lines)
+
+
+class VoicePipeline:
+    """
+    Everything between the microphone and the transcript: hotword detection, recording until you are done,
+    beamforming and speech to text. The Assistant uses it with the soundcard, the replay harness with wav files,
+    both go through the same code.
+    """
+    def setup_audio(self, stream, porcupine, channels=4):
+        """
+        Starts capturing the stream and prepares the hotword detection
+        :param stream: input stream with read(n, exception_on_overflow), e.g. pyaudio
+        :param porcupine: hotword engine with frame_length, sample_rate and process(pcm)
+        :param channels: number of channels of the stream
+        :return:
+        """
+        self.porcupine = porcupine
+        self.timer = StageTimer()
+        self.hotword_time = time.time()
+        self.latencies = {'batch': [], 'streaming': []}  # (hotword to transcript, end of speech to transcript)
+        # the only one reading the stream, everyone else gets the audio from the ring buffer
+        self.capture = AudioCapture(stream, porcupine.frame_length, channels=channels,
+                                    sample_rate=porcupine.sample_rate, seconds=cfg.assistant['capture_seconds'])
+        self.capture.start()
+        self.hotword_reader = self.capture.reader()
+        self.hotword = HotwordDetector(porcupine, self.hotword_reader)
+        self.beamformer = Beamformer(sample_rate=porcupine.sample_rate)
+        # the silence level follows the background noise, fed by the frames of the hotword detection
+        self.noise_floor = NoiseFloorTracker(porcupine.frame_length, porcupine.sample_rate,
+                                             **cfg.assistant['noise_floor'])
+
+    @property
+    def silence_level(self):
+        """
+        The background noise, which acts as the baseline for when to stop listening after speech has been finished
+        """
+        return self.noise_floor.level
+
+    def listen_for_hotword(self):
+        """
+        Listens in the background for the hotword from porcupine, if it has been recognized, recording (listen for
+        speech) will be started (in the run function) and transcribed
+        :return: True, if hotword has been heard, else False
+        """
+        frame = self.hotword_reader.read(self.porcupine.frame_length)
+        if frame is None:  # capture stopped
+            return False
+        self.noise_floor.update(frame)
+        result = self.hotword.process(frame)
+        if result:
+            self.hotword_time = time.time()
+        return result
+
+    def listen_for_speech(self, profile='command', stream=None):
+        """
+        Records the spoken word frame by frame until the voice activity detection says you are done
+        :param profile: vad profile, 'command' or 'dictation' (notes may have longer pauses)
+        :param stream: SttStream, if given every frame is beamformed and fed to it right away
+        :return: the (beamformed) audio data as numpy array, None if the capture stopped before anything was recorded
+        """
+        endpointer = create_endpointer(cfg.vad, profile, sample_rate=self.porcupine.sample_rate)
+        # starts right where the hotword detection stopped, nothing spoken in between gets lost
+        reader = self.capture.reader(position=self.hotword_reader.position)
+        lag_frames = int(cfg.vad['lag_estimation_length'] * self.porcupine.sample_rate / endpointer.frame_length)
+        chunks = []
+        beam = None
+        beamforming = 0  # seconds, added up over the frames to one 'beamform' timing per utterance as in batch mode
+        recording = True
+        while recording:
+            frame = reader.read(endpointer.frame_length)
+            if frame is None:  # the capture stopped (shutting down or restarting), keep what was said so far
+                print('capture stopped while listening')
+                break
+            recording = endpointer.process(frame, self.silence_level)
+            chunks.append(frame.T.copy())  # shape (4, n)
+            if stream is None:
+                continue
+            if beam is None and (len(chunks) >= lag_frames or not recording):
+                beam, seconds = self._start_beam(chunks, stream)
+                beamforming += seconds
+            elif beam is not None:
+                start = time.perf_counter()
+                chunks[-1] = beam.process(chunks[-1])
+                beamforming += time.perf_counter() - start
+                stream.feed_audio(chunks[-1])
+        if not chunks:
+            return None
+        if stream is not None and beam is None:  # stopped before there were enough frames to estimate the lags
+            beam, seconds = self._start_beam(chunks, stream)
+            beamforming += seconds
+        self.hotword_reader.skip_to_latest()  # don't search the command itself for the hotword
+        trailing = (endpointer.frames * endpointer.frame_length - endpointer.speech_end) / self.porcupine.sample_rate
+        print('finished_listening, {:.2f} s after the end of speech'.format(trailing))
+        if stream is not None:
+            self.timer.add('beamform', beamforming)
+            return np.concatenate(chunks)
+
+        # no need to transcribe the silence at the end
+        end = endpointer.speech_end + int(cfg.vad['end_padding'] * self.porcupine.sample_rate)
+        with self.timer.stage('beamform'):
+            return self.beamformer.align(np.concatenate(chunks, axis=1)[:, :end])
+
+    def _start_beam(self, chunks, stream):
+        """
+        estimates the delays between the mics from the recorded chunks, beamforms them in place and feeds them to
+        the stream, the delays don't change while you speak, so the first frames are enough
+        :return: the beamformer stream for the following chunks, seconds spent beamforming (without feeding)
+        """
+        start = time.perf_counter()
+        beam = self.beamformer.stream(self.beamformer.estimate_lags(np.concatenate(chunks, axis=1)))
+        seconds = time.perf_counter() - start
+        for i, chunk in enumerate(chunks):
+            start = time.perf_counter()
+            chunks[i] = beam.process(chunk)
+            seconds += time.perf_counter() - start
+            stream.feed_audio(chunks[i])
+        return beam, seconds
+
+    def listen_and_think(self, rgb=None, profile='command'):
+        """
+        calls the listen function first and then transribes the data with the speech to text backend.
+        In streaming mode the audio is already decoded while you are still talking and only the
+        final flush is left once you are done.
+        :param rgb: Tuple (RGB) of the color for the LEDs to blink with
+        :param profile: vad and decoder profile, 'command' or 'dictation'
+        :return: the transcribed text as a string
+        """
+        streaming = cfg.assistant['stt_streaming']
+        backend = self.stt_backend(profile)
+        self.show_listening(rgb)
+        with self.timer.stage('listen'):
+            if streaming:
+                stream = backend.create_stream()
+                audio = self.listen_for_speech(profile=profile, stream=stream)
+            else:
+                audio = self.listen_for_speech(profile=profile)
+        if audio is None:  # the capture stopped, nothing to transcribe
+            if streaming:
+                stream.finish()
+            return ''
+        speech_end_time = time.time()
+        with self.thinking(), self.timer.stage('stt'):
+            if streaming:
+                word = stream.finish()
+            else:
+                word = backend.stt(audio)
+        self.report_latency('streaming' if streaming else 'batch', speech_end_time)
+        return word
+
+    def stt_backend(self, profile):
+        """
+        :param profile: decoder profile
+        :return: the speech to text backend of the profile, the one of the command profile if there is none
+        """
+        return self.stt_backends.get(profile, self.stt_backends['command'])
+
+    def show_listening(self, rgb=None):
+        """called when the recording starts, e.g., to switch on the LEDs"""
+
+    def thinking(self):
+        """context manager around the transcription, e.g., to let the LEDs blink"""
+        return contextlib.nullcontext()
+
+    def report_latency(self, mode, speech_end_time):
+        """
+        Keeps how long it took from the hotword and from the end of your speech to the transcript, the averages
+        are kept per mode to compare streaming with batch decoding. Printed only with print_stats
+        :param mode: 'streaming' or 'batch'
+        :param speech_end_time: time.time() when listening stopped
+        :return:
+        """
+        now = time.time()
+        total, decode = now - self.hotword_time, now - speech_end_time
+        self.latencies[mode].append((total, decode))
+        if not cfg.assistant['print_stats']:
+            return
+        mean_total, mean_decode = np.mean(self.latencies[mode], axis=0)
+        print('{} stt: hotword to transcript {:.2f} s, end of speech to transcript {:.2f} s '
+              '(mean over {}: {:.2f} s, {:.2f} s)'.format(mode, total, decode, len(self.latencies[mode]),
+                                                       mean_total, mean_decode))